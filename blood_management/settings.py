@@ -25,6 +25,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -62,6 +63,33 @@ DATABASES = {
     }
 }
 
+# Cache: in-process LRU by default (also used by tests). Set CACHE_URL to
+# redis://host:6379/0 (needs the `redis` package) or file:///var/tmp/bm-cache
+# to share cached responses between workers.
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif CACHE_URL.startswith('file://'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': CACHE_URL[len('file://'):]}}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'blood-management',
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 5000))},
+        }
+    }
+# Seconds a cached API response may be served (see core.caching)
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 300))
+# Cache-Control on those responses: browsers (max-age) and proxies (s-maxage)
+# may reuse them this many seconds before revalidating with the ETag
+API_CACHE_MAX_AGE = int(os.environ.get('API_CACHE_MAX_AGE', 0))
+API_CACHE_SHARED_MAX_AGE = int(os.environ.get('API_CACHE_SHARED_MAX_AGE', 0))
+
+# Fan-out for /api/events/ (see core.events); the default only reaches streams
+# served by the same process
+EVENTS_BROKER = os.environ.get('EVENTS_BROKER', 'core.events.LocalBroker')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -94,9 +122,27 @@ EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
 EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'false').lower() in ('true', '1')
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'no-reply@example.com')
 
+# Outbox notifier (manage.py run_notifier)
+NOTIFY_BCC_BATCH_SIZE = int(os.environ.get('NOTIFY_BCC_BATCH_SIZE', 50))
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get('NOTIFY_MAX_ATTEMPTS', 5))
+NOTIFY_RETRY_BASE_SECONDS = int(os.environ.get('NOTIFY_RETRY_BASE_SECONDS', 30))
+
+# Metrics (/api/metrics/): token a scraper can pass as ?token=; requests slower than
+# METRICS_SLOW_REQUEST_MS are logged with their SQL (unset to disable)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_SLOW_REQUEST_MS = float(os.environ['METRICS_SLOW_REQUEST_MS']) if os.environ.get('METRICS_SLOW_REQUEST_MS') else None
+
+# Bulk import (manage.py import_data): processes hashing passwords; 0 = one per CPU
+IMPORT_HASH_WORKERS = int(os.environ.get('IMPORT_HASH_WORKERS', 0))
+
 # Media files (for profile photos)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Serve MEDIA_URL from Django even without DEBUG (see core.media); otherwise
+# leave it to the web server or object storage
+SERVE_MEDIA = os.environ.get('SERVE_MEDIA', '') in ('1', 'true', 'True')
+# Threads decoding donor photos into thumbnails (see core.photos)
+PHOTO_WORKERS = int(os.environ.get('PHOTO_WORKERS', 2))
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
@@ -104,12 +150,14 @@ AUTH_USER_MODEL = 'core.User'
 # DRF + SimpleJWT settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.StatelessJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
 from datetime import timedelta
@@ -119,7 +167,10 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'core.authentication.RoleTokenObtainPairSerializer',
 }
+# Seconds a process reuses a user row loaded for a token (see core.authentication)
+AUTH_USER_CACHE_SECONDS = int(os.environ.get('AUTH_USER_CACHE_SECONDS', 30))
 
 # Allow CORS for development. For production, configure specific origins.
 CORS_ALLOW_ALL_ORIGINS = True
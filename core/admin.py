@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, DonorProfile, BloodBank, BloodRequest, Donation
+from .models import User, DonorProfile, BloodAllocation, BloodBank, BloodInventory, BloodRequest, Donation, InventoryLot, OutboxMessage
 
 
 @admin.register(User)
@@ -12,19 +12,43 @@ class UserAdmin(BaseUserAdmin):
 
 @admin.register(DonorProfile)
 class DonorProfileAdmin(admin.ModelAdmin):
-    list_display = ('user', 'blood_group', 'city', 'available')
+    list_display = ('user', 'blood_group', 'city', 'available', 'next_eligible_on')
+
+
+class BloodInventoryInline(admin.TabularInline):
+    model = BloodInventory
+    extra = 0
+
+
+@admin.register(InventoryLot)
+class InventoryLotAdmin(admin.ModelAdmin):
+    list_display = ('id', 'bank', 'blood_group', 'units', 'collected_on', 'expires_on', 'expired')
+    list_filter = ('expired', 'blood_group')
 
 
 @admin.register(BloodBank)
 class BloodBankAdmin(admin.ModelAdmin):
     list_display = ('name', 'city')
+    inlines = (BloodInventoryInline,)
+
+
+class BloodAllocationInline(admin.TabularInline):
+    model = BloodAllocation
+    extra = 0
 
 
 @admin.register(BloodRequest)
 class BloodRequestAdmin(admin.ModelAdmin):
     list_display = ('id', 'requester', 'blood_group', 'units', 'status', 'created_at')
+    inlines = (BloodAllocationInline,)
 
 
 @admin.register(Donation)
 class DonationAdmin(admin.ModelAdmin):
     list_display = ('id', 'donor', 'blood_group', 'units', 'approved', 'created_at')
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'audience', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
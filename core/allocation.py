@@ -0,0 +1,140 @@
+"""Approving blood requests against bank stock.
+
+Safe under concurrent approvals from several workers:
+
+* the request is claimed with ``UPDATE ... WHERE status = 'pending'``, so each
+  request is fulfilled at most once and repeating an approval is a no-op;
+* stock is taken with ``UPDATE ... WHERE units >= n`` and the affected-row count
+  is checked, so two approvals can never oversell a bank;
+* stock that expires first is used first: within a blood group, banks are
+  tried in order of their soonest-expiring lot (see ``InventoryLot``), and
+  within a bank lots are consumed soonest-expiry first;
+* when one bank cannot cover a request it is split across banks, then across
+  compatible blood groups;
+* every stock row a request may draw from is locked up front with one query
+  in primary-key order, the order ``inventory`` locks rows in for batch
+  approvals and the expiry sweep, so transactions that lock several rows do
+  not deadlock each other.
+
+Call these functions inside ``transaction.atomic()``; on ``InsufficientStock``
+the caller must roll back so partially taken units are returned.
+"""
+import datetime
+from collections import Counter
+
+from . import caching, compatibility, events, inventory, stats
+from .models import BloodAllocation, BloodInventory, BloodRequest
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+def transition(blood_request, from_status, to_status):
+    """Move ``blood_request`` between statuses if nobody else already has.
+
+    Returns ``False`` when the request was not in ``from_status``. The status
+    counters are updated here because ``QuerySet.update()`` sends no signals.
+    """
+    changed = BloodRequest.objects.filter(pk=blood_request.pk, status=from_status).update(status=to_status)
+    if not changed:
+        return False
+    deltas = stats.request_counters(blood_request.units, to_status)
+    deltas.subtract(stats.request_counters(blood_request.units, from_status))
+    stats.apply_deltas(deltas)
+    caching.invalidate('stats')
+    blood_request.status = to_status
+    events.request_changed(blood_request, f'request.{to_status}')
+    return True
+
+
+def _current_units(row_pk):
+    return BloodInventory.objects.filter(pk=row_pk).values_list('units', flat=True).first() or 0
+
+
+def _take_group(rows, blood_group, units):
+    """Take up to ``units`` from ``rows`` of one group; returns ``{bank_id: units}``.
+
+    ``rows`` are ``(row_pk, bank_id, available)`` in order of preference.
+    """
+    # prefer a single bank so the request is not split needlessly
+    for row_pk, bank_id, available in rows:
+        if available >= units and inventory.take_from(row_pk, bank_id, blood_group, units):
+            return {bank_id: units}
+
+    # choose the rows in order of preference, then take from them in key order
+    remaining = units
+    chosen = []
+    for row in rows:
+        if remaining <= 0:
+            break
+        if row[2] > 0:
+            chosen.append(row)
+            remaining -= row[2]
+    remaining = units
+    taken = Counter()
+    # the other rows only come into play when races emptied the chosen ones
+    for batch in (sorted(chosen), sorted(set(rows) - set(chosen))):
+        for row_pk, bank_id, available in batch:
+            while remaining and available > 0:
+                amount = min(available, remaining)
+                if inventory.take_from(row_pk, bank_id, blood_group, amount):
+                    taken[bank_id] += amount
+                    remaining -= amount
+                    available -= amount
+                else:
+                    # lost a race for this row; retry with what is left in it
+                    available = _current_units(row_pk)
+            if not remaining:
+                return taken
+    return taken
+
+
+def allocate(blood_group, units):
+    """Take ``units`` for a ``blood_group`` recipient, falling back to compatible groups.
+
+    Groups are tried in ``compatibility.GROUP_ORDER`` priority (identical group
+    first, O- last) and each group's rows by their soonest-expiring lot, then
+    primary key; stock without lots comes last. Returns
+    ``[(bank_id, donor_group, units), ...]``; raises ``InsufficientStock`` if the
+    banks together hold too little.
+    """
+    groups = compatibility.compatible_donor_groups(blood_group)
+    # lock first, in primary-key order; the preferred order below is only the order of taking
+    locked = list(
+        BloodInventory.objects.select_for_update().filter(blood_group__in=groups, units__gt=0)
+        .order_by('pk').values_list('blood_group', 'pk', 'bank_id', 'units')
+    )
+    expiry = inventory.earliest_expiry(groups)
+    candidates = sorted(
+        locked,
+        key=lambda row: (
+            compatibility.RANK[row[0]], expiry.get((row[2], row[0])) or datetime.date.max, row[1],
+        ),
+    )
+    remaining = units
+    allocations = []
+    for group in groups:
+        rows = [row[1:] for row in candidates if row[0] == group]
+        for bank_id, amount in _take_group(rows, group, remaining).items():
+            allocations.append((bank_id, group, amount))
+            remaining -= amount
+        if not remaining:
+            return allocations
+    raise InsufficientStock(f'Only {units - remaining} of {units} unit(s) for {blood_group} available.')
+
+
+def approve_request(blood_request):
+    """Claim a pending request and allocate its stock.
+
+    Returns the list of ``BloodAllocation`` rows, or ``None`` if the request was
+    not pending (already approved or rejected).
+    """
+    if not transition(blood_request, 'pending', 'approved'):
+        return None
+    allocations = [
+        BloodAllocation(request=blood_request, bank_id=bank_id, blood_group=group, units=units)
+        for bank_id, group, units in allocate(blood_request.blood_group, blood_request.units)
+    ]
+    BloodAllocation.objects.bulk_create(allocations)
+    return allocations
@@ -0,0 +1,114 @@
+"""Async versions of the hot read endpoints, under ``/api/async/``.
+
+Same responses as their DRF counterparts, which they reuse for filtering,
+serializers, pagination and the response cache, but the queries go through
+Django's async ORM. On Django 4.2 that still runs each query on a thread via
+``sync_to_async``, so this buys concurrency with other awaited I/O rather
+than faster database-bound pages. Search (``?q=``) and nearby (``?near=``)
+ranking run Python over a few hundred candidates and are handed to the sync
+view.
+
+Authentication is the same JWT ``Authorization: Bearer`` header; DRF's own
+authentication and throttling classes do not run here.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from . import caching, stats
+from .authentication import user_from_request
+from .views import BloodBankViewSet, DonorProfileViewSet
+
+RANKED_PARAMS = ('q', 'near')
+
+
+def _unauthorized():
+    return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+
+def _rendered(response):
+    # plain Django views get no content negotiation; Django renders the Response on the way out
+    if isinstance(response, Response):
+        response.accepted_renderer = JSONRenderer()
+        response.accepted_media_type = JSONRenderer.media_type
+        response.renderer_context = {}
+    return response
+
+
+async def _request(request):
+    """A DRF ``Request`` for ``request`` with the token's user, or ``None`` if unauthenticated."""
+    user = await sync_to_async(user_from_request)(request)
+    if user is None:
+        return None
+    drf_request = Request(request, authenticators=())
+    drf_request.user = user
+    return drf_request
+
+
+def _viewset(viewset_class, drf_request):
+    return viewset_class(request=drf_request, args=(), kwargs={}, format_kwarg=None, action='list')
+
+
+async def _list_page(view):
+    if any(name in view.request.query_params for name in RANKED_PARAMS):
+        # the ViewSet's list below its response cache
+        return await sync_to_async(super(caching.CachedResponseMixin, view).list)(view.request)
+    queryset = view.filter_queryset(view.get_queryset())
+    flat = view.flat_query(queryset) if hasattr(view, 'flat_query') else None
+    if flat is not None:
+        values, render = flat
+        data = render(await view.paginator.apaginate_queryset(values, view.request, view))
+    else:
+        # prefetched relations are loaded with the page, so serializing queries nothing
+        page = await view.paginator.apaginate_queryset(queryset, view.request, view)
+        data = view.get_serializer(page, many=True).data
+    return view.get_paginated_response(data)
+
+
+async def _list(viewset_class, request):
+    drf_request = await _request(request)
+    if drf_request is None:
+        return _unauthorized()
+    view = _viewset(viewset_class, drf_request)
+    # ``next`` links differ from the sync endpoint's, so the entries cannot be shared
+    return _rendered(await caching.acached_response(
+        view.cache_namespace, drf_request, 'async:list', lambda: _list_page(view),
+    ))
+
+
+async def donor_profiles(request):
+    """``GET /api/async/donor-profiles/``, as ``GET /api/donor-profiles/``."""
+    return await _list(DonorProfileViewSet, request)
+
+
+async def blood_banks(request):
+    """``GET /api/async/blood-banks/``, as ``GET /api/blood-banks/``."""
+    return await _list(BloodBankViewSet, request)
+
+
+async def admin_dashboard(request):
+    drf_request = await _request(request)
+    if drf_request is None:
+        return _unauthorized()
+    if drf_request.user.role != 'admin':
+        return JsonResponse({'detail': 'Only admin can access dashboard.'}, status=status.HTTP_403_FORBIDDEN)
+
+    async def build():
+        return Response(await stats.aadmin_dashboard())
+
+    # same payload as the sync view, so the cached entries are shared
+    return _rendered(await caching.acached_response('stats', drf_request, 'admin-dashboard', build))
+
+
+async def analytics(request):
+    drf_request = await _request(request)
+    if drf_request is None:
+        return _unauthorized()
+
+    async def build():
+        return Response(await stats.aanalytics(city=drf_request.query_params.get('city')))
+
+    return _rendered(await caching.acached_response('stats', drf_request, 'analytics', build))
@@ -0,0 +1,173 @@
+"""JWT authentication without a user query per request.
+
+Access tokens issued at login carry the user's ``role`` and the ``jti`` of the
+refresh token they came from (``RoleRefreshToken``). For those,
+``StatelessJWTAuthentication`` checks the signature and expiry, then whether
+
+- the refresh token was blacklisted (logout), via the ``token_blacklist`` app;
+- the user was changed (role, deactivation, ...) after the token was issued,
+  which ``User.auth_changed_at`` records.
+
+Both answers come from the database, and each process reuses them for
+``AUTH_USER_CACHE_SECONDS`` (the user row, including ``auth_changed_at``, and
+whether a ``jti`` is blacklisted), so a warm process answers without a query.
+Logouts and changes also leave a mark in the default cache for an immediate
+effect in every process that shares it (``CACHE_URL``); a missing mark, from
+an evicted entry, a restart or an unshared cache, only means the database
+answer may be up to ``AUTH_USER_CACHE_SECONDS`` old.
+
+If the token is still good, it returns a ``TokenUser`` answering ``id``,
+``pk`` and ``role`` from the claims; anything else loads the full user on
+first use, from the same process cache. Tokens without the claims, or for a
+changed user, get the user row itself.
+"""
+import copy
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+USER_CACHE_MAX = 10000
+REFRESH_JTI_CLAIM = 'refresh_jti'
+
+_users = {}
+_revoked = {}
+
+
+def _seconds(lifetime):
+    return int(lifetime.total_seconds())
+
+
+def _revoked_key(jti):
+    return f'core:jwt:revoked:{jti}'
+
+
+def _changed_key(user_id):
+    return f'core:jwt:user:{user_id}'
+
+
+def _remembered(store, key, load, loaded_after=None):
+    """``load()``, reused from ``store`` while at most ``AUTH_USER_CACHE_SECONDS`` old and loaded after ``loaded_after``."""
+    now = time.time()
+    entry = store.get(key)
+    max_age = getattr(settings, 'AUTH_USER_CACHE_SECONDS', 30)
+    if entry is None or entry[0] < now - max_age or (loaded_after is not None and entry[0] <= loaded_after):
+        if len(store) >= USER_CACHE_MAX:
+            store.clear()
+        entry = (now, load())
+        store[key] = entry
+    return entry[1]
+
+
+def revoke(jti):
+    """Refuse access tokens issued from refresh token ``jti``; call once it is blacklisted."""
+    # blacklisting is for good, so this process never needs to ask again
+    _revoked[jti] = (float('inf'), True)
+    # a blacklisted refresh token mints no new ones, so only live access tokens matter
+    cache.set(_revoked_key(jti), True, _seconds(api_settings.ACCESS_TOKEN_LIFETIME))
+
+
+def _blacklisted(jti):
+    """Whether refresh token ``jti`` is blacklisted, as of at most ``AUTH_USER_CACHE_SECONDS`` ago."""
+    return _remembered(_revoked, jti, lambda: BlacklistedToken.objects.filter(token__jti=jti).exists())
+
+
+def user_changed(user_id):
+    """Stop trusting claims in tokens issued to ``user_id`` before now."""
+    _users.pop(user_id, None)
+    now = timezone.now()
+    get_user_model().objects.filter(pk=user_id).update(auth_changed_at=now)
+    # access tokens copy ``iat`` and ``role`` from their refresh token, which may mint them for this long
+    cache.set(_changed_key(user_id), now.timestamp(), _seconds(api_settings.REFRESH_TOKEN_LIFETIME))
+
+
+def cached_user(user_id, changed_at=None):
+    """The user row, at most ``AUTH_USER_CACHE_SECONDS`` old and loaded after ``changed_at``; or ``None``."""
+    user = _remembered(_users, user_id, lambda: get_user_model().objects.filter(pk=user_id).first(), changed_at)
+    # each request gets its own copy to modify
+    return copy.copy(user)
+
+
+def _active_user(user_id, changed_at=None):
+    user = cached_user(user_id, changed_at)
+    if user is None:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    if not user.is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    return user
+
+
+class TokenUser(SimpleLazyObject):
+    """``request.user`` for a token carrying its user's role.
+
+    ``id``, ``pk`` and ``role`` come from the claims without touching the
+    database; any other attribute, or using it as a model instance, loads the
+    full user.
+    """
+
+    def __init__(self, token):
+        user_id = token[api_settings.USER_ID_CLAIM]
+        super().__init__(lambda: _active_user(user_id))
+        # set on the proxy itself so reading them does not load the user
+        self.__dict__.update(
+            id=user_id, pk=user_id, role=token['role'], is_authenticated=True, is_anonymous=False, is_active=True,
+        )
+
+
+class RoleRefreshToken(RefreshToken):
+    """Refresh token whose access tokens carry ``role`` and the refresh ``jti``."""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['role'] = user.role
+        token[REFRESH_JTI_CLAIM] = token[api_settings.JTI_CLAIM]
+        return token
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RoleRefreshToken
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+        refresh_jti = validated_token.get(REFRESH_JTI_CLAIM)
+        keys = [_changed_key(user_id)] + ([_revoked_key(refresh_jti)] if refresh_jti else [])
+        # marks in the cache only speed things up; the database has the final say
+        marks = cache.get_many(keys)
+        if refresh_jti and (marks.get(_revoked_key(refresh_jti)) or _blacklisted(refresh_jti)):
+            raise AuthenticationFailed('Token is blacklisted', code='token_not_valid')
+        user = _active_user(user_id, marks.get(_changed_key(user_id)))
+        changed_at = user.auth_changed_at.timestamp() if user.auth_changed_at else None
+        if 'role' in validated_token and refresh_jti and (changed_at is None or validated_token['iat'] > changed_at):
+            return TokenUser(validated_token)
+        return user
+
+
+def user_from_request(request):
+    """The active user of the ``Authorization: Bearer`` header, or ``None``.
+
+    For the plain Django (non-DRF) views: the event stream and the async API.
+    """
+    auth = StatelessJWTAuthentication()
+    header = auth.get_header(request)
+    raw = auth.get_raw_token(header) if header else None
+    if not raw:
+        return None
+    try:
+        return auth.get_user(auth.get_validated_token(raw))
+    except (InvalidToken, AuthenticationFailed):
+        return None
@@ -0,0 +1,121 @@
+"""Approving and rejecting many donations or blood requests in one call.
+
+Each function takes a list of primary keys and returns ``{pk: result}`` with
+one of ``'approved'``, ``'rejected'``, ``'already_approved'``,
+``'already_rejected'``, ``'not_found'``, ``'insufficient_stock'`` or
+``'invalid_blood_group'``.
+Call them inside ``transaction.atomic()``.
+"""
+from collections import Counter
+
+from django.db import transaction
+
+from . import allocation, caching, eligibility, events, inventory, notifications, stats
+from .models import BLOOD_GROUP_CODES, BloodBank, BloodRequest, Donation
+from .utils import donation_approved_email
+
+MAX_IDS = 1000
+
+
+def _missing(ids, found):
+    return {pk: 'not_found' for pk in ids if pk not in found}
+
+
+def approve_donations(ids):
+    """Approve pending donations, add their units to stock and queue the donors' emails.
+
+    Stock is added with one ``UPDATE`` per ``(bank, blood group)``, the
+    approvals with one ``UPDATE``, and the lots and emails with one ``INSERT``
+    each.
+    """
+    donations = list(
+        Donation.objects.select_for_update(of=('self',)).select_related('donor').filter(pk__in=ids).order_by('pk')
+    )
+    results = _missing(ids, {d.pk for d in donations})
+    pending = []
+    for donation in donations:
+        if donation.approved:
+            results[donation.pk] = 'already_approved'
+        else:
+            results[donation.pk] = 'approved'
+            pending.append(donation)
+    if pending:
+        Donation.objects.filter(pk__in=[d.pk for d in pending]).update(approved=True)
+        record_approvals(pending)
+    return results
+
+
+def record_approvals(donations):
+    """Counters, stock, lots, eligibility and emails for ``donations`` just approved with an ``UPDATE``.
+
+    Call in the same transaction as the ``UPDATE``.
+    """
+    cities = dict(BloodBank.objects.filter(pk__in={d.blood_bank_id for d in donations}).values_list('pk', 'city'))
+    deltas = Counter()
+    stock = Counter()
+    for donation in donations:
+        city = cities.get(donation.blood_bank_id)
+        deltas.update(stats.donation_counters(donation.units, True, city))
+        deltas.subtract(stats.donation_counters(donation.units, False, city))
+        if donation.blood_bank_id and donation.units > 0 and donation.blood_group in BLOOD_GROUP_CODES:
+            stock[donation.blood_bank_id, donation.blood_group] += donation.units
+        donation.approved = True
+    stats.apply_deltas(deltas)
+    caching.invalidate('stats')
+    inventory.add_units_many(stock)
+    inventory.add_lots(donations)
+    eligibility.record_donations(donations)
+    notifications.enqueue_many(filter(None, map(donation_approved_email, donations)))
+
+
+def approve_requests(ids):
+    """Approve pending requests one by one in primary-key order.
+
+    Each request gets a savepoint, so one that cannot be covered by stock is
+    reported as ``'insufficient_stock'`` without undoing the others.
+    """
+    requests = list(BloodRequest.objects.filter(pk__in=ids).order_by('pk'))
+    results = _missing(ids, {r.pk for r in requests})
+    for blood_request in requests:
+        if blood_request.status != 'pending':
+            results[blood_request.pk] = f'already_{blood_request.status}'
+            continue
+        if blood_request.blood_group not in BLOOD_GROUP_CODES:
+            results[blood_request.pk] = 'invalid_blood_group'
+            continue
+        try:
+            with transaction.atomic():
+                allocated = allocation.approve_request(blood_request)
+        except allocation.InsufficientStock:
+            results[blood_request.pk] = 'insufficient_stock'
+            continue
+        if allocated is None:
+            blood_request.refresh_from_db(fields=['status'])
+            results[blood_request.pk] = f'already_{blood_request.status}'
+        else:
+            results[blood_request.pk] = 'approved'
+    return results
+
+
+def reject_requests(ids):
+    """Reject pending requests with one ``UPDATE``."""
+    requests = list(
+        BloodRequest.objects.select_for_update().filter(pk__in=ids)
+        .only('pk', 'status', 'units', 'blood_group', 'requester_id')
+    )
+    results = _missing(ids, {r.pk for r in requests})
+    pending = [r for r in requests if r.status == 'pending']
+    for blood_request in requests:
+        results[blood_request.pk] = 'rejected' if blood_request.status == 'pending' else f'already_{blood_request.status}'
+    if not pending:
+        return results
+    BloodRequest.objects.filter(pk__in=[r.pk for r in pending]).update(status='rejected')
+    deltas = Counter()
+    for blood_request in pending:
+        deltas.update(stats.request_counters(blood_request.units, 'rejected'))
+        deltas.subtract(stats.request_counters(blood_request.units, 'pending'))
+        blood_request.status = 'rejected'
+        events.request_changed(blood_request, 'request.rejected')
+    stats.apply_deltas(deltas)
+    caching.invalidate('stats')
+    return results
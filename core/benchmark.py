@@ -0,0 +1,242 @@
+"""API benchmark scenarios driven through the Django test client.
+
+Each scenario issues ``iterations`` requests against the real URL
+configuration, middleware and database, and reports latency percentiles,
+SQL statements per request and status codes. ``manage.py benchmark`` runs
+them against a throwaway database filled by ``core.synthetic`` and writes
+the results as JSON, so runs on different commits can be compared.
+
+``run_concurrent`` puts the sync endpoints behind the WSGI handler and their
+``/api/async/`` twins behind the ASGI handler side by side, ``concurrency``
+requests in flight at a time, and reports throughput and latency for both.
+"""
+import asyncio
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, Client
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import metrics
+from .models import BloodRequest, Donation
+
+User = get_user_model()
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of ``values`` (``fraction`` between 0 and 1)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * fraction // 1))
+    return ordered[int(rank) - 1]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _ids(queryset, count):
+    return iter(list(queryset.order_by('pk').values_list('pk', flat=True)[:count]))
+
+
+def scenarios(iterations):
+    """``{name: (method, path-or-callable, data)}``; callables are called once per request."""
+    pending_donations = _ids(Donation.objects.filter(approved=False), iterations)
+    pending_requests = _ids(BloodRequest.objects.filter(status='pending'), iterations)
+    return {
+        'donor_list': ('get', '/api/donor-profiles/', None),
+        'donor_list_large_page': ('get', '/api/donor-profiles/?page_size=200', None),
+        'donor_list_filtered': ('get', '/api/donor-profiles/?blood_group=O%2B&available=true', None),
+        'donor_search': ('get', '/api/donor-profiles/?q=dhka', None),
+        'donor_autocomplete': ('get', '/api/donor-profiles/?q=rah', None),
+        'donor_near': ('get', '/api/donor-profiles/?near=23.8103,90.4125&radius_km=5', None),
+        'donor_compatible': ('get', '/api/donor-profiles/compatible/?recipient=A%2B&city=Dhaka', None),
+        'bank_list': ('get', '/api/blood-banks/', None),
+        'donation_list': ('get', '/api/donations/?page_size=200', None),
+        'request_list': ('get', '/api/blood-requests/?page_size=200', None),
+        'analytics': ('get', '/api/analytics/', None),
+        'admin_dashboard': ('get', '/api/admin/dashboard/', None),
+        'export_donations': ('get', '/api/admin/export/donations/', None),
+        'approve_donation': ('post', lambda: f'/api/donations/{next(pending_donations)}/approve/', None),
+        'approve_request': ('post', lambda: f'/api/blood-requests/{next(pending_requests)}/approve/', None),
+    }
+
+
+# name: (sync path, async path)
+ASYNC_PAIRS = {
+    'donor_list': ('/api/donor-profiles/', '/api/async/donor-profiles/'),
+    'donor_list_large_page': ('/api/donor-profiles/?page_size=200', '/api/async/donor-profiles/?page_size=200'),
+    'donor_list_filtered': (
+        '/api/donor-profiles/?blood_group=O%2B&available=true',
+        '/api/async/donor-profiles/?blood_group=O%2B&available=true',
+    ),
+    'bank_list': ('/api/blood-banks/', '/api/async/blood-banks/'),
+    'analytics': ('/api/analytics/', '/api/async/analytics/'),
+    'admin_dashboard': ('/api/admin/dashboard/', '/api/async/admin/dashboard/'),
+}
+
+
+def _consume(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def run_scenario(client, method, path, data, iterations, cold=False):
+    latencies, queries, statuses = [], [], Counter()
+    for _ in range(iterations):
+        try:
+            url = path() if callable(path) else path
+        except StopIteration:
+            # ran out of pending rows to approve
+            break
+        if cold:
+            cache.clear()
+        with metrics.recording() as recorder:
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data, format='json')
+            _consume(response)
+            latencies.append((time.perf_counter() - start) * 1000)
+        queries.append(recorder.count)
+        statuses[response.status_code] += 1
+    return {
+        'requests': len(latencies),
+        'p50_ms': _round(percentile(latencies, 0.50)),
+        'p95_ms': _round(percentile(latencies, 0.95)),
+        'p99_ms': _round(percentile(latencies, 0.99)),
+        'mean_ms': _round(sum(latencies) / len(latencies)) if latencies else None,
+        'queries_per_request': _round(sum(queries) / len(queries)) if queries else None,
+        'max_queries': max(queries, default=None),
+        'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def _summary(latencies, statuses, elapsed):
+    return {
+        'requests': len(latencies),
+        'requests_per_second': _round(len(latencies) / elapsed) if elapsed else None,
+        'p50_ms': _round(percentile(latencies, 0.50)),
+        'p95_ms': _round(percentile(latencies, 0.95)),
+        'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def _wsgi(path, token, requests, concurrency, cold):
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def one(_):
+        if cold:
+            cache.clear()
+        start = time.perf_counter()
+        response = Client().get(path, headers=headers)
+        _consume(response)
+        return (time.perf_counter() - start) * 1000, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    return _summary([ms for ms, _ in results], Counter(code for _, code in results), elapsed)
+
+
+async def _asgi(path, token, requests, concurrency, cold):
+    client = AsyncClient()
+    # AsyncClient ignores headers given to its constructor on Django 4.2
+    headers = {'Authorization': f'Bearer {token}'}
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            if cold:
+                cache.clear()
+            start = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            return (time.perf_counter() - start) * 1000, response.status_code
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    return _summary([ms for ms, _ in results], Counter(code for _, code in results), elapsed)
+
+
+def run_concurrent(requests=200, concurrency=20, only=None, cold=False):
+    """Compare each of ``ASYNC_PAIRS`` through the WSGI and ASGI handlers; returns the results dict."""
+    admin, _ = User.objects.get_or_create(username='benchmark-admin', defaults={'role': 'admin'})
+    token = str(RefreshToken.for_user(admin).access_token)
+    results = {}
+    for name, (sync_path, async_path) in ASYNC_PAIRS.items():
+        if only and name not in only:
+            continue
+        results[name] = {
+            'wsgi': _wsgi(sync_path, token, requests, concurrency, cold),
+            'asgi': asyncio.run(_asgi(async_path, token, requests, concurrency, cold)),
+        }
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'requests': requests,
+            'concurrency': concurrency,
+            'cold_cache': cold,
+        },
+        'scenarios': results,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(iterations=50, only=None, cold=False, warmup=2):
+    """Run the scenarios (or those named in ``only``) and return the results dict."""
+    admin, _ = User.objects.get_or_create(username='benchmark-admin', defaults={'role': 'admin'})
+    client = APIClient()
+    client.force_authenticate(admin)
+    results = {}
+    for name, (method, path, data) in scenarios(iterations + warmup).items():
+        if only and name not in only:
+            continue
+        if warmup and method == 'get':
+            run_scenario(client, method, path, data, warmup, cold)
+        results[name] = run_scenario(client, method, path, data, iterations, cold)
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': iterations,
+            'cold_cache': cold,
+        },
+        'scenarios': results,
+        'peak_rss_mb': peak_rss_mb(),
+    }
@@ -0,0 +1,187 @@
+"""Response caching for read-heavy endpoints.
+
+Cached entries are keyed by namespace, namespace version, user role, view and
+normalized query string. Saving or deleting any model a namespace depends on
+bumps that namespace's version, which orphans every entry built from the old
+data; the backend's own eviction (LRU for locmem) then reclaims them.
+
+The same version doubles as the HTTP validator: cached views send an ``ETag``
+derived from the cache key and a ``Last-Modified`` of the namespace's last
+write, so a client or proxy revalidating an unchanged resource gets a ``304``
+without the view looking at the database or the cached body. ETags also carry
+a random token stored next to the versions, so they never repeat after the
+cache is flushed or across workers that each have a local cache.
+"""
+import hashlib
+import time
+import uuid
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import BloodBank, BloodInventory, BloodRequest, Donation, DonorProfile
+
+User = get_user_model()
+
+# namespace -> models whose writes invalidate it
+DEPENDENCIES = {
+    'donor-profiles': (DonorProfile, User),
+    'blood-banks': (BloodBank, BloodInventory),
+    'stats': (User, DonorProfile, Donation, BloodRequest, BloodBank, BloodInventory),
+}
+
+
+def _cache():
+    return caches['default']
+
+
+def _incr(key, delta=1):
+    cache = _cache()
+    # add() is a no-op if the key exists, so concurrent first hits don't reset it
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # evicted between add() and incr()
+        cache.set(key, delta, timeout=None)
+        return delta
+
+
+def get_version(namespace):
+    return _cache().get_or_set(f'core:v:{namespace}', 1, timeout=None)
+
+
+def _bump(namespace):
+    _incr(f'core:v:{namespace}')
+    _cache().set(f'core:t:{namespace}', time.time(), timeout=None)
+
+
+def last_modified(namespace):
+    """Time of the last write to ``namespace`` seen by the cache (or of its first use)."""
+    return _cache().get_or_set(f'core:t:{namespace}', time.time, timeout=None)
+
+
+def _epoch():
+    return _cache().get_or_set('core:epoch', lambda: uuid.uuid4().hex, timeout=None)
+
+
+def invalidate(namespace):
+    """Start a new version of ``namespace``.
+
+    Bump now so the current request stops reading stale entries, and again after
+    commit so nothing cached from pre-commit data outlives the transaction.
+    """
+    _bump(namespace)
+    transaction.on_commit(lambda: _bump(namespace))
+
+
+def cache_stats():
+    """Hit/miss counters per namespace."""
+    cache = _cache()
+    return {
+        namespace: {
+            'hits': cache.get(f'core:hits:{namespace}', 0),
+            'misses': cache.get(f'core:misses:{namespace}', 0),
+            'version': get_version(namespace),
+        }
+        for namespace in DEPENDENCIES
+    }
+
+
+def make_key(namespace, request, view_name):
+    params = sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values
+        if value != ''
+    )
+    digest = hashlib.md5(urlencode(params).encode()).hexdigest()
+    role = getattr(request.user, 'role', 'anonymous')
+    return f'core:r:{namespace}:{get_version(namespace)}:{role}:{view_name}:{digest}'
+
+
+def make_etag(key, request):
+    # the same data renders differently as JSON and in the browsable API
+    media_type = getattr(request, 'accepted_media_type', '')
+    return '"%s"' % hashlib.md5(f'{_epoch()}:{key}:{media_type}'.encode()).hexdigest()
+
+
+def _add_validators(response, etag, modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified)
+    patch_cache_control(
+        response,
+        max_age=getattr(settings, 'API_CACHE_MAX_AGE', 0),
+        s_maxage=getattr(settings, 'API_CACHE_SHARED_MAX_AGE', 0),
+        must_revalidate=True,
+    )
+    # responses depend on the caller's role
+    patch_vary_headers(response, ('Authorization', 'Accept'))
+    return response
+
+
+def _lookup(namespace, request, view_name):
+    """``(key, etag, modified, response)``; ``response`` is a 304 or a cache hit, else ``None``."""
+    key = make_key(namespace, request, view_name)
+    etag, modified = make_etag(key, request), last_modified(namespace)
+    not_modified = get_conditional_response(request._request, etag=etag, last_modified=int(modified))
+    if not_modified is not None:
+        return key, etag, modified, _add_validators(not_modified, etag, modified)
+    data = _cache().get(key)
+    if data is not None:
+        _incr(f'core:hits:{namespace}')
+        return key, etag, modified, _add_validators(Response(data), etag, modified)
+    _incr(f'core:misses:{namespace}')
+    return key, etag, modified, None
+
+
+def _store(key, response, etag, modified):
+    if response.status_code == status.HTTP_200_OK:
+        _cache().set(key, response.data, timeout=getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+        _add_validators(response, etag, modified)
+    return response
+
+
+def cached_response(namespace, request, view_name, build):
+    """Return a cached ``Response`` for this request, calling ``build()`` on a miss.
+
+    Answers ``304 Not Modified`` when the request's ``If-None-Match`` or
+    ``If-Modified-Since`` still matches. Only ``200 OK`` responses are stored.
+    """
+    key, etag, modified, response = _lookup(namespace, request, view_name)
+    if response is not None:
+        return response
+    return _store(key, build(), etag, modified)
+
+
+async def acached_response(namespace, request, view_name, build):
+    """``cached_response`` for async views; ``build`` is a coroutine function."""
+    key, etag, modified, response = await sync_to_async(_lookup)(namespace, request, view_name)
+    if response is not None:
+        return response
+    return await sync_to_async(_store)(key, await build(), etag, modified)
+
+
+class CachedResponseMixin:
+    """Cache ``list`` and ``retrieve`` for a ViewSet under ``cache_namespace``."""
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(
+            self.cache_namespace, request, 'list',
+            lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(
+            self.cache_namespace, request, f"detail:{kwargs.get(self.lookup_url_kwarg or self.lookup_field)}",
+            lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs),
+        )
@@ -0,0 +1,51 @@
+"""Red-cell ABO/Rh compatibility.
+
+Each blood group is one bit; ``DONOR_MASKS[recipient]`` has a bit set for every
+group the recipient can receive from, so compatibility checks are a single AND.
+
+Donor groups are ranked by ``GROUP_ORDER``: a recipient's own group first and
+O- (the universal donor, kept for emergencies) last. Every recipient's list of
+compatible groups is a subsequence of this order, which is what lets the
+allocator lock inventory rows in one global order.
+"""
+from .models import BLOOD_GROUP_CODES
+
+GROUP_ORDER = ('AB+', 'AB-', 'A+', 'A-', 'B+', 'B-', 'O+', 'O-')
+RANK = {group: i for i, group in enumerate(GROUP_ORDER)}
+BITS = {group: 1 << i for i, group in enumerate(GROUP_ORDER)}
+
+
+def _can_receive(recipient, donor):
+    """Derive compatibility from antigens: the donor must not carry any the recipient lacks."""
+    def antigens(group):
+        abo, rh = group[:-1], group[-1]
+        return set(abo.replace('O', '')) | ({'D'} if rh == '+' else set())
+    return antigens(donor) <= antigens(recipient)
+
+
+DONOR_MASKS = {
+    recipient: sum(BITS[donor] for donor in GROUP_ORDER if _can_receive(recipient, donor))
+    for recipient in BLOOD_GROUP_CODES
+}
+# decoded once, in priority order
+COMPATIBLE_DONORS = {
+    recipient: tuple(group for group in GROUP_ORDER if mask & BITS[group])
+    for recipient, mask in DONOR_MASKS.items()
+}
+
+
+def normalize_group(value):
+    """Accept ``'ab+'``, ``' AB+ '`` and ``'AB '`` (a ``+`` decoded from a query string as a space)."""
+    value = (value or '').strip().upper()
+    if value and value[-1] not in '+-':
+        value += '+'
+    return value if value in DONOR_MASKS else None
+
+
+def can_receive(recipient, donor):
+    return bool(DONOR_MASKS[recipient] & BITS[donor])
+
+
+def compatible_donor_groups(recipient):
+    """Groups ``recipient`` can receive from, best match first."""
+    return COMPATIBLE_DONORS[recipient]
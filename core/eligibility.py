@@ -0,0 +1,142 @@
+"""When a donor may give blood again.
+
+After each approved donation a donor is deferred for ``DEFERRAL_DAYS`` of
+the component they gave. ``DonorProfile.next_eligible_on`` stores the end of
+the longest deferral, and ``last_donated`` the latest donation; a
+``last_donated`` the donor entered that is newer than any approved donation
+counts as whole blood.
+
+Approving donations updates the donors' profiles and switches ``available``
+off right away. ``manage.py refresh_eligibility`` (nightly) recomputes the
+dates and switches ``available`` back on for donors whose deferral is over,
+both with set-based updates. Donor matching also filters on
+``next_eligible_on`` in the query (``eligible_q``), so a missed run never
+lets a deferred donor through.
+"""
+import datetime
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from . import caching, stats
+from .models import Donation, DonorProfile
+
+DEFERRAL_DAYS = {
+    'whole_blood': 90,
+    'double_red_cells': 120,
+    'platelets': 14,
+    'plasma': 28,
+}
+REFRESH_BATCH_SIZE = 1000
+
+
+def deferral_end(donated_on, component='whole_blood'):
+    return donated_on + datetime.timedelta(days=DEFERRAL_DAYS[component])
+
+
+def eligible_q(today=None):
+    """``Q`` for donor profiles that are available and not deferred on ``today``."""
+    today = today or timezone.localdate()
+    return Q(available=True) & (Q(next_eligible_on__isnull=True) | Q(next_eligible_on__lte=today))
+
+
+def status(profile, today=None):
+    """``{'eligible', 'available', 'last_donated', 'next_eligible_on'}`` for ``profile``."""
+    today = today or timezone.localdate()
+    next_on = profile.next_eligible_on
+    return {
+        'eligible': profile.available and (next_on is None or next_on <= today),
+        'available': profile.available,
+        'last_donated': profile.last_donated,
+        'next_eligible_on': next_on,
+    }
+
+
+def _history(donor_ids=None):
+    """``{donor_id: (last donation date, end of the longest deferral)}`` from approved donations."""
+    rows = Donation.objects.filter(approved=True, donor__isnull=False).order_by()
+    if donor_ids is not None:
+        rows = rows.filter(donor_id__in=donor_ids)
+    history = {}
+    for donor_id, component, latest in rows.values_list('donor_id', 'component').annotate(latest=Max('created_at')):
+        day = timezone.localdate(latest)
+        last, next_on = history.get(donor_id, (day, deferral_end(day, component)))
+        history[donor_id] = (max(last, day), max(next_on, deferral_end(day, component)))
+    return history
+
+
+def _dates(last_donated, history):
+    """``(last_donated, next_eligible_on)`` for a profile, given its entry in ``_history``."""
+    if history is None:
+        return last_donated, deferral_end(last_donated) if last_donated else None
+    last, next_on = history
+    if last_donated and last_donated > last:
+        # a donation the donor told us about that never went through the app
+        return last_donated, max(next_on, deferral_end(last_donated))
+    return last, next_on
+
+
+def _set_available(profiles, available):
+    """Switch ``available`` on a profile queryset with one ``UPDATE``, keeping the counters in step."""
+    changed = profiles.exclude(available=available)
+    sign = 1 if available else -1
+    deltas = Counter()
+    for row in changed.order_by().values('blood_group', 'city').annotate(n=Count('id')):
+        for key, value in stats.donor_counters(row['blood_group'], row['city'], True).items():
+            if key[1] == 'donors_available':
+                deltas[key] += sign * value * row['n']
+    count = changed.update(available=available, deferred=not available)
+    if count:
+        stats.apply_deltas(deltas)
+    return count
+
+
+def _write(profiles, history, batch_size):
+    """Store fresh dates on ``profiles``; returns how many changed."""
+    by_dates = defaultdict(list)
+    rows = profiles.order_by('pk').values_list('pk', 'user_id', 'last_donated', 'next_eligible_on')
+    for pk, user_id, last_donated, next_on in rows.iterator(chunk_size=batch_size):
+        dates = _dates(last_donated, history.get(user_id))
+        if dates != (last_donated, next_on):
+            by_dates[dates].append(pk)
+    # one ``UPDATE`` for every batch of profiles sharing the same pair of dates
+    for (last_donated, next_on), pks in by_dates.items():
+        for start in range(0, len(pks), batch_size):
+            DonorProfile.objects.filter(pk__in=pks[start:start + batch_size]).update(
+                last_donated=last_donated, next_eligible_on=next_on,
+            )
+    return sum(len(pks) for pks in by_dates.values())
+
+
+def record_donations(donations, today=None):
+    """Update the profiles of the donors of newly approved ``donations``; call inside their transaction."""
+    update_donors({donation.donor_id for donation in donations if donation.donor_id}, today)
+
+
+def update_donors(donor_ids, today=None):
+    """Recompute the dates of the profiles of ``donor_ids`` (user ids) and defer those not yet eligible."""
+    if not donor_ids:
+        return
+    profiles = DonorProfile.objects.filter(user_id__in=donor_ids)
+    _write(profiles, _history(donor_ids), REFRESH_BATCH_SIZE)
+    _set_available(profiles.filter(next_eligible_on__gt=today or timezone.localdate()), False)
+    caching.invalidate('donor-profiles')
+    caching.invalidate('stats')
+
+
+def refresh(today=None, batch_size=REFRESH_BATCH_SIZE):
+    """Recompute every donor's dates and switch availability; returns ``(updated, deferred, restored)``."""
+    today = today or timezone.localdate()
+    with transaction.atomic():
+        updated = _write(DonorProfile.objects.all(), _history(), batch_size)
+        deferred = _set_available(DonorProfile.objects.filter(next_eligible_on__gt=today), False)
+        restored = _set_available(
+            DonorProfile.objects.filter(deferred=True).filter(Q(next_eligible_on__isnull=True) | Q(next_eligible_on__lte=today)),
+            True,
+        )
+    if updated or deferred or restored:
+        caching.invalidate('donor-profiles')
+        caching.invalidate('stats')
+    return updated, deferred, restored
@@ -0,0 +1,238 @@
+"""Live request and stock events, streamed as server-sent events.
+
+Writes publish small events after their transaction commits:
+``request.created``, ``request.approved``, ``request.rejected`` and
+``inventory.changed``. The broker hands each event once to every event loop
+with open ``/api/events/`` streams, and that loop copies it into the queues of
+its streams, so an event costs the same whether one dashboard or a thousand
+are connected. Each stream only passes on what its user may see: admins get
+everything, hospitals their own requests and stock changes, donors the
+requests their blood group can give to.
+
+Browsers open the stream with ``EventSource``, which cannot send an
+``Authorization`` header, so they first ``POST /api/events/ticket/`` and
+pass the answer as ``?ticket=``. A ticket opens one stream within
+``TICKET_SECONDS``; an access token never appears in the URL, and every
+reconnect asks for a new ticket, so a stream never outlives the session.
+
+``LocalBroker`` only reaches streams in the same process. Run the ASGI app
+with one worker, or point ``EVENTS_BROKER`` at a broker class with the same
+``publish``/``subscribe`` interface that relays between processes.
+
+The stream is an async view and needs an ASGI server, e.g.
+``gunicorn blood_management.asgi:application -k uvicorn.workers.UvicornWorker``.
+"""
+import asyncio
+import itertools
+import json
+import secrets
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+from . import authentication, compatibility
+from .models import DonorProfile
+
+QUEUE_SIZE = 100
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 3000
+# Django 4.2 does not notice a client going away mid-stream, so streams end
+# on their own after this long; EventSource reconnects after RETRY_MS
+STREAM_SECONDS = 300
+TICKET_SECONDS = 30
+
+_ids = itertools.count(1)
+
+
+class Event:
+    def __init__(self, type, data, blood_group=None, owner_id=None):
+        self.id = next(_ids)
+        self.type = type
+        self.data = data
+        # who may see it; not sent to clients
+        self.blood_group = blood_group
+        self.owner_id = owner_id
+
+    def encode(self):
+        return f'id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data)}\n\n'.encode()
+
+
+class Subscription:
+    def __init__(self, viewer):
+        self.viewer = viewer
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, event):
+        if not visible_to(event, self.viewer):
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # a client this far behind reconnects and reloads instead
+            self.overflowed = True
+
+
+class LocalBroker:
+    """Fans events out to the subscriptions of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loops = defaultdict(set)
+
+    def publish(self, event):
+        """Deliver ``event``; safe to call from any thread."""
+        with self._lock:
+            targets = [(loop, list(subscriptions)) for loop, subscriptions in self._loops.items()]
+        for loop, subscriptions in targets:
+            try:
+                loop.call_soon_threadsafe(_deliver, subscriptions, event)
+            except RuntimeError:
+                # the loop has closed; its streams are gone
+                pass
+
+    def subscribe(self, viewer):
+        """Register a new ``Subscription`` on the running event loop."""
+        subscription = Subscription(viewer)
+        with self._lock:
+            self._loops[asyncio.get_running_loop()].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for loop, subscriptions in list(self._loops.items()):
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._loops[loop]
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._loops.values())
+
+
+def _deliver(subscriptions, event):
+    for subscription in subscriptions:
+        subscription.deliver(event)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(getattr(settings, 'EVENTS_BROKER', 'core.events.LocalBroker'))()
+    return _broker
+
+
+def publish(type, data, blood_group=None, owner_id=None):
+    """Publish an event once the current transaction commits."""
+    event = Event(type, data, blood_group=blood_group, owner_id=owner_id)
+    transaction.on_commit(lambda: get_broker().publish(event))
+
+
+def request_changed(blood_request, type):
+    publish(
+        type,
+        {'id': blood_request.pk, 'blood_group': blood_request.blood_group, 'units': blood_request.units,
+         'status': blood_request.status},
+        blood_group=blood_request.blood_group, owner_id=blood_request.requester_id,
+    )
+
+
+def inventory_changed(bank_id, blood_group, change=None, units=None):
+    """``change`` is the difference in units, or ``units`` the new total when set outright."""
+    data = {'bank': bank_id, 'blood_group': blood_group}
+    data.update({'change': change} if units is None else {'units': units})
+    publish('inventory.changed', data)
+
+
+class Viewer:
+    def __init__(self, user_id, role, donor_group=None):
+        self.user_id = user_id
+        self.role = role
+        self.donor_group = donor_group
+
+
+def visible_to(event, viewer):
+    if viewer.role == 'admin':
+        return True
+    if event.type == 'inventory.changed':
+        return viewer.role == 'hospital'
+    if event.owner_id is not None and event.owner_id == viewer.user_id:
+        return True
+    return viewer.donor_group is not None and viewer.donor_group in compatibility.COMPATIBLE_DONORS.get(event.blood_group, ())
+
+
+def _viewer(user):
+    donor_group = None
+    if user.role == 'donor':
+        donor_group = DonorProfile.objects.filter(user=user, available=True).values_list('blood_group', flat=True).first()
+    return Viewer(user.pk, user.role, donor_group)
+
+
+async def _stream(viewer):
+    broker = get_broker()
+    subscription = broker.subscribe(viewer)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + STREAM_SECONDS
+    try:
+        yield f'retry: {RETRY_MS}\n\n'.encode()
+        while loop.time() < deadline:
+            try:
+                timeout = min(HEARTBEAT_SECONDS, max(deadline - loop.time(), 0))
+                event = await asyncio.wait_for(subscription.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                # keeps proxies from closing an idle connection
+                yield b': ping\n\n'
+                continue
+            yield event.encode()
+            if subscription.overflowed and subscription.queue.empty():
+                yield b'event: overflow\ndata: {}\n\n'
+                return
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def _ticket_key(ticket):
+    return f'core:events:ticket:{ticket}'
+
+
+def issue_ticket(user):
+    """A single-use ``?ticket=`` opening one stream for ``user`` within ``TICKET_SECONDS``."""
+    ticket = secrets.token_urlsafe(24)
+    cache.set(_ticket_key(ticket), user.pk, TICKET_SECONDS)
+    return ticket
+
+
+def _user(request):
+    ticket = request.GET.get('ticket')
+    if not ticket:
+        return authentication.user_from_request(request)
+    key = _ticket_key(ticket)
+    user_id = cache.get(key)
+    # only the caller whose delete removed the key may use it; another stream may have got here first
+    if user_id is None or not cache.delete(key):
+        return None
+    user = authentication.cached_user(user_id)
+    return user if user is not None and user.is_active else None
+
+
+async def stream(request):
+    """``GET /api/events/``: a ``text/event-stream`` of the events the caller may see."""
+    user = await sync_to_async(_user)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided or are invalid.'}, status=401)
+    viewer = await sync_to_async(_viewer)(user)
+    response = StreamingHttpResponse(_stream(viewer), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would otherwise buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,161 @@
+"""Nearby search without PostGIS.
+
+Rows carrying ``latitude``/``longitude`` also store a geohash. A radius query
+picks the geohash precision whose cells are at least as large as the radius,
+so the circle is covered by the centre cell and its eight neighbours; those
+cells become index range scans on the geohash column. The surviving
+candidates are ranked by great-circle distance, vectorized with NumPy when it
+is installed and the candidate set is large.
+"""
+import math
+
+from django.db.models import Q
+from rest_framework import status
+from rest_framework.response import Response
+
+try:
+    import numpy as np
+except ImportError:  # optional; pure Python is fine for small candidate sets
+    np = None
+
+DEFAULT_RADIUS_KM = 10.0
+MAX_RADIUS_KM = 500.0
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+GEOHASH_PRECISION = 9
+NUMPY_THRESHOLD = 500
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """``(lat_degrees, lng_degrees)`` spanned by one geohash cell."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def precision_for(latitude, radius_km):
+    """Finest precision whose cells are at least ``radius_km`` on each side."""
+    cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_deg, lng_deg = cell_size(precision)
+        if lat_deg * KM_PER_DEGREE >= radius_km and lng_deg * KM_PER_DEGREE * cos_lat >= radius_km:
+            return precision
+    return 0
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """Geohash prefixes of the 3x3 block of cells around a point."""
+    precision = precision_for(latitude, radius_km)
+    if precision == 0:
+        return ['']
+    lat_deg, lng_deg = cell_size(precision)
+    cells = set()
+    for dlat in (-lat_deg, 0, lat_deg):
+        for dlng in (-lng_deg, 0, lng_deg):
+            lat = min(max(latitude + dlat, -90.0), 90.0 - 1e-9)
+            lng = (longitude + dlng + 180.0) % 360.0 - 180.0
+            cells.add(encode(lat, lng, precision))
+    return sorted(cells)
+
+
+def filter_near(queryset, latitude, longitude, radius_km):
+    """Restrict ``queryset`` to rows in the cells covering the search circle."""
+    condition = Q()
+    for prefix in covering_cells(latitude, longitude, radius_km):
+        if not prefix:
+            return queryset.filter(geohash__isnull=False)
+        # a range rather than startswith so every backend can use the B-tree index
+        condition |= Q(geohash__gte=prefix, geohash__lt=prefix + '~')
+    return queryset.filter(condition)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def rank(candidates, latitude, longitude, radius_km):
+    """Sort ``[(pk, lat, lng), ...]`` by ``(distance, pk)``; returns ``[(pk, km), ...]`` within the radius."""
+    if not candidates:
+        return []
+    if np is not None and len(candidates) >= NUMPY_THRESHOLD:
+        pks = np.array([c[0] for c in candidates])
+        lats = np.radians(np.array([c[1] for c in candidates], dtype=float))
+        lngs = np.radians(np.array([c[2] for c in candidates], dtype=float))
+        lat0, lng0 = math.radians(latitude), math.radians(longitude)
+        a = np.sin((lats - lat0) / 2) ** 2 + math.cos(lat0) * np.cos(lats) * np.sin((lngs - lng0) / 2) ** 2
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        order = np.lexsort((pks, distances))
+        return [(int(pks[i]), float(distances[i])) for i in order if distances[i] <= radius_km]
+    ranked = sorted(
+        ((pk, haversine_km(latitude, longitude, lat, lng)) for pk, lat, lng in candidates),
+        key=lambda item: (item[1], item[0]),
+    )
+    return [(pk, km) for pk, km in ranked if km <= radius_km]
+
+
+def parse_near(params):
+    """Read ``?near=lat,lng&radius_km=``; returns ``(lat, lng, radius_km)`` or raises ``ValueError``."""
+    try:
+        latitude, longitude = (float(part) for part in params['near'].split(','))
+        radius_km = float(params.get('radius_km', DEFAULT_RADIUS_KM))
+    except (TypeError, ValueError):
+        raise ValueError('near must be "lat,lng" and radius_km a number.')
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('near is out of range.')
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        raise ValueError(f'radius_km must be between 0 and {MAX_RADIUS_KM:g}.')
+    return latitude, longitude, radius_km
+
+
+class NearbySearchMixin:
+    """Add ``?near=lat,lng&radius_km=`` to a ViewSet's ``list``.
+
+    Matching rows are returned nearest first with a ``distance_km`` field,
+    paginated by ``(distance_km, id)`` with the usual keyset cursor. Other
+    filters from ``get_queryset`` still apply.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if 'near' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        try:
+            latitude, longitude, radius_km = parse_near(request.query_params)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = filter_near(self.filter_queryset(self.get_queryset()), latitude, longitude, radius_km)
+        candidates = queryset.values_list('pk', 'latitude', 'longitude').order_by()
+        ranked = rank(list(candidates), latitude, longitude, radius_km)
+
+        page = self.paginator.paginate_ranked(ranked, queryset, request, 'distance_km')
+        data = self.get_serializer(page, many=True).data
+        for item, obj in zip(data, page):
+            item['distance_km'] = round(obj.distance_km, 3)
+        return self.paginator.get_paginated_response(data)
@@ -0,0 +1,51 @@
+"""Role-scoped donation and blood-request lists.
+
+Admins see every row; everyone else only the rows they own (``owner_field``).
+Owners' lists are read through a composite ``(owner, created_at, id)`` index
+in the keyset order, so a user's history costs the same however large the
+table grows. ``?since=`` and ``?status=`` narrow the query in SQL.
+"""
+import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+def parse_since(value):
+    """``?since=`` as an aware datetime; a bare date means the start of that day."""
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = day and datetime.datetime.combine(day, datetime.time.min)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValidationError({'since': 'Expected a date (YYYY-MM-DD) or an ISO 8601 date and time.'})
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+class OwnedHistoryMixin:
+    """``get_queryset`` limited to the caller's own rows unless they are an admin.
+
+    ``status_filters`` maps each accepted ``?status=`` value to the lookups it
+    applies.
+    """
+    owner_field = None
+    status_filters = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.role != 'admin':
+            queryset = queryset.filter(**{self.owner_field: user})
+        params = self.request.query_params
+        if params.get('since'):
+            queryset = queryset.filter(created_at__gte=parse_since(params['since']))
+        if params.get('status'):
+            lookups = self.status_filters.get(params['status'].lower())
+            if lookups is None:
+                raise ValidationError({'status': f"Choose one of: {', '.join(self.status_filters)}."})
+            queryset = queryset.filter(**lookups)
+        return queryset
@@ -0,0 +1,424 @@
+"""Bulk loading of donors, blood banks and donations from CSV or NDJSON.
+
+Input is read as a stream and handled ``batch_size`` rows at a time: rows are
+validated with plain functions (no serializer per row), written with
+``bulk_create`` in one transaction per batch, and bad rows are reported by line
+number without stopping the import. If the database rejects a batch, its rows
+are retried one by one so only the offending rows are lost.
+
+``manage.py import_data`` hashes passwords in a process pool, since PBKDF2
+dominates the cost of creating users; ``/api/bulk/`` hashes them in the
+request's own thread. ``bulk_create`` sends no signals, so the dashboard counters
+are rebuilt and the response caches invalidated once at the end. Imported
+donors and approved donations get their deferral dates from
+``core.eligibility`` like any other.
+
+Donor rows only ever create or update donor accounts; a username taken by an
+admin or hospital is reported as a bad row.
+"""
+import codecs
+import contextlib
+import csv
+import io
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import DatabaseError, transaction
+from django.utils.dateparse import parse_date
+
+from . import caching, eligibility, stats
+from .models import BLOOD_GROUP_CODES, UNIT_FIELDS, BloodBank, BloodInventory, Donation, DonorProfile
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+POOL_THRESHOLD = 32
+FORMATS = ('csv', 'ndjson')
+CONFLICT_POLICIES = ('skip', 'update')
+# any password value starting with '!' is unusable for login
+UNUSABLE_PASSWORD = '!'
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportReport:
+    def __init__(self):
+        self.counts = Counter()
+        self.errors = []
+        self.error_count = 0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def as_dict(self):
+        return {
+            'created': self.counts['created'],
+            'updated': self.counts['updated'],
+            'skipped': self.counts['skipped'],
+            'failed': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def guess_format(name='', content_type=''):
+    if name.endswith('.csv') or content_type.startswith('text/csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')) or content_type.startswith(('application/x-ndjson', 'application/jsonl')):
+        return 'ndjson'
+    return None
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line_number, dict or RowError)`` from a binary or text stream.
+
+    ``stream`` only has to iterate over lines: a file, an upload or the request itself.
+    """
+    text = stream if isinstance(stream, io.TextIOBase) else codecs.iterdecode(stream, 'utf-8-sig')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, RowError(f'Invalid JSON: {exc}')
+            continue
+        yield line_number, row if isinstance(row, dict) else RowError('Expected a JSON object.')
+
+
+def _text(row, name, max_length=None, required=False):
+    value = row.get(name)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f'{name} is required.')
+    if max_length and len(value) > max_length:
+        raise RowError(f'{name} is longer than {max_length} characters.')
+    return value
+
+
+def _bool(row, name, default):
+    value = row.get(name)
+    if value in (None, ''):
+        return default
+    if isinstance(value, bool):
+        return value
+    lowered = str(value).strip().lower()
+    if lowered in ('true', '1', 'yes'):
+        return True
+    if lowered in ('false', '0', 'no'):
+        return False
+    raise RowError(f'{name} must be true or false.')
+
+
+def _number(row, name, cast, low=None, high=None, default=None):
+    value = row.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = cast(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{name} must be a number.')
+    if low is not None and value < low:
+        raise RowError(f'{name} must be at least {low}.')
+    if high is not None and value > high:
+        raise RowError(f'{name} must be at most {high}.')
+    return value
+
+
+def _blood_group(row, name='blood_group'):
+    value = _text(row, name, required=True).upper()
+    if value not in BLOOD_GROUP_CODES:
+        raise RowError(f'{name} must be one of {", ".join(BLOOD_GROUP_CODES)}.')
+    return value
+
+
+def _coordinates(row):
+    latitude = _number(row, 'latitude', float, -90, 90)
+    longitude = _number(row, 'longitude', float, -180, 180)
+    if (latitude is None) != (longitude is None):
+        raise RowError('latitude and longitude must be given together.')
+    return latitude, longitude
+
+
+def clean_donor(row):
+    last_donated = _text(row, 'last_donated')
+    if last_donated and parse_date(last_donated) is None:
+        raise RowError('last_donated must be a date in YYYY-MM-DD format.')
+    latitude, longitude = _coordinates(row)
+    return {
+        'username': _text(row, 'username', 150, required=True),
+        'email': _text(row, 'email', 254),
+        'password': _text(row, 'password') or None,
+        'first_name': _text(row, 'first_name', 150),
+        'last_name': _text(row, 'last_name', 150),
+        'phone': _text(row, 'phone', 20),
+        'blood_group': _blood_group(row),
+        'city': _text(row, 'city', 100),
+        'last_donated': parse_date(last_donated) if last_donated else None,
+        'available': _bool(row, 'available', True),
+        'latitude': latitude,
+        'longitude': longitude,
+    }
+
+
+def clean_bank(row):
+    latitude, longitude = _coordinates(row)
+    return {
+        'name': _text(row, 'name', 200, required=True),
+        'city': _text(row, 'city', 100, required=True),
+        'address': _text(row, 'address'),
+        'latitude': latitude,
+        'longitude': longitude,
+        'units': {
+            group: _number(row, field_name, int, 0)
+            for group, field_name in UNIT_FIELDS.items()
+            if row.get(field_name) not in (None, '')
+        },
+    }
+
+
+def clean_donation(row):
+    return {
+        'donor': _text(row, 'donor', 150, required=True),
+        'blood_bank': _number(row, 'blood_bank', int, 1),
+        'blood_group': _blood_group(row),
+        'units': _number(row, 'units', int, 1, default=1),
+        'approved': _bool(row, 'approved', False),
+    }
+
+
+def _unique(rows, key, errors):
+    """Drop rows whose ``key`` repeats an earlier row of the batch."""
+    seen = set()
+    unique = []
+    for line, data in rows:
+        if key(data) in seen:
+            errors.append((line, 'Duplicate of an earlier row in the same batch.'))
+        else:
+            seen.add(key(data))
+            unique.append((line, data))
+    return unique
+
+
+def load_donors(rows, on_conflict, hash_passwords):
+    counts, errors = Counter(), []
+    rows = _unique(rows, lambda data: data['username'], errors)
+    roles = dict(User.objects.filter(username__in=[d['username'] for _, d in rows]).values_list('username', 'role'))
+    # an admin or hospital account is never rewritten or given a donor profile
+    for line, d in rows:
+        if roles.get(d['username'], 'donor') != 'donor':
+            errors.append((line, f"{d['username']!r} belongs to a {roles[d['username']]} account."))
+    rows = [(line, d) for line, d in rows if roles.get(d['username'], 'donor') == 'donor']
+    existing = set(roles)
+    if on_conflict == 'skip':
+        counts['skipped'] += sum(d['username'] in existing for _, d in rows)
+        rows = [(line, d) for line, d in rows if d['username'] not in existing]
+    new = [d for _, d in rows if d['username'] not in existing]
+    with_password = [d for d in new if d['password']]
+    hashes = dict(zip(
+        [d['username'] for d in with_password],
+        hash_passwords([d['password'] for d in with_password]),
+    ))
+
+    users = [
+        User(
+            username=d['username'], email=d['email'], first_name=d['first_name'], last_name=d['last_name'],
+            role='donor', password=hashes.get(d['username'], UNUSABLE_PASSWORD),
+        )
+        for _, d in rows
+    ]
+    if on_conflict == 'update':
+        # passwords and roles of existing users are left alone
+        User.objects.bulk_create(
+            users, update_conflicts=True, unique_fields=['username'], update_fields=['email', 'first_name', 'last_name'],
+        )
+    else:
+        User.objects.bulk_create(users, ignore_conflicts=True)
+    ids = dict(User.objects.filter(username__in=[u.username for u in users]).values_list('username', 'id'))
+
+    profiles = []
+    for user, (_, d) in zip(users, rows):
+        user.pk = ids[user.username]
+        profile = DonorProfile(
+            user=user, phone=d['phone'], blood_group=d['blood_group'], city=d['city'],
+            last_donated=d['last_donated'], available=d['available'],
+            latitude=d['latitude'], longitude=d['longitude'],
+        )
+        profile.update_geohash()
+        profile.update_search_text()
+        profiles.append(profile)
+    if on_conflict == 'update':
+        DonorProfile.objects.bulk_create(
+            profiles, update_conflicts=True, unique_fields=['user'],
+            update_fields=[
+                'phone', 'blood_group', 'city', 'last_donated', 'available',
+                'latitude', 'longitude', 'geohash', 'search_text',
+            ],
+        )
+    else:
+        DonorProfile.objects.bulk_create(profiles, ignore_conflicts=True)
+    eligibility.update_donors(set(ids.values()))
+    counts['created'] += len(new)
+    counts['updated'] += len(rows) - len(new)
+    return counts, errors
+
+
+def load_banks(rows, on_conflict, hash_passwords):
+    """Banks are matched on ``(name, city)``; stock comes from the ``units_*`` columns."""
+    counts, errors = Counter(), []
+    rows = _unique(rows, lambda data: (data['name'], data['city']), errors)
+    existing = {
+        (bank.name, bank.city): bank
+        for bank in BloodBank.objects.filter(name__in={d['name'] for _, d in rows})
+    }
+    new, changed, units = [], [], []
+    for _, d in rows:
+        bank = existing.get((d['name'], d['city']))
+        if bank is None:
+            bank = BloodBank(name=d['name'], city=d['city'])
+            new.append(bank)
+        elif on_conflict == 'skip':
+            counts['skipped'] += 1
+            continue
+        else:
+            changed.append(bank)
+        bank.address, bank.latitude, bank.longitude = d['address'], d['latitude'], d['longitude']
+        bank.update_geohash()
+        bank.update_search_text()
+        units.append((bank, d['units']))
+    BloodBank.objects.bulk_create(new)
+    BloodBank.objects.bulk_update(changed, ['address', 'latitude', 'longitude', 'geohash', 'search_text'])
+    BloodInventory.objects.bulk_create(
+        [
+            BloodInventory(bank_id=bank.pk, blood_group=group, units=amount)
+            for bank, by_group in units
+            for group, amount in by_group.items()
+        ],
+        update_conflicts=True, unique_fields=['bank', 'blood_group'], update_fields=['units'],
+    )
+    counts['created'] += len(new)
+    counts['updated'] += len(changed)
+    return counts, errors
+
+
+def load_donations(rows, on_conflict, hash_passwords):
+    """Donations have no natural key, so every valid row is inserted.
+
+    Imported donations are history: marking one approved does not add stock.
+    """
+    counts, errors = Counter(), []
+    donors = dict(User.objects.filter(username__in={d['donor'] for _, d in rows}).values_list('username', 'id'))
+    bank_ids = {d['blood_bank'] for _, d in rows if d['blood_bank']}
+    banks = set(BloodBank.objects.filter(pk__in=bank_ids).values_list('pk', flat=True))
+    donations = []
+    for line, d in rows:
+        if d['donor'] not in donors:
+            errors.append((line, f"Unknown donor {d['donor']!r}."))
+        elif d['blood_bank'] and d['blood_bank'] not in banks:
+            errors.append((line, f"Unknown blood bank {d['blood_bank']}."))
+        else:
+            donations.append(Donation(
+                donor_id=donors[d['donor']], blood_bank_id=d['blood_bank'], blood_group=d['blood_group'],
+                units=d['units'], approved=d['approved'],
+            ))
+    Donation.objects.bulk_create(donations)
+    # approved history still defers its donors
+    eligibility.update_donors({donation.donor_id for donation in donations if donation.approved})
+    counts['created'] += len(donations)
+    return counts, errors
+
+
+KINDS = {
+    'donors': (clean_donor, load_donors, ('donor-profiles',)),
+    'banks': (clean_bank, load_banks, ('blood-banks',)),
+    'donations': (clean_donation, load_donations, ()),
+}
+
+
+def default_workers():
+    return getattr(settings, 'IMPORT_HASH_WORKERS', 0) or os.cpu_count() or 1
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def password_hasher(workers):
+    """Yield a function that hashes a list of passwords.
+
+    Lists of ``POOL_THRESHOLD`` or more are spread over ``workers`` processes;
+    the pool is only started once such a list turns up.
+    """
+    pool = None
+
+    def hash_passwords(passwords):
+        nonlocal pool
+        if workers <= 1 or len(passwords) < POOL_THRESHOLD:
+            return [make_password(p) for p in passwords]
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // workers)))
+
+    try:
+        yield hash_passwords
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def _load(loader, rows, report, on_conflict, hash_passwords):
+    try:
+        with transaction.atomic():
+            counts, errors = loader(rows, on_conflict, hash_passwords)
+    except DatabaseError as exc:
+        if len(rows) == 1:
+            report.add_error(rows[0][0], str(exc))
+            return
+        # find the rows the database rejects without losing the rest
+        for row in rows:
+            _load(loader, [row], report, on_conflict, hash_passwords)
+        return
+    report.counts.update(counts)
+    for line, message in errors:
+        report.add_error(line, message)
+
+
+def import_rows(kind, stream, fmt, on_conflict='skip', batch_size=BATCH_SIZE, workers=1):
+    """Import every row of ``stream``; returns an ``ImportReport``."""
+    clean, loader, namespaces = KINDS[kind]
+    report = ImportReport()
+    with password_hasher(workers) as hash_passwords:
+        batch = []
+        for line, row in read_rows(stream, fmt):
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                batch.append((line, clean(row)))
+            except RowError as exc:
+                report.add_error(line, str(exc))
+            if len(batch) >= batch_size:
+                _load(loader, batch, report, on_conflict, hash_passwords)
+                batch = []
+        if batch:
+            _load(loader, batch, report, on_conflict, hash_passwords)
+    if report.counts['created'] or report.counts['updated']:
+        stats.rebuild()
+        for namespace in namespaces:
+            caching.invalidate(namespace)
+    return report
@@ -0,0 +1,210 @@
+import datetime
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Min, Sum
+from django.utils import timezone
+
+from . import caching, events, stats
+from .models import BLOOD_GROUP_CODES, LIVE_LOT, BloodBank, BloodInventory, InventoryLot
+
+# whole blood / red cells in CPDA-1 or additive solution
+SHELF_LIFE_DAYS = 42
+EXPIRE_BATCH_SIZE = 1000
+
+
+def _record_stock(bank_id, blood_group, delta):
+    # queryset.update() bypasses the model signals that maintain StatsSnapshot and the caches
+    city = BloodBank.objects.filter(pk=bank_id).values_list('city', flat=True).first()
+    stats.apply_deltas(stats.stock_counters(blood_group, delta, city))
+    caching.invalidate('blood-banks')
+    caching.invalidate('stats')
+    events.inventory_changed(bank_id, blood_group, change=delta)
+
+
+def add_units(bank_id, blood_group, units):
+    """Increase a bank's stock of ``blood_group`` by ``units``, creating the row on first use."""
+    rows = BloodInventory.objects.filter(bank_id=bank_id, blood_group=blood_group)
+    if rows.update(units=F('units') + units):
+        _record_stock(bank_id, blood_group, units)
+        return
+    try:
+        with transaction.atomic():
+            BloodInventory.objects.create(bank_id=bank_id, blood_group=blood_group, units=units)
+        events.inventory_changed(bank_id, blood_group, change=units)
+    except IntegrityError:
+        # another writer created the row between our update and insert
+        rows.update(units=F('units') + units)
+        _record_stock(bank_id, blood_group, units)
+
+
+def _lock(keys):
+    """Lock the inventory rows of ``(bank_id, blood_group)`` keys; returns ``{key: row}``.
+
+    Rows are locked with one query in primary-key order. Every path that
+    writes several rows in a transaction locks them this way before touching
+    them (or their lots), so concurrent transactions cannot deadlock.
+    """
+    if not keys:
+        return {}
+    rows = BloodInventory.objects.select_for_update().filter(
+        bank_id__in={bank_id for bank_id, _ in keys}, blood_group__in={group for _, group in keys},
+    ).order_by('pk')
+    return {(row.bank_id, row.blood_group): row for row in rows}
+
+
+def add_units_many(units_by_key):
+    """Apply ``{(bank_id, blood_group): units}`` with one ``UPDATE`` per key.
+
+    The rows are locked first (see ``_lock``); counters and caches are
+    updated once for the whole call. Call inside ``transaction.atomic()``.
+    """
+    rows = _lock(set(units_by_key))
+    updated = Counter()
+    for (bank_id, blood_group), units in sorted(units_by_key.items()):
+        row = rows.get((bank_id, blood_group))
+        if row is not None:
+            BloodInventory.objects.filter(pk=row.pk).update(units=F('units') + units)
+            updated[bank_id, blood_group] = units
+        else:
+            # first stock of this group at this bank; rare enough to do one at a time
+            add_units(bank_id, blood_group, units)
+    if not updated:
+        return
+    cities = dict(BloodBank.objects.filter(pk__in={bank_id for bank_id, _ in updated}).values_list('pk', 'city'))
+    deltas = Counter()
+    for (bank_id, blood_group), units in updated.items():
+        deltas.update(stats.stock_counters(blood_group, units, cities.get(bank_id)))
+        events.inventory_changed(bank_id, blood_group, change=units)
+    stats.apply_deltas(deltas)
+    caching.invalidate('blood-banks')
+    caching.invalidate('stats')
+
+
+def set_units(bank, units_by_group):
+    """Overwrite a bank's stock for each group in ``units_by_group``."""
+    for blood_group, units in units_by_group.items():
+        BloodInventory.objects.update_or_create(
+            bank=bank, blood_group=blood_group, defaults={'units': units},
+        )
+        events.inventory_changed(bank.pk, blood_group, units=units)
+
+
+def take_from(row_pk, bank_id, blood_group, units):
+    """Remove ``units`` from one inventory row if it still holds at least that many.
+
+    Runs as a single conditional ``UPDATE ... WHERE units >= n``; returns whether a
+    row was updated, so concurrent callers can never drive stock below zero.
+    """
+    taken = BloodInventory.objects.filter(pk=row_pk, units__gte=units).update(units=F('units') - units)
+    if taken:
+        consume_lots(bank_id, blood_group, units)
+        _record_stock(bank_id, blood_group, -units)
+    return bool(taken)
+
+
+def add_lots(donations):
+    """Record the units of newly approved ``donations`` as lots expiring after ``SHELF_LIFE_DAYS``."""
+    lots = []
+    for donation in donations:
+        if not donation.blood_bank_id or donation.units <= 0 or donation.blood_group not in BLOOD_GROUP_CODES:
+            continue
+        collected_on = timezone.localdate(donation.created_at) if donation.created_at else timezone.localdate()
+        lots.append(InventoryLot(
+            bank_id=donation.blood_bank_id, donation=donation, blood_group=donation.blood_group,
+            units=donation.units, collected_on=collected_on,
+            expires_on=collected_on + datetime.timedelta(days=SHELF_LIFE_DAYS),
+        ))
+    InventoryLot.objects.bulk_create(lots)
+
+
+def consume_lots(bank_id, blood_group, units):
+    """Use ``units`` from a bank's live lots of ``blood_group``, soonest expiry first.
+
+    The caller has just taken the units from the bank's ``BloodInventory`` row,
+    which serializes concurrent callers for this bank and group. Units beyond
+    what the lots hold came from stock without a lot and need no bookkeeping.
+    """
+    lots = (
+        InventoryLot.objects.filter(LIVE_LOT, bank_id=bank_id, blood_group=blood_group)
+        .order_by('expires_on', 'pk').values_list('pk', 'units')
+    )
+    for lot_pk, available in lots:
+        amount = min(available, units)
+        InventoryLot.objects.filter(pk=lot_pk).update(units=F('units') - amount)
+        units -= amount
+        if not units:
+            break
+
+
+def earliest_expiry(blood_groups):
+    """``{(bank_id, blood_group): date}`` of the first live lot to expire."""
+    rows = (
+        InventoryLot.objects.filter(LIVE_LOT, blood_group__in=blood_groups).order_by()
+        .values('bank_id', 'blood_group').annotate(first=Min('expires_on'))
+    )
+    return {(row['bank_id'], row['blood_group']): row['first'] for row in rows}
+
+
+def expire_lots(today=None, batch_size=EXPIRE_BATCH_SIZE):
+    """Retire live lots that expired before ``today`` and remove their units from stock.
+
+    Works through them ``batch_size`` lots per transaction: one ``UPDATE`` marks
+    the batch expired and one ``UPDATE`` per ``(bank, blood group)`` lowers the
+    stock. Returns ``(lots, units)`` retired.
+
+    Like approvals, which take stock and then use up lots, the stock rows are
+    locked before the lots.
+    """
+    today = today or timezone.localdate()
+    lots_total = units_total = 0
+    while True:
+        with transaction.atomic():
+            candidates = list(
+                InventoryLot.objects.filter(LIVE_LOT, expires_on__lt=today)
+                .order_by('expires_on', 'pk').values_list('pk', 'bank_id', 'blood_group')[:batch_size]
+            )
+            if not candidates:
+                break
+            rows = _lock({(bank_id, blood_group) for _, bank_id, blood_group in candidates})
+            # read again under the locks: an approval may have used some of them up meanwhile
+            batch = list(
+                InventoryLot.objects.select_for_update().filter(LIVE_LOT, pk__in=[row[0] for row in candidates])
+                .order_by('pk').values_list('pk', 'bank_id', 'blood_group', 'units')
+            )
+            InventoryLot.objects.filter(pk__in=[row[0] for row in batch]).update(expired=True)
+            expired = Counter()
+            for _, bank_id, blood_group, units in batch:
+                expired[bank_id, blood_group] += units
+            _remove_units(expired, rows)
+        lots_total += len(batch)
+        units_total += sum(expired.values())
+    return lots_total, units_total
+
+
+def _remove_units(units_by_key, rows):
+    # ``rows`` are locked (``_lock``); stock may have been lowered by hand below
+    # what its lots say, so never go negative
+    cities = dict(BloodBank.objects.filter(pk__in={bank_id for bank_id, _ in units_by_key}).values_list('pk', 'city'))
+    deltas = Counter()
+    for (bank_id, blood_group), units in sorted(units_by_key.items()):
+        row = rows.get((bank_id, blood_group))
+        units = min(units, row.units) if row else 0
+        if not units:
+            continue
+        BloodInventory.objects.filter(pk=row.pk).update(units=F('units') - units)
+        deltas.update(stats.stock_counters(blood_group, -units, cities.get(bank_id)))
+        events.inventory_changed(bank_id, blood_group, change=-units)
+    if deltas:
+        stats.apply_deltas(deltas)
+        caching.invalidate('blood-banks')
+        caching.invalidate('stats')
+
+
+def totals_by_group():
+    """Return total units held across all banks as ``{blood_group: units}``."""
+    totals = dict.fromkeys(BLOOD_GROUP_CODES, 0)
+    rows = BloodInventory.objects.order_by().values('blood_group').annotate(total=Sum('units'))
+    for row in rows:
+        totals[row['blood_group']] = row['total'] or 0
+    return totals
@@ -0,0 +1,62 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core import benchmark, synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the API against a throwaway database seeded with synthetic data and '
+        'write p50/p95/p99 latency, queries per request and peak RSS as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--donors', type=int, default=10000)
+        parser.add_argument('--banks', type=int, default=100)
+        parser.add_argument('--donations', type=int, default=20000)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--iterations', type=int, default=50, help='Measured requests per scenario.')
+        parser.add_argument('--scenario', action='append', dest='scenarios', help='Only run this scenario (repeatable).')
+        parser.add_argument('--cold', action='store_true', help='Clear the response cache before every request.')
+        parser.add_argument(
+            '--concurrency', type=int,
+            help='Instead of the scenarios, compare the WSGI and async (ASGI) read endpoints with this many requests in flight.',
+        )
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the benchmark database between runs.')
+        parser.add_argument('--output', default='-', help="JSON file to write, or '-' for stdout.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            self.stderr.write('Seeding synthetic data...')
+            sizes = synthetic.seed(
+                donors=options['donors'], banks=options['banks'], donations=options['donations'],
+                requests=options['requests'], seed=options['seed'],
+            )
+            if options['concurrency']:
+                self.stderr.write('Comparing WSGI and ASGI...')
+                results = benchmark.run_concurrent(
+                    requests=options['iterations'], concurrency=options['concurrency'],
+                    only=options['scenarios'], cold=options['cold'],
+                )
+            else:
+                self.stderr.write('Running scenarios...')
+                results = benchmark.run(iterations=options['iterations'], only=options['scenarios'], cold=options['cold'])
+            results['meta'].update(dataset=sizes, seed=options['seed'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        output = json.dumps(results, indent=2)
+        if options['output'] == '-':
+            self.stdout.write(output)
+        else:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(f"Wrote {options['output']}")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core import inventory
+
+
+class Command(BaseCommand):
+    help = (
+        'Retire inventory lots past their expiry date and remove their units from stock. '
+        'Meant to run daily from cron or a scheduler.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=inventory.EXPIRE_BATCH_SIZE, help='Lots per transaction.')
+
+    def handle(self, *args, **options):
+        lots, units = inventory.expire_lots(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Expired {lots} lot(s), {units} unit(s).'))
@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import importer
+
+
+class Command(BaseCommand):
+    help = 'Bulk import donors, blood banks or donations from a CSV or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(importer.KINDS))
+        parser.add_argument('path', help="File to read, or '-' for stdin.")
+        parser.add_argument('--input', choices=importer.FORMATS, help='Input format; guessed from the file name if omitted.')
+        parser.add_argument('--on-conflict', choices=importer.CONFLICT_POLICIES, default='skip',
+                            help='What to do with donors/banks that already exist.')
+        parser.add_argument('--batch-size', type=int, default=importer.BATCH_SIZE, help='Rows written per transaction.')
+        parser.add_argument('--workers', type=int, default=importer.default_workers(),
+                            help='Processes used to hash passwords.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['input'] or importer.guess_format(path)
+        if fmt is None:
+            raise CommandError('Cannot tell the input format from the file name; pass --input.')
+        stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        try:
+            report = importer.import_rows(
+                options['kind'], stream, fmt, on_conflict=options['on_conflict'],
+                batch_size=options['batch_size'], workers=options['workers'],
+            )
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+        for error in report.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        summary = report.as_dict()
+        self.stdout.write(
+            f"Created {summary['created']}, updated {summary['updated']}, "
+            f"skipped {summary['skipped']}, failed {summary['failed']}."
+        )
@@ -0,0 +1,24 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from core import photos
+
+
+class Command(BaseCommand):
+    help = (
+        'Process donor photo uploads still waiting for their thumbnails, e.g. because the process that '
+        'queued them restarted. Meant to run every few minutes and after each deploy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=10,
+            help='Skip uploads younger than this many minutes; their queued job may still run.',
+        )
+
+    def handle(self, *args, **options):
+        waiting = photos.waiting(datetime.timedelta(minutes=options['min_age']))
+        for profile_id, name in waiting:
+            photos.process(profile_id, name)
+        self.stdout.write(self.style.SUCCESS(f'Processed {len(waiting)} waiting photo(s).'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the StatsSnapshot counters from the source tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report counters that have drifted; exit with an error if any have.',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drifted = stats.drift()
+            for (scope, metric), (stored, actual) in sorted(drifted.items()):
+                self.stdout.write(f'{scope} {metric}: stored={stored} actual={actual}')
+            if drifted:
+                raise CommandError(f'{len(drifted)} counter(s) out of date; run rebuild_stats to fix.')
+            self.stdout.write(self.style.SUCCESS('Stats snapshot is up to date.'))
+            return
+
+        counters = stats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(counters)} counter(s).'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core import eligibility
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute donors' next eligible dates from their approved donations, mark deferred donors "
+        'unavailable and make donors whose deferral has ended available again. Meant to run nightly.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=eligibility.REFRESH_BATCH_SIZE, help='Profiles per UPDATE statement.',
+        )
+
+    def handle(self, *args, **options):
+        updated, deferred, restored = eligibility.refresh(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {updated} profile(s); {deferred} deferred, {restored} available again.'
+        ))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import notifications
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbox emails, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit.')
+        parser.add_argument('--batch-size', type=int, default=20, help='Messages claimed per transaction.')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty.')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent = notifications.process_batch(options['batch_size'])
+            except Exception as exc:
+                # e.g. the SMTP server is unreachable; the batch stays pending
+                self.stderr.write(f'Notifier batch failed: {exc}')
+                sent = 0
+                if options['once']:
+                    raise
+            if sent:
+                self.stdout.write(f'Sent {sent} message(s).')
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
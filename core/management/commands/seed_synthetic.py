@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from core import synthetic
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with reproducible synthetic donors, banks, donations and requests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--donors', type=int, default=1000)
+        parser.add_argument('--banks', type=int, default=50)
+        parser.add_argument('--donations', type=int, default=2000)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=1, help='Random seed; the same seed gives the same data.')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk insert.')
+        parser.add_argument('--prefix', default='synth', help='Prefix for synthetic usernames.')
+
+    def handle(self, *args, **options):
+        created = synthetic.seed(
+            donors=options['donors'], banks=options['banks'], donations=options['donations'],
+            requests=options['requests'], seed=options['seed'], batch_size=options['batch_size'],
+            prefix=options['prefix'],
+        )
+        self.stdout.write(', '.join(f'{count} {kind}' for kind, count in created.items()) + ' created.')
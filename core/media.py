@@ -0,0 +1,27 @@
+"""Serving uploaded media from Django (``DEBUG`` or ``SERVE_MEDIA``).
+
+Donor photos and their thumbnails are stored under their content hash (see
+``core.photos``), so a name always means the same bytes and browsers and
+proxies may keep them for a year without revalidating. Other files,
+including uploads ``core.photos`` has not stripped yet, get Django's default
+headers.
+"""
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views import static
+
+from . import photos
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+CONTENT_ADDRESSED = re.compile(
+    rf'^(?:{photos.ORIGINAL_DIR}/[0-9a-f]{{64}}\.\w+|{photos.THUMB_DIR}/[0-9a-f]{{64}}-\d+\.webp)$'
+)
+
+
+def serve(request, path):
+    response = static.serve(request, path, document_root=settings.MEDIA_ROOT)
+    if response.status_code == 200 and CONTENT_ADDRESSED.match(path):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return response
@@ -0,0 +1,230 @@
+"""Per-view request and SQL metrics, exported in Prometheus text format.
+
+``MetricsMiddleware`` times every request and wraps each database connection
+with ``execute_wrapper`` to count queries, their total time and how many of
+them repeat an earlier statement of the same request (the usual sign of an
+N+1 loop). Figures are aggregated per ``(view, method)`` in this process and
+served by ``/api/metrics/``; with several worker processes, each one reports
+its own.
+
+Set ``METRICS_SLOW_REQUEST_MS`` to log requests slower than that, together
+with their slowest and most repeated SQL.
+"""
+import contextlib
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SLOW_LOG_STATEMENTS = 5
+
+
+class QueryRecorder:
+    """``execute_wrapper`` that tallies the statements run while it is installed."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            # parameters are left out, so a loop of lookups by id counts as repeats
+            self.statements[sql] += 1
+            self.slowest.append((elapsed, sql))
+            if len(self.slowest) > 4 * SLOW_LOG_STATEMENTS:
+                self.slowest = sorted(self.slowest, reverse=True)[:SLOW_LOG_STATEMENTS]
+
+    @property
+    def duplicates(self):
+        return self.count - len(self.statements)
+
+
+@contextlib.contextmanager
+def recording():
+    """Install a ``QueryRecorder`` on every database connection for the block."""
+    recorder = QueryRecorder()
+    with contextlib.ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.latency = defaultdict(lambda: _Histogram(LATENCY_BUCKETS))
+        self.queries = defaultdict(lambda: _Histogram(QUERY_BUCKETS))
+        self.counters = defaultdict(Counter)
+
+    def observe(self, view, method, status, seconds, recorder, size):
+        key = (view, method)
+        with self._lock:
+            self.latency[key].observe(seconds)
+            self.queries[key].observe(recorder.count)
+            counters = self.counters[key]
+            counters[f'status:{status}'] += 1
+            counters['sql_seconds'] += recorder.duration
+            counters['duplicate_queries'] += recorder.duplicates
+            counters['response_bytes'] += size
+
+    def add_bytes(self, view, method, size):
+        with self._lock:
+            self.counters[view, method]['response_bytes'] += size
+
+    def render(self):
+        """The registry in Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+            _histogram(lines, 'http_request_duration_seconds', 'Request latency by view.', self.latency)
+            _histogram(lines, 'db_queries_per_request', 'SQL statements per request by view.', self.queries)
+            lines += ['# HELP http_requests_total Requests by view and status.', '# TYPE http_requests_total counter']
+            for (view, method), counters in sorted(self.counters.items()):
+                for name, value in sorted(counters.items()):
+                    if name.startswith('status:'):
+                        labels = _labels(view=view, method=method, status=name[7:])
+                        lines.append(f'http_requests_total{labels} {value}')
+            for metric, key, help_text in (
+                ('db_query_duration_seconds_total', 'sql_seconds', 'Time spent in SQL by view.'),
+                ('db_duplicate_queries_total', 'duplicate_queries', 'Statements repeating an earlier one in the same request.'),
+                ('http_response_bytes_total', 'response_bytes', 'Response body bytes by view.'),
+            ):
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+                for (view, method), counters in sorted(self.counters.items()):
+                    lines.append(f'{metric}{_labels(view=view, method=method)} {_number(counters[key])}')
+            return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram(lines, metric, help_text, histograms):
+    lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+    for (view, method), histogram in sorted(histograms.items()):
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f'{metric}_bucket{_labels(view=view, method=method, le=bound)} {count}')
+        lines.append(f'{metric}_bucket{_labels(view=view, method=method, le="+Inf")} {histogram.total}')
+        lines.append(f'{metric}_sum{_labels(view=view, method=method)} {_number(histogram.sum)}')
+        lines.append(f'{metric}_count{_labels(view=view, method=method)} {histogram.total}')
+
+
+registry = Registry()
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name or match.route
+
+
+def _log_slow(request, view, seconds, recorder):
+    slowest = sorted(recorder.slowest, reverse=True)[:SLOW_LOG_STATEMENTS]
+    repeated = [(n, sql) for sql, n in recorder.statements.most_common(SLOW_LOG_STATEMENTS) if n > 1]
+    logger.warning(
+        'Slow request %s %s (%s): %.1f ms, %d queries (%d repeated), %.1f ms in SQL\n'
+        'Slowest SQL:\n%s\nRepeated SQL:\n%s',
+        request.method, request.path, view, seconds * 1000, recorder.count, recorder.duplicates,
+        recorder.duration * 1000,
+        '\n'.join(f'  {elapsed * 1000:.1f} ms  {sql}' for elapsed, sql in slowest) or '  -',
+        '\n'.join(f'  x{n}  {sql}' for n, sql in repeated) or '  -',
+    )
+
+
+def _counting(chunks, view, method):
+    for chunk in chunks:
+        registry.add_bytes(view, method, len(chunk))
+        yield chunk
+
+
+async def _acounting(chunks, view, method):
+    async for chunk in chunks:
+        registry.add_bytes(view, method, len(chunk))
+        yield chunk
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with recording() as recorder:
+            response = self.get_response(request)
+        return self._observe(request, response, time.perf_counter() - start, recorder)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        # the ORM runs queries on the request's sync thread, whose connections
+        # are not this thread's, so the wrapper has to be installed over there
+        stack = contextlib.ExitStack()
+        recorder = await sync_to_async(stack.enter_context)(recording())
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self._observe(request, response, time.perf_counter() - start, recorder)
+
+    def _observe(self, request, response, seconds, recorder):
+        view = _view_name(request)
+        if response.streaming:
+            # the body is produced after we return; count it as it goes out
+            size = 0
+            counting = _acounting if response.is_async else _counting
+            response.streaming_content = counting(response.streaming_content, view, request.method)
+        else:
+            size = len(response.content)
+        registry.observe(view, request.method, response.status_code, seconds, recorder, size)
+        threshold = getattr(settings, 'METRICS_SLOW_REQUEST_MS', None)
+        if threshold is not None and seconds * 1000 >= threshold:
+            _log_slow(request, view, seconds, recorder)
+        return response
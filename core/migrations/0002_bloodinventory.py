@@ -0,0 +1,67 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+UNIT_FIELDS = {
+    'A+': 'units_a_plus', 'A-': 'units_a_minus',
+    'B+': 'units_b_plus', 'B-': 'units_b_minus',
+    'O+': 'units_o_plus', 'O-': 'units_o_minus',
+    'AB+': 'units_ab_plus', 'AB-': 'units_ab_minus',
+}
+
+
+def copy_columns_to_inventory(apps, schema_editor):
+    BloodBank = apps.get_model('core', 'BloodBank')
+    BloodInventory = apps.get_model('core', 'BloodInventory')
+    rows = []
+    for bank in BloodBank.objects.values('pk', *UNIT_FIELDS.values()).iterator():
+        for group, field in UNIT_FIELDS.items():
+            if bank[field]:
+                rows.append(BloodInventory(bank_id=bank['pk'], blood_group=group, units=bank[field]))
+        if len(rows) >= 1000:
+            BloodInventory.objects.bulk_create(rows)
+            rows = []
+    BloodInventory.objects.bulk_create(rows)
+
+
+def copy_inventory_to_columns(apps, schema_editor):
+    BloodBank = apps.get_model('core', 'BloodBank')
+    BloodInventory = apps.get_model('core', 'BloodInventory')
+    for row in BloodInventory.objects.filter(blood_group__in=UNIT_FIELDS).iterator():
+        BloodBank.objects.filter(pk=row.bank_id).update(**{UNIT_FIELDS[row.blood_group]: row.units})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloodInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('O+', 'O+'), ('O-', 'O-'), ('AB+', 'AB+'), ('AB-', 'AB-')], max_length=3)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('bank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory', to='core.bloodbank')),
+            ],
+            options={
+                'verbose_name_plural': 'blood inventory',
+                'indexes': [models.Index(fields=['blood_group', 'units'], name='inventory_group_units_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bloodinventory',
+            constraint=models.UniqueConstraint(fields=('bank', 'blood_group'), name='unique_bank_blood_group'),
+        ),
+        migrations.RunPython(copy_columns_to_inventory, copy_inventory_to_columns),
+        migrations.RemoveField(model_name='bloodbank', name='units_a_plus'),
+        migrations.RemoveField(model_name='bloodbank', name='units_a_minus'),
+        migrations.RemoveField(model_name='bloodbank', name='units_b_plus'),
+        migrations.RemoveField(model_name='bloodbank', name='units_b_minus'),
+        migrations.RemoveField(model_name='bloodbank', name='units_o_plus'),
+        migrations.RemoveField(model_name='bloodbank', name='units_o_minus'),
+        migrations.RemoveField(model_name='bloodbank', name='units_ab_plus'),
+        migrations.RemoveField(model_name='bloodbank', name='units_ab_minus'),
+    ]
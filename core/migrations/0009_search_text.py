@@ -0,0 +1,65 @@
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalize(*values):
+    text = unicodedata.normalize('NFKD', ' '.join(str(v) for v in values if v))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return ' '.join(text.split())[:500]
+
+
+def fill_search_text(apps, schema_editor):
+    DonorProfile = apps.get_model('core', 'DonorProfile')
+    BloodBank = apps.get_model('core', 'BloodBank')
+    profiles = []
+    for profile in DonorProfile.objects.select_related('user').iterator(chunk_size=1000):
+        profile.search_text = normalize(profile.user.username, profile.user.first_name, profile.user.last_name, profile.city)
+        profiles.append(profile)
+    DonorProfile.objects.bulk_update(profiles, ['search_text'], batch_size=1000)
+    banks = []
+    for bank in BloodBank.objects.iterator(chunk_size=1000):
+        bank.search_text = normalize(bank.name, bank.city, bank.address)
+        banks.append(bank)
+    BloodBank.objects.bulk_update(banks, ['search_text'], batch_size=1000)
+
+
+TABLES = ('core_donorprofile', 'core_bloodbank')
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # SQLite gets its FTS5 tables from core.search.install_sqlite_fts after every migrate
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in TABLES:
+        schema_editor.execute(f'CREATE INDEX {table}_search_trgm ON {table} USING gin (search_text gin_trgm_ops)')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_search_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_geo_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bloodbank',
+            name='search_text',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='donorprofile',
+            name='search_text',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=500),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_search_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('O+', 'O+'), ('O-', 'O-'), ('AB+', 'AB+'), ('AB-', 'AB-')], max_length=3)),
+                ('units', models.PositiveIntegerField(help_text='Units still unused.')),
+                ('collected_on', models.DateField()),
+                ('expires_on', models.DateField()),
+                ('expired', models.BooleanField(default=False)),
+                ('bank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='core.bloodbank')),
+                ('donation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lots', to='core.donation')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('expired', False), ('units__gt', 0)), fields=['bank', 'blood_group', 'expires_on'], name='lot_live_fifo_idx'), models.Index(condition=models.Q(('expired', False), ('units__gt', 0)), fields=['expires_on'], name='lot_live_expiry_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+import datetime
+from collections import Counter, defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+# Frozen copies of core.eligibility and core.stats as of this migration, so
+# later changes there cannot change what it does. Every donation on file is
+# whole blood: the ``component`` column is added below with that default.
+WHOLE_BLOOD_DEFERRAL = datetime.timedelta(days=90)
+BATCH_SIZE = 1000
+
+
+def _city_scope(city):
+    city = (city or '').strip().casefold()
+    return f'city:{city}' if city else None
+
+
+def fill_eligibility(apps, schema_editor):
+    """Dates from the approved donations on file; donors still deferred today stop being available."""
+    Donation = apps.get_model('core', 'Donation')
+    DonorProfile = apps.get_model('core', 'DonorProfile')
+    StatsSnapshot = apps.get_model('core', 'StatsSnapshot')
+
+    latest = {
+        donor_id: timezone.localdate(created_at)
+        for donor_id, created_at in Donation.objects.filter(approved=True, donor__isnull=False).order_by()
+        .values('donor_id').annotate(latest=Max('created_at')).values_list('donor_id', 'latest')
+    }
+    by_dates = defaultdict(list)
+    rows = DonorProfile.objects.order_by('pk').values_list('pk', 'user_id', 'last_donated')
+    for pk, user_id, last_donated in rows.iterator(chunk_size=BATCH_SIZE):
+        # a ``last_donated`` the donor entered may be newer than any approved donation
+        last = max(filter(None, (latest.get(user_id), last_donated)), default=None)
+        if last is not None:
+            by_dates[last].append(pk)
+    for last, pks in by_dates.items():
+        for start in range(0, len(pks), BATCH_SIZE):
+            DonorProfile.objects.filter(pk__in=pks[start:start + BATCH_SIZE]).update(
+                last_donated=last, next_eligible_on=last + WHOLE_BLOOD_DEFERRAL,
+            )
+
+    deferred = DonorProfile.objects.filter(next_eligible_on__gt=timezone.localdate(), available=True)
+    deltas = Counter()
+    for row in deferred.order_by().values('city').annotate(n=Count('id')):
+        for scope in filter(None, ('global', _city_scope(row['city']))):
+            deltas[scope, 'donors_available'] -= row['n']
+    deferred.update(available=False, deferred=True)
+    for (scope, metric), delta in sorted(deltas.items()):
+        rows = StatsSnapshot.objects.filter(scope=scope, metric=metric)
+        if not rows.update(value=F('value') + delta):
+            StatsSnapshot.objects.create(scope=scope, metric=metric, value=delta)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_owner_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donation',
+            name='component',
+            field=models.CharField(choices=[('whole_blood', 'Whole blood'), ('double_red_cells', 'Double red cells'), ('platelets', 'Platelets'), ('plasma', 'Plasma')], default='whole_blood', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='donorprofile',
+            name='deferred',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='donorprofile',
+            name='next_eligible_on',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_eligibility, migrations.RunPython.noop),
+    ]
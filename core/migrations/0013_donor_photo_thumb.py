@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_donor_eligibility'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donorprofile',
+            name='photo_thumb',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_user_field_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='auth_changed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,6 +1,35 @@
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
+from . import geo, search
+
+BLOOD_GROUPS = [
+    ('A+', 'A+'), ('A-', 'A-'),
+    ('B+', 'B+'), ('B-', 'B-'),
+    ('O+', 'O+'), ('O-', 'O-'),
+    ('AB+', 'AB+'), ('AB-', 'AB-'),
+]
+BLOOD_GROUP_CODES = [code for code, _ in BLOOD_GROUPS]
+
+# what a donation collected; each has its own deferral (``core.eligibility``)
+COMPONENTS = [
+    ('whole_blood', 'Whole blood'),
+    ('double_red_cells', 'Double red cells'),
+    ('platelets', 'Platelets'),
+    ('plasma', 'Plasma'),
+]
+
+# Per-group stock used to live in eight ``units_*`` columns on BloodBank.
+# The API still exposes those names, so keep the mapping in one place.
+UNIT_FIELDS = {
+    'A+': 'units_a_plus', 'A-': 'units_a_minus',
+    'B+': 'units_b_plus', 'B-': 'units_b_minus',
+    'O+': 'units_o_plus', 'O-': 'units_o_minus',
+    'AB+': 'units_ab_plus', 'AB-': 'units_ab_minus',
+}
+
 class User(AbstractUser):
     ROLE_CHOICES = (
         ('admin', 'Admin'),
@@ -8,47 +37,151 @@ class User(AbstractUser):
         ('hospital', 'Hospital'),
     )
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='donor')
+    # tokens issued before this may carry a stale role (see ``core.authentication``)
+    auth_changed_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.username} ({self.role})"
 
 
-class DonorProfile(models.Model):
-    BLOOD_GROUPS = [
-        ('A+', 'A+'), ('A-', 'A-'),
-        ('B+', 'B+'), ('B-', 'B-'),
-        ('O+', 'O+'), ('O-', 'O-'),
-        ('AB+', 'AB+'), ('AB-', 'AB-'),
-    ]
+class Located(models.Model):
+    """Optional coordinates plus the geohash used by ``?near=`` searches (see ``core.geo``)."""
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    geohash = models.CharField(max_length=geo.GEOHASH_PRECISION, null=True, blank=True, editable=False, db_index=True)
+
+    class Meta:
+        abstract = True
+
+    def update_geohash(self):
+        if self.latitude is None or self.longitude is None:
+            self.geohash = None
+        else:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+
+    def save(self, *args, **kwargs):
+        self.update_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
+
+class DonorProfile(Located):
+    BLOOD_GROUPS = BLOOD_GROUPS
     user = models.OneToOneField('core.User', on_delete=models.CASCADE, related_name='donor_profile')
     phone = models.CharField(max_length=20, blank=True)
     blood_group = models.CharField(max_length=3, choices=BLOOD_GROUPS)
     city = models.CharField(max_length=100, blank=True)
     last_donated = models.DateField(null=True, blank=True)
     available = models.BooleanField(default=True)
+    # kept by ``core.eligibility`` from the approved donations
+    next_eligible_on = models.DateField(null=True, blank=True, editable=False, db_index=True)
+    # ``available`` was switched off until ``next_eligible_on`` by ``core.eligibility``, not by the donor
+    deferred = models.BooleanField(default=False, editable=False)
     photo = models.ImageField(upload_to='profiles/', null=True, blank=True)
+    # content hash of ``photo`` once ``core.photos`` has written its thumbnails
+    photo_thumb = models.CharField(max_length=64, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # username, name and city, normalized for ``?q=`` (see ``core.search``)
+    search_text = models.CharField(max_length=search.SEARCH_TEXT_LENGTH, blank=True, editable=False, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='donor_created_idx'),
+            models.Index(fields=['blood_group', 'available', 'city'], name='donor_match_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.blood_group}"
 
+    def update_search_text(self):
+        self.search_text = search.normalize(self.user.username, self.user.first_name, self.user.last_name, self.city)
 
-class BloodBank(models.Model):
+    def save(self, *args, **kwargs):
+        self.update_search_text()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'city' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'search_text'}
+        super().save(*args, **kwargs)
+
+
+class BloodBank(Located):
     name = models.CharField(max_length=200)
     city = models.CharField(max_length=100)
     address = models.TextField(blank=True)
-    # track units by group in a simple JSON-like field (could be improved)
-    units_a_plus = models.PositiveIntegerField(default=0)
-    units_a_minus = models.PositiveIntegerField(default=0)
-    units_b_plus = models.PositiveIntegerField(default=0)
-    units_b_minus = models.PositiveIntegerField(default=0)
-    units_o_plus = models.PositiveIntegerField(default=0)
-    units_o_minus = models.PositiveIntegerField(default=0)
-    units_ab_plus = models.PositiveIntegerField(default=0)
-    units_ab_minus = models.PositiveIntegerField(default=0)
+    # name, city and address, normalized for ``?q=`` (see ``core.search``)
+    search_text = models.CharField(max_length=search.SEARCH_TEXT_LENGTH, blank=True, editable=False, db_index=True)
 
     def __str__(self):
         return f"{self.name} ({self.city})"
 
+    def update_search_text(self):
+        self.search_text = search.normalize(self.name, self.city, self.address)
+
+    def save(self, *args, **kwargs):
+        self.update_search_text()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'name', 'city', 'address'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'search_text'}
+        super().save(*args, **kwargs)
+
+    def units_by_group(self):
+        """Return ``{blood_group: units}`` for every group, using prefetched inventory if available."""
+        units = dict.fromkeys(BLOOD_GROUP_CODES, 0)
+        for row in self.inventory.all():
+            units[row.blood_group] = row.units
+        return units
+
+
+class BloodInventory(models.Model):
+    """Units of one blood group held by one bank."""
+    bank = models.ForeignKey('core.BloodBank', on_delete=models.CASCADE, related_name='inventory')
+    blood_group = models.CharField(max_length=3, choices=BLOOD_GROUPS)
+    units = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bank', 'blood_group'], name='unique_bank_blood_group'),
+        ]
+        indexes = [
+            models.Index(fields=['blood_group', 'units'], name='inventory_group_units_idx'),
+        ]
+        verbose_name_plural = 'blood inventory'
+
+    def __str__(self):
+        return f"{self.bank_id} - {self.blood_group} x{self.units}"
+
+
+# lots that still hold usable units; also the condition of their partial indexes
+LIVE_LOT = models.Q(expired=False, units__gt=0)
+
+
+class InventoryLot(models.Model):
+    """Units received from one approved donation, used first-expiring-first.
+
+    ``BloodInventory`` stays the running total per bank and group; lots record
+    when those units expire. Stock entered directly (admin, imports) has no
+    lot and is treated as never expiring.
+    """
+    bank = models.ForeignKey('core.BloodBank', on_delete=models.CASCADE, related_name='lots')
+    donation = models.ForeignKey('core.Donation', on_delete=models.SET_NULL, null=True, blank=True, related_name='lots')
+    blood_group = models.CharField(max_length=3, choices=BLOOD_GROUPS)
+    units = models.PositiveIntegerField(help_text='Units still unused.')
+    collected_on = models.DateField()
+    expires_on = models.DateField()
+    expired = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # years of used-up and expired lots stay out of these
+            models.Index(fields=['bank', 'blood_group', 'expires_on'], condition=LIVE_LOT, name='lot_live_fifo_idx'),
+            models.Index(fields=['expires_on'], condition=LIVE_LOT, name='lot_live_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"Lot {self.id} - bank {self.bank_id} {self.blood_group} x{self.units} until {self.expires_on}"
+
 
 class BloodRequest(models.Model):
     STATUS_CHOICES = (
@@ -62,17 +195,95 @@ class BloodRequest(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='request_created_idx'),
+            # one requester's history, newest first (``core.history``)
+            models.Index(fields=['requester', 'created_at', 'id'], name='request_owner_created_idx'),
+        ]
+
     def __str__(self):
         return f"Request {self.id} - {self.blood_group} x{self.units} ({self.status})"
 
 
+class BloodAllocation(models.Model):
+    """Units taken from one bank to fulfil (part of) an approved request."""
+    request = models.ForeignKey('core.BloodRequest', on_delete=models.CASCADE, related_name='allocations')
+    bank = models.ForeignKey('core.BloodBank', on_delete=models.SET_NULL, null=True, related_name='allocations')
+    blood_group = models.CharField(max_length=3, choices=BLOOD_GROUPS)
+    units = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Allocation {self.id} - request {self.request_id} <- bank {self.bank_id} {self.blood_group} x{self.units}"
+
+
 class Donation(models.Model):
     donor = models.ForeignKey('core.User', on_delete=models.SET_NULL, null=True, related_name='donations')
     blood_bank = models.ForeignKey('core.BloodBank', on_delete=models.SET_NULL, null=True, blank=True)
     blood_group = models.CharField(max_length=3)
+    component = models.CharField(max_length=20, choices=COMPONENTS, default='whole_blood')
     units = models.PositiveIntegerField(default=1)
     approved = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='donation_created_idx'),
+            # one donor's history, newest first (``core.history``)
+            models.Index(fields=['donor', 'created_at', 'id'], name='donation_owner_created_idx'),
+        ]
+
     def __str__(self):
         return f"Donation {self.id} - {self.donor} - {self.blood_group} x{self.units}"
+
+
+class StatsSnapshot(models.Model):
+    """One running counter for the dashboards, e.g. ``('city:dhaka', 'donors_available')``.
+
+    Rows are kept current by the signal handlers in ``core.signals`` and can be
+    recomputed from scratch with ``manage.py rebuild_stats``.
+    """
+    scope = models.CharField(max_length=110)
+    metric = models.CharField(max_length=50)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'metric'], name='unique_stats_scope_metric'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.metric}={self.value}"
+
+
+class OutboxMessage(models.Model):
+    """An email waiting to be sent by ``manage.py run_notifier``.
+
+    ``recipients`` go in the To: header. ``audience`` names a group of users
+    resolved when the message is sent (e.g. ``'donors:O+'``); they are split
+    into BCC batches so nobody sees the other addresses.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    recipients = models.JSONField(default=list, blank=True)
+    audience = models.CharField(max_length=50, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Outbox {self.id} - {self.subject} ({self.status})"
@@ -0,0 +1,109 @@
+"""Outbox-backed email delivery.
+
+Request handlers only insert ``OutboxMessage`` rows (see ``core.utils``). The
+``run_notifier`` worker claims due rows with ``select_for_update(skip_locked=True)``
+so several workers can run side by side, sends them over one SMTP connection,
+and reschedules failures with exponential backoff.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import compatibility, eligibility
+from .models import DonorProfile, OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(subject, body, recipients=(), audience=''):
+    return OutboxMessage.objects.create(subject=subject, body=body, recipients=list(recipients), audience=audience)
+
+
+def enqueue_many(messages):
+    """Queue ``[(subject, body, recipients), ...]`` with a single insert."""
+    return OutboxMessage.objects.bulk_create(
+        OutboxMessage(subject=subject, body=body, recipients=list(recipients))
+        for subject, body, recipients in messages
+    )
+
+
+def resolve_audience(audience):
+    """Yield the email addresses an ``audience`` string refers to."""
+    kind, _, value = audience.partition(':')
+    if kind == 'donors':
+        # everyone whose blood a ``value`` recipient can receive
+        emails = (
+            DonorProfile.objects.filter(eligibility.eligible_q(), blood_group__in=compatibility.compatible_donor_groups(value))
+            .exclude(user__email='')
+            .order_by('user__email')
+            .values_list('user__email', flat=True)
+            .distinct()
+        )
+        yield from emails.iterator(chunk_size=2000)
+    else:
+        raise ValueError(f'Unknown audience {audience!r}')
+
+
+def _batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def build_messages(outbox, connection=None):
+    """Turn one outbox row into ``EmailMessage`` objects."""
+    from_email = settings.DEFAULT_FROM_EMAIL
+    messages = []
+    if outbox.recipients:
+        messages.append(EmailMessage(outbox.subject, outbox.body, from_email, outbox.recipients, connection=connection))
+    if outbox.audience:
+        batch_size = getattr(settings, 'NOTIFY_BCC_BATCH_SIZE', 50)
+        for bcc in _batched(resolve_audience(outbox.audience), batch_size):
+            messages.append(EmailMessage(outbox.subject, outbox.body, from_email, [from_email], bcc=bcc, connection=connection))
+    return messages
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'NOTIFY_RETRY_BASE_SECONDS', 30)
+    return datetime.timedelta(seconds=base * 2 ** (attempts - 1))
+
+
+def process_batch(limit=20):
+    """Send up to ``limit`` due messages; return how many were sent."""
+    max_attempts = getattr(settings, 'NOTIFY_MAX_ATTEMPTS', 5)
+    sent = 0
+    with transaction.atomic():
+        due = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=timezone.now())
+            .order_by('next_attempt_at', 'id')[:limit]
+        )
+        if not due:
+            return 0
+        with get_connection() as connection:
+            for outbox in due:
+                try:
+                    connection.send_messages(build_messages(outbox, connection))
+                except Exception as exc:
+                    logger.warning('Sending outbox message %s failed: %s', outbox.pk, exc)
+                    outbox.attempts += 1
+                    outbox.last_error = str(exc)
+                    if outbox.attempts >= max_attempts:
+                        outbox.status = 'failed'
+                    else:
+                        outbox.next_attempt_at = timezone.now() + retry_delay(outbox.attempts)
+                else:
+                    outbox.status = 'sent'
+                    outbox.sent_at = timezone.now()
+                    sent += 1
+        OutboxMessage.objects.bulk_update(due, ['status', 'attempts', 'last_error', 'next_attempt_at', 'sent_at'])
+    return sent
@@ -0,0 +1,149 @@
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Forward-only keyset (seek) pagination.
+
+    Rows are ordered by the view's ``keyset_ordering`` (default newest first by
+    ``(created_at, id)``) and each page is fetched with a ``WHERE (created_at, id) <
+    (last seen)`` condition instead of an OFFSET, so page 1000 costs the same as
+    page 1 given a composite index on the ordering columns. The cursor is an opaque
+    token holding the ordering values of the last row on the previous page.
+    """
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = api_settings.PAGE_SIZE or 50
+
+    def get_ordering(self, view):
+        return getattr(view, 'keyset_ordering', self.ordering)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request, queryset, ordering):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            if len(values) != len(ordering):
+                raise ValueError
+            return [self._to_python(queryset, name.lstrip('-'), value) for name, value in zip(ordering, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _to_python(self, queryset, name, value):
+        try:
+            field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # an annotation such as a rank; JSON already restored its type
+            return value
+        return field.to_python(value)
+
+    def encode_cursor(self, instance, ordering):
+        values = []
+        for name in ordering:
+            # pages of ``values()`` rows are dicts
+            if isinstance(instance, dict):
+                value = instance[name.lstrip('-')]
+            else:
+                value = getattr(instance, name.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def _after(self, ordering, values):
+        """``Q`` matching rows that sort strictly after ``values``."""
+        condition = Q()
+        for i, name in enumerate(ordering):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            step = Q(**{f'{field}__{lookup}': values[i]})
+            for prev_name, prev_value in zip(ordering[:i], values[:i]):
+                step &= Q(**{prev_name.lstrip('-'): prev_value})
+            condition |= step
+        return condition
+
+    def _seek(self, queryset, request, view):
+        """The query for the requested page, with one extra row to tell if another follows."""
+        ordering = self.get_ordering(view)
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*ordering)
+        values = self.decode_cursor(request, queryset, ordering)
+        if values is not None:
+            queryset = queryset.filter(self._after(ordering, values))
+        return queryset[:page_size + 1], ordering, page_size
+
+    def _page(self, rows, ordering, page_size, request):
+        self.has_next = len(rows) > page_size
+        page = rows[:page_size]
+        self.next_cursor = self.encode_cursor(page[-1], ordering) if self.has_next else None
+        self.request = request
+        return page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset, ordering, page_size = self._seek(queryset, request, view)
+        return self._page(list(queryset), ordering, page_size, request)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views."""
+        queryset, ordering, page_size = self._seek(queryset, request, view)
+        return self._page([row async for row in queryset], ordering, page_size, request)
+
+    def paginate_ranked(self, ranked, queryset, request, attname):
+        """Page through ``[(pk, key), ...]`` already sorted in Python by ``(key, pk)``.
+
+        Used where the order is computed outside the database (distance,
+        search score). Each returned instance has its key set as ``attname``,
+        which is also what the cursor records.
+        """
+        ordering = (attname, 'id')
+        values = self.decode_cursor(request, queryset, ordering)
+        if values is not None:
+            ranked = [(pk, key) for pk, key in ranked if (key, pk) > (values[0], values[1])]
+        page_size = self.get_page_size(request)
+        self.has_next = len(ranked) > page_size
+        ranked = ranked[:page_size]
+        objects = queryset.in_bulk([pk for pk, _ in ranked])
+        page = []
+        for pk, key in ranked:
+            instance = objects[pk]
+            setattr(instance, attname, key)
+            page.append(instance)
+        self.next_cursor = self.encode_cursor(page[-1], ordering) if self.has_next else None
+        self.request = request
+        return page
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
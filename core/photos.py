@@ -0,0 +1,188 @@
+"""Donor photo uploads: content-addressed originals and WebP thumbnails.
+
+The request only checks size and extension and keeps the upload as it came,
+under a random ``uploads/`` name that is never listed in the API. Once the
+profile is committed, a worker thread decodes it with Pillow (which releases
+the GIL while decoding and resizing), rejects anything that is not a sane
+image, and re-encodes it with the EXIF orientation applied and all metadata
+(camera, GPS) dropped, as ``profiles/<sha256>.<ext>`` plus
+``thumbs/<sha256>-<size>.webp`` for each of ``THUMB_SIZES``. The same photo is
+stored once, and a URL never changes its content, which lets ``core.media``
+serve it as immutable. Only then does the profile point at them; the upload
+is deleted either way.
+
+Jobs are queued in the process that took the upload, so a restart or crash
+loses them; ``manage.py process_photos`` picks up uploads left waiting.
+"""
+import datetime
+import hashlib
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+from . import caching
+from .models import DonorProfile
+
+THUMB_SIZES = (64, 160, 480)
+DEFAULT_THUMB_SIZE = 160
+THUMB_DIR = 'thumbs'
+ORIGINAL_DIR = 'profiles'
+UPLOAD_DIR = 'uploads'
+EXTENSIONS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP', '.gif': 'GIF'}
+# how each accepted format is stored once stripped: (Pillow format, extension, save options)
+ENCODINGS = {
+    'JPEG': ('JPEG', '.jpg', {'quality': 90}),
+    'PNG': ('PNG', '.png', {}),
+    'GIF': ('PNG', '.png', {}),
+    'WEBP': ('WEBP', '.webp', {'quality': 90}),
+}
+MAX_UPLOAD_BYTES = 5 * 1024 * 1024
+MAX_PIXELS = 40_000_000
+WEBP_QUALITY = 80
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(getattr(settings, 'PHOTO_WORKERS', 2), thread_name_prefix='photos')
+    return _executor
+
+
+def _storage():
+    return DonorProfile.photo.field.storage
+
+
+def thumb_name(digest, size=DEFAULT_THUMB_SIZE):
+    return f'{THUMB_DIR}/{digest}-{size}.webp'
+
+
+def thumb_url(digest, size=DEFAULT_THUMB_SIZE):
+    return _storage().url(thumb_name(digest, size)) if digest else None
+
+
+def validate_upload(upload):
+    """The checks that need no decoding; the rest happens in ``process``."""
+    if upload.size > MAX_UPLOAD_BYTES:
+        raise serializers.ValidationError(f'Photos must be {MAX_UPLOAD_BYTES // (1024 * 1024)} MB or smaller.')
+    if os.path.splitext(upload.name)[1].lower() not in EXTENSIONS:
+        raise serializers.ValidationError(f"Upload one of: {', '.join(sorted(EXTENSIONS))}.")
+
+
+def save_upload(upload):
+    """Store ``upload`` as received under a name of its own; returns the stored name."""
+    extension = os.path.splitext(upload.name)[1].lower()
+    return _storage().save(f'{UPLOAD_DIR}/{uuid.uuid4().hex}{extension}', upload)
+
+
+def is_upload(name):
+    """Whether ``name`` is an upload ``process`` has not stripped yet."""
+    return name.startswith(f'{UPLOAD_DIR}/')
+
+
+def digest_of(name):
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+def _decode(name):
+    """The upright pixels of upload ``name``; raises ``ValueError`` for a bad or missing image."""
+    try:
+        with _storage().open(name) as f:
+            image = Image.open(f)
+            if image.format not in set(EXTENSIONS.values()):
+                raise ValueError(f'unsupported format {image.format}')
+            if image.width * image.height > MAX_PIXELS:
+                raise ValueError(f'{image.width}x{image.height} is too large')
+            source_format = image.format
+            image = ImageOps.exif_transpose(image)
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    except (OSError, SyntaxError, Image.DecompressionBombError) as exc:
+        raise ValueError(str(exc)) from exc
+    return image, source_format
+
+
+def _store(image, source_format):
+    """Write ``image`` and its thumbnails, none of them carrying metadata; returns the original's name."""
+    storage = _storage()
+    image_format, extension, options = ENCODINGS[source_format]
+    out = BytesIO()
+    # no ``exif=``: nothing but pixels is kept
+    image.save(out, image_format, **options)
+    data = out.getvalue()
+    digest = hashlib.sha256(data).hexdigest()
+    name = f'{ORIGINAL_DIR}/{digest}{extension}'
+    if not storage.exists(name):
+        name = storage.save(name, ContentFile(data))
+    for size in THUMB_SIZES:
+        if storage.exists(thumb_name(digest, size)):
+            continue
+        thumb = image.copy()
+        thumb.thumbnail((size, size), Image.LANCZOS)
+        out = BytesIO()
+        thumb.save(out, 'WEBP', quality=WEBP_QUALITY, method=4)
+        storage.save(thumb_name(digest, size), ContentFile(out.getvalue()))
+    return name
+
+
+def process(profile_id, name):
+    """Replace upload ``name`` with its stripped original and thumbnails, or drop a bad photo."""
+    current = DonorProfile.objects.filter(pk=profile_id, photo=name)
+    try:
+        original = _store(*_decode(name))
+    except ValueError as exc:
+        logger.warning('Rejected photo %s of donor profile %s: %s', name, profile_id, exc)
+        changed = current.update(photo=None, photo_thumb='')
+    else:
+        # a newer upload may have replaced it meanwhile
+        changed = current.update(photo=original, photo_thumb=digest_of(original))
+    if is_upload(name):
+        # no one else ever points at an upload, and this profile no longer does
+        _storage().delete(name)
+    if changed:
+        caching.invalidate('donor-profiles')
+    return bool(changed)
+
+
+def _run(profile_id, name):
+    try:
+        return process(profile_id, name)
+    except Exception:
+        logger.exception('Could not process photo %s of donor profile %s', name, profile_id)
+    finally:
+        # worker threads outlive requests, so nothing else closes their connections
+        close_old_connections()
+
+
+def waiting(min_age=datetime.timedelta(minutes=10)):
+    """``[(profile_id, name), ...]`` of uploads stored at least ``min_age`` ago and not processed yet."""
+    storage = _storage()
+    cutoff = timezone.now() - min_age
+    rows = DonorProfile.objects.filter(photo__startswith=f'{UPLOAD_DIR}/').order_by('pk').values_list('pk', 'photo')
+    stale = []
+    for profile_id, name in rows:
+        try:
+            if storage.get_modified_time(name) > cutoff:
+                # most likely still queued
+                continue
+        except OSError:
+            # gone; ``process`` drops it from the profile
+            pass
+        stale.append((profile_id, name))
+    return stale
+
+
+def process_later(profile_id, name):
+    """Queue ``process`` on the worker threads once the current transaction commits."""
+    transaction.on_commit(lambda: _pool().submit(_run, profile_id, name))
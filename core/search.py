@@ -0,0 +1,198 @@
+"""Typo-tolerant ``?q=`` search over donors and blood banks.
+
+Searchable models keep a ``search_text`` column: the searchable fields
+accent-folded, case-folded and joined with single spaces. Candidates are
+fetched through a trigram index on that column, then scored here with a word
+similarity close to PostgreSQL's ``word_similarity()``, so ranking is the
+same on every backend:
+
+* PostgreSQL: a ``pg_trgm`` GIN index, queried with ``search_text %> q``;
+* SQLite: an FTS5 table with the ``trigram`` tokenizer, kept in sync by
+  triggers; every word is stored padded with spaces so prefixes and
+  misspellings still share trigrams with the query. Django drops triggers
+  when a migration rebuilds a SQLite table, so ``install_sqlite_fts`` runs
+  after every ``migrate`` and recreates whatever is missing;
+* anything else: a plain substring match.
+
+A query word that starts a word of the row scores as an exact match, which is
+what makes the endpoint usable for autocomplete.
+"""
+import functools
+import logging
+import unicodedata
+
+from django.db import OperationalError, connections
+from django.db.models.expressions import RawSQL
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import geo
+
+logger = logging.getLogger(__name__)
+
+CANDIDATE_LIMIT = 500
+MIN_SCORE = 0.3
+SEARCH_TEXT_LENGTH = 500
+
+
+def normalize(*values):
+    """``'  Dhākā ', 'MIRPUR'`` -> ``'dhaka mirpur'``."""
+    text = unicodedata.normalize('NFKD', ' '.join(str(v) for v in values if v))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return ' '.join(text.split())[:SEARCH_TEXT_LENGTH]
+
+
+def fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def _trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def score(query, text):
+    """Mean over query words of their best similarity to any word of ``text``."""
+    words = text.split()
+    query_words = query.split()
+    if not words or not query_words:
+        return 0.0
+    total = 0.0
+    for query_word in query_words:
+        wanted = _trigrams(query_word)
+        best = 0.0
+        for word in words:
+            if word.startswith(query_word):
+                best = 1.0
+                break
+            best = max(best, len(wanted & _trigrams(word)) / len(wanted))
+        total += best
+    return total / len(query_words)
+
+
+@functools.lru_cache(maxsize=None)
+def _has_table(alias, table):
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        return table in connection.introspection.table_names(cursor)
+
+
+# every word padded with spaces, so ' dh' matches the start of 'dhaka'
+_FTS_BODY = "' ' || replace({row}.search_text, ' ', '  ') || ' '"
+
+
+def install_sqlite_fts(models, using='default'):
+    """Create (or repair) the FTS5 table and sync triggers for each model."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {row[0] for row in cursor.fetchall()}
+        for model in models:
+            table = model._meta.db_table
+            fts = fts_table(model)
+            triggers = {f'{fts}_ai', f'{fts}_ad', f'{fts}_au'}
+            if fts in existing and triggers <= existing:
+                continue
+            insert = f'INSERT INTO {fts}(rowid, body) VALUES (new.id, {_FTS_BODY.format(row="new")});'
+            delete = f'DELETE FROM {fts} WHERE rowid = old.id;'
+            try:
+                cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(body, tokenize='trigram')")
+            except OperationalError as exc:
+                # SQLite built without FTS5 or older than 3.34; ``candidates`` falls back to LIKE
+                logger.warning('Cannot create %s: %s', fts, exc)
+                continue
+            cursor.execute(f'DELETE FROM {fts}')
+            cursor.execute(f'INSERT INTO {fts}(rowid, body) SELECT id, {_FTS_BODY.format(row=table)} FROM {table}')
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN {insert} END')
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN {delete} END')
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF search_text ON {table} BEGIN {delete} {insert} END'
+            )
+    _has_table.cache_clear()
+
+
+def _fts_query(query):
+    """FTS5 ``MATCH`` expression: any trigram of any padded query word."""
+    grams = set()
+    for word in query.split():
+        padded = f' {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return ' OR '.join('"{}"'.format(gram.replace('"', '""')) for gram in sorted(grams))
+
+
+def candidates(queryset, query):
+    """``[(pk, search_text), ...]`` for up to ``CANDIDATE_LIMIT`` rows likely to match."""
+    connection = connections[queryset.db]
+    rows = queryset.order_by().values_list('pk', 'search_text')
+    if len(query) < 2:
+        return list(rows.filter(search_text__startswith=query)[:CANDIDATE_LIMIT])
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.lookups import TrigramWordSimilar
+        from django.contrib.postgres.search import TrigramWordSimilarity
+        from django.db.models import F, Value
+
+        return list(
+            rows.filter(TrigramWordSimilar(F('search_text'), Value(query)))
+            .order_by(TrigramWordSimilarity(Value(query), 'search_text').desc())[:CANDIDATE_LIMIT]
+        )
+    table = fts_table(queryset.model)
+    if connection.vendor == 'sqlite' and _has_table(queryset.db, table):
+        # matched and ranked inside the queryset's own query, so its filters apply before the limit
+        match = _fts_query(query)
+        qn = connection.ops.quote_name
+        own = f'{qn(queryset.model._meta.db_table)}.{qn(queryset.model._meta.pk.column)}'
+        return list(
+            rows.filter(pk__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [match]))
+            .annotate(fts_rank=RawSQL(
+                f'SELECT rank FROM {table} WHERE {table} MATCH %s AND rowid = {own}', [match],
+            ))
+            .order_by('fts_rank')
+            .values_list('pk', 'search_text')[:CANDIDATE_LIMIT]
+        )
+    return list(rows.filter(search_text__contains=query)[:CANDIDATE_LIMIT])
+
+
+def rank(queryset, query):
+    """Matching rows as ``[(pk, -score), ...]``, best first (ties by primary key)."""
+    scored = ((pk, -score(query, text)) for pk, text in candidates(queryset, query))
+    return sorted(((pk, value) for pk, value in scored if -value >= MIN_SCORE), key=lambda item: (item[1], item[0]))
+
+
+class SearchMixin:
+    """Add ``?q=`` to a ViewSet's ``list``: ranked matches with a ``score`` field.
+
+    Results are paged by ``(score, id)`` with the usual keyset cursor; other
+    filters from ``get_queryset`` still apply, and so does ``?near=`` on a
+    ``geo.NearbySearchMixin`` view, which also adds ``distance_km``.
+    """
+    search_query_param = 'q'
+
+    def list(self, request, *args, **kwargs):
+        query = normalize(request.query_params.get(self.search_query_param, ''))
+        if not query:
+            if request.query_params.get(self.search_query_param) is not None:
+                return Response({'detail': 'q must not be blank.'}, status=status.HTTP_400_BAD_REQUEST)
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        near = None
+        if isinstance(self, geo.NearbySearchMixin) and 'near' in request.query_params:
+            try:
+                near = geo.parse_near(request.query_params)
+            except ValueError as exc:
+                return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = geo.filter_near(queryset, *near)
+        ranked = rank(queryset, query)
+        if near is not None:
+            # the cells only approximate the circle; keep the matches inside it
+            located = queryset.filter(pk__in=[pk for pk, _ in ranked]).values_list('pk', 'latitude', 'longitude')
+            distances = dict(geo.rank(list(located.order_by()), *near))
+            ranked = [item for item in ranked if item[0] in distances]
+        page = self.paginator.paginate_ranked(ranked, queryset, request, 'search_rank')
+        data = self.get_serializer(page, many=True).data
+        for item, obj in zip(data, page):
+            item['score'] = round(-obj.search_rank, 3)
+            if near is not None:
+                item['distance_km'] = round(distances[obj.pk], 3)
+        return self.paginator.get_paginated_response(data)
@@ -1,10 +1,35 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import DonorProfile, BloodBank, BloodRequest, Donation
+from django.db import IntegrityError, transaction
+from .models import DonorProfile, BloodBank, BloodRequest, Donation, UNIT_FIELDS
+from . import inventory, photos
 
 User = get_user_model()
 
 
+class SparseFieldsMixin:
+    """Let GET requests pick output fields with ``?fields=id,blood_group``.
+
+    Fields that are not requested are removed before serialization, so nested
+    serializers such as ``user`` are never built for them. Only applies to the
+    top-level serializer of a read request; writes always see every field.
+    """
+    fields_query_param = 'fields'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requested_fields = None
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD') or self.parent is not None:
+            return
+        param = request.query_params.get(self.fields_query_param)
+        if not param:
+            return
+        self.requested_fields = {name.strip() for name in param.split(',') if name.strip()}
+        for name in set(self.fields) - self.requested_fields:
+            self.fields.pop(name)
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -27,39 +52,116 @@ class RegisterSerializer(serializers.ModelSerializer):
         return user
 
 
-class DonorProfileSerializer(serializers.ModelSerializer):
+class PhotoField(serializers.FileField):
+    """A photo ``core.photos`` has not stripped of its metadata yet reads as ``None``."""
+
+    def to_representation(self, value):
+        if value and photos.is_upload(value.name):
+            return None
+        return super().to_representation(value)
+
+
+class DonorProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
         model = DonorProfile
-        fields = ('id', 'user', 'phone', 'blood_group', 'city', 'last_donated', 'available', 'photo')
+        fields = (
+            'id', 'user', 'phone', 'blood_group', 'city', 'latitude', 'longitude', 'last_donated', 'available',
+            'next_eligible_on', 'photo',
+        )
+
+    # decoded later by ``core.photos``, off the request thread
+    photo = PhotoField(required=False, allow_null=True, validators=[photos.validate_upload])
+
+    # ``photo_url`` and ``photo_thumb_url`` are added on top of the declared fields (see ``core.flat``)
+    flat_extra_columns = ('photo', 'photo_thumb')
+
+    def _wants(self, name):
+        return self.requested_fields is None or name in self.requested_fields
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        # include photo URL if present
-        if instance.photo and hasattr(instance.photo, 'url'):
-            data['photo_url'] = instance.photo.url
-        else:
-            data['photo_url'] = None
+        if self._wants('photo_url'):
+            # include photo URL if present; an unprocessed upload still carries its EXIF
+            if instance.photo and hasattr(instance.photo, 'url') and not photos.is_upload(instance.photo.name):
+                data['photo_url'] = instance.photo.url
+            else:
+                data['photo_url'] = None
+        if self._wants('photo_thumb_url'):
+            data['photo_thumb_url'] = photos.thumb_url(instance.photo_thumb)
         return data
 
+    def flat_finish(self, row, data):
+        if self._wants('photo_url'):
+            photo = row['photo']
+            data['photo_url'] = DonorProfile.photo.field.storage.url(photo) if photo and not photos.is_upload(photo) else None
+        if self._wants('photo_thumb_url'):
+            data['photo_thumb_url'] = photos.thumb_url(row['photo_thumb'])
+
     def validate(self, attrs):
-        # Prevent duplicate donor profiles for a user
-        request = self.context.get('request')
-        user = getattr(request, 'user', None)
-        if self.instance is None and user is not None:
-            if DonorProfile.objects.filter(user=user).exists():
-                raise serializers.ValidationError('Donor profile already exists for this user.')
+        if 'photo' in attrs:
+            # kept aside until ``core.photos`` has stripped it and written the thumbnails
+            attrs['photo'] = photos.save_upload(attrs['photo']) if attrs['photo'] else None
+            attrs['photo_thumb'] = ''
         return attrs
 
+    def create(self, validated_data):
+        # the one-to-one column is the duplicate check; no query up front
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError('Donor profile already exists for this user.')
+
 
 class BloodBankSerializer(serializers.ModelSerializer):
+    """Blood bank with its stock.
+
+    Stock lives in ``BloodInventory`` rows; the legacy ``units_a_plus`` ...
+    ``units_ab_minus`` fields are still accepted and returned so existing
+    clients keep working.
+    """
+
     class Meta:
         model = BloodBank
-        fields = '__all__'
+        fields = ('id', 'name', 'city', 'address', 'latitude', 'longitude')
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for field_name in UNIT_FIELDS.values():
+            fields[field_name] = serializers.IntegerField(min_value=0, required=False)
+        return fields
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        units = instance.units_by_group()
+        for group, field_name in UNIT_FIELDS.items():
+            data[field_name] = units[group]
+        data['inventory'] = units
+        return data
+
+    def _pop_units(self, validated_data):
+        return {
+            group: validated_data.pop(field_name)
+            for group, field_name in UNIT_FIELDS.items()
+            if field_name in validated_data
+        }
+
+    def create(self, validated_data):
+        units = self._pop_units(validated_data)
+        bank = super().create(validated_data)
+        inventory.set_units(bank, units)
+        return bank
+
+    def update(self, instance, validated_data):
+        units = self._pop_units(validated_data)
+        bank = super().update(instance, validated_data)
+        inventory.set_units(bank, units)
+        return bank
 
 
-class BloodRequestSerializer(serializers.ModelSerializer):
+class BloodRequestSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     requester = UserSerializer(read_only=True)
 
     class Meta:
@@ -74,12 +176,12 @@ class BloodRequestSerializer(serializers.ModelSerializer):
         return value
 
 
-class DonationSerializer(serializers.ModelSerializer):
+class DonationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     donor = UserSerializer(read_only=True)
 
     class Meta:
         model = Donation
-        fields = ('id', 'donor', 'blood_bank', 'blood_group', 'units', 'approved', 'created_at')
+        fields = ('id', 'donor', 'blood_bank', 'blood_group', 'component', 'units', 'approved', 'created_at')
         read_only_fields = ('approved', 'created_at')
 
     def validate_blood_group(self, value):
@@ -0,0 +1,196 @@
+"""Keep ``StatsSnapshot`` counters and cached responses in step with the rows they summarise.
+
+Each handler works out what the row contributed to the counters before the
+write (from the database, in ``pre_save``/``pre_delete``) and after it, and
+applies the difference. Writes through ``QuerySet.update()``/``bulk_create``
+do not send signals; ``core.inventory`` records its own deltas and
+``manage.py rebuild_stats`` repairs anything else.
+
+Writes also bump the version of every ``core.caching`` namespace that depends
+on the model, and new blood requests are published to ``core.events``.
+"""
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Q, Sum
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from . import authentication, caching, events, search, stats
+from .models import BloodBank, BloodInventory, BloodRequest, Donation, DonorProfile
+
+User = get_user_model()
+
+
+def _bank_city(bank_id):
+    if bank_id is None:
+        return None
+    return BloodBank.objects.filter(pk=bank_id).values_list('city', flat=True).first()
+
+
+def _counters(instance):
+    if isinstance(instance, User):
+        return stats.user_counters(instance.role)
+    if isinstance(instance, DonorProfile):
+        return stats.donor_counters(instance.blood_group, instance.city, instance.available)
+    if isinstance(instance, Donation):
+        return stats.donation_counters(instance.units, instance.approved, _bank_city(instance.blood_bank_id))
+    if isinstance(instance, BloodRequest):
+        return stats.request_counters(instance.units, instance.status)
+    if isinstance(instance, BloodInventory):
+        return stats.stock_counters(instance.blood_group, instance.units, _bank_city(instance.bank_id))
+    return Counter()
+
+
+def _bank_city_counters(bank_id, city):
+    """What one bank's donations and stock contribute to its city's scope."""
+    scope = stats.city_scope(city)
+    if scope is None:
+        return Counter()
+    counters = Counter()
+    donations = Donation.objects.filter(blood_bank_id=bank_id).aggregate(
+        n_total=Count('id'),
+        n_approved=Count('id', filter=Q(approved=True)),
+        units_approved=Sum('units', filter=Q(approved=True)),
+    )
+    counters[scope, 'donations'] = donations['n_total']
+    counters[scope, 'donations_approved'] = donations['n_approved']
+    counters[scope, 'units_donated'] = donations['units_approved'] or 0
+    for group, units in BloodInventory.objects.filter(bank_id=bank_id).values_list('blood_group', 'units'):
+        counters[scope, f'stock:{group}'] = units
+    return counters
+
+
+# fields that feed the counters; saves limited to other fields are ignored
+WATCHED_FIELDS = {
+    User: {'role'},
+    DonorProfile: {'blood_group', 'city', 'available'},
+    Donation: {'units', 'approved', 'blood_bank'},
+    BloodRequest: {'units', 'status'},
+    BloodInventory: {'bank', 'blood_group', 'units'},
+}
+
+
+def _skip(sender, raw, update_fields):
+    return raw or (update_fields is not None and not WATCHED_FIELDS[sender] & set(update_fields))
+
+
+def remember_counters(sender, instance, raw=False, update_fields=None, **kwargs):
+    if _skip(sender, raw, update_fields):
+        return
+    previous = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._stats_before = _counters(previous) if previous else Counter()
+
+
+def apply_counters(sender, instance, raw=False, update_fields=None, **kwargs):
+    if _skip(sender, raw, update_fields):
+        return
+    deltas = _counters(instance)
+    deltas.subtract(getattr(instance, '_stats_before', Counter()))
+    stats.apply_deltas(deltas)
+
+
+def remove_counters(sender, instance, **kwargs):
+    deltas = Counter()
+    deltas.subtract(_counters(instance))
+    stats.apply_deltas(deltas)
+
+
+for model in WATCHED_FIELDS:
+    pre_save.connect(remember_counters, sender=model)
+    post_save.connect(apply_counters, sender=model)
+    pre_delete.connect(remove_counters, sender=model)
+
+
+@receiver(pre_save, sender=BloodBank)
+def remember_bank_city(sender, instance, raw=False, **kwargs):
+    if raw or not instance.pk:
+        return
+    instance._stats_city = BloodBank.objects.filter(pk=instance.pk).values_list('city', flat=True).first()
+
+
+@receiver(post_save, sender=BloodBank)
+def move_bank_counters(sender, instance, raw=False, **kwargs):
+    """Move a bank's donations and stock to its new city scope when the city changes."""
+    old_city = getattr(instance, '_stats_city', None)
+    if raw or old_city is None or stats.city_scope(old_city) == stats.city_scope(instance.city):
+        return
+    deltas = _bank_city_counters(instance.pk, instance.city)
+    deltas.subtract(_bank_city_counters(instance.pk, old_city))
+    stats.apply_deltas(deltas)
+
+
+@receiver(pre_delete, sender=BloodBank)
+def detach_bank_donations(sender, instance, **kwargs):
+    """Donations outlive their bank (SET_NULL), so drop them from the bank's city scope.
+
+    The bank's inventory rows are cascade-deleted and handled by ``remove_counters``.
+    """
+    deltas = Counter()
+    deltas.subtract({
+        key: value for key, value in _bank_city_counters(instance.pk, instance.city).items()
+        if not key[1].startswith('stock:')
+    })
+    stats.apply_deltas(deltas)
+
+
+@receiver(post_save, sender=User)
+def refresh_donor_search_text(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    """A donor's ``search_text`` includes their names, which live on the user."""
+    if created or raw or (update_fields is not None and not {'username', 'first_name', 'last_name'} & set(update_fields)):
+        return
+    profile = DonorProfile.objects.filter(user=instance).only('city').first()
+    if profile is not None:
+        DonorProfile.objects.filter(pk=profile.pk).update(
+            search_text=search.normalize(instance.username, instance.first_name, instance.last_name, profile.city),
+        )
+
+
+@receiver(post_save, sender=User)
+def expire_token_claims(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Tokens issued before the change may carry a stale role or belong to a now inactive user.
+
+    New users are included: SQLite can hand out a deleted user's id again.
+    """
+    if raw or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    authentication.user_changed(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def forget_deleted_user(sender, instance, **kwargs):
+    authentication.user_changed(instance.pk)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def revoke_access_tokens(sender, instance, raw=False, **kwargs):
+    """Logging out blacklists the refresh token; its access tokens go with it."""
+    if not raw:
+        authentication.revoke(instance.token.jti)
+
+
+@receiver(post_save, sender=BloodRequest)
+def publish_request_created(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        events.request_changed(instance, 'request.created')
+
+
+@receiver(post_migrate)
+def install_search_index(sender, using='default', **kwargs):
+    if sender.name == 'core':
+        search.install_sqlite_fts((DonorProfile, BloodBank), using=using)
+
+
+def invalidate_cached_responses(sender, update_fields=None, **kwargs):
+    # logins only touch last_login, which no cached response includes
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    for namespace, models in caching.DEPENDENCIES.items():
+        if sender in models:
+            caching.invalidate(namespace)
+
+
+for model in {model for models in caching.DEPENDENCIES.values() for model in models}:
+    post_save.connect(invalidate_cached_responses, sender=model)
+    post_delete.connect(invalidate_cached_responses, sender=model)
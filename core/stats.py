@@ -0,0 +1,257 @@
+"""Dashboard and analytics figures.
+
+Counters are stored in ``StatsSnapshot`` rows, one per ``(scope, metric)``,
+where scope is ``'global'`` or ``'city:<name>'``. Model signals (see
+``core.signals``) and ``core.inventory`` push ``F()`` deltas into those rows, so
+reading a dashboard is a single indexed query. ``compute_counters`` recomputes
+everything with database-side aggregation and is what ``rebuild_stats`` uses to
+repair drift caused by bulk writes that bypass signals.
+"""
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+
+from . import caching
+from .models import BLOOD_GROUP_CODES, BloodInventory, BloodRequest, Donation, DonorProfile, StatsSnapshot
+
+User = get_user_model()
+
+GLOBAL = 'global'
+# present once the global scope has been built from a full recomputation
+BUILT = 'built'
+
+
+def city_scope(city):
+    city = (city or '').strip().casefold()
+    return f'city:{city}' if city else None
+
+
+def _scopes(city):
+    scope = city_scope(city)
+    return (GLOBAL, scope) if scope else (GLOBAL,)
+
+
+# Contributions of a single row to the counters. Signal handlers diff these
+# before and after a write and apply the difference.
+
+def user_counters(role):
+    return Counter({(GLOBAL, 'donor_users'): 1}) if role == 'donor' else Counter()
+
+
+def donor_counters(blood_group, city, available):
+    counters = Counter()
+    for scope in _scopes(city):
+        counters[scope, 'donors'] += 1
+        counters[scope, f'donors:{blood_group}'] += 1
+        if available:
+            counters[scope, 'donors_available'] += 1
+    return counters
+
+
+def donation_counters(units, approved, city):
+    counters = Counter()
+    for scope in _scopes(city):
+        counters[scope, 'donations'] += 1
+        if approved:
+            counters[scope, 'donations_approved'] += 1
+            counters[scope, 'units_donated'] += units
+    return counters
+
+
+def request_counters(units, status):
+    counters = Counter({(GLOBAL, 'requests'): 1, (GLOBAL, 'units_requested'): units})
+    if status in ('pending', 'approved'):
+        counters[GLOBAL, f'requests_{status}'] += 1
+    return counters
+
+
+def stock_counters(blood_group, units, city):
+    return Counter({(scope, f'stock:{blood_group}'): units for scope in _scopes(city)})
+
+
+def apply_deltas(deltas):
+    """Add each ``{(scope, metric): delta}`` to its snapshot row with an ``F()`` update."""
+    with transaction.atomic():
+        for (scope, metric), delta in sorted(deltas.items()):
+            if not delta:
+                continue
+            rows = StatsSnapshot.objects.filter(scope=scope, metric=metric)
+            if rows.update(value=F('value') + delta):
+                continue
+            try:
+                with transaction.atomic():
+                    StatsSnapshot.objects.create(scope=scope, metric=metric, value=delta)
+            except IntegrityError:
+                rows.update(value=F('value') + delta)
+
+
+def compute_counters():
+    """Recompute every counter from the source tables with a few group-by queries."""
+    counters = Counter({(GLOBAL, BUILT): 1})
+    counters[GLOBAL, 'donor_users'] = User.objects.filter(role='donor').count()
+
+    donations = (
+        Donation.objects.order_by()
+        .values('blood_bank__city')
+        .annotate(
+            n_total=Count('id'),
+            n_approved=Count('id', filter=Q(approved=True)),
+            units_approved=Sum('units', filter=Q(approved=True)),
+        )
+    )
+    for row in donations:
+        for scope in _scopes(row['blood_bank__city']):
+            counters[scope, 'donations'] += row['n_total']
+            counters[scope, 'donations_approved'] += row['n_approved']
+            counters[scope, 'units_donated'] += row['units_approved'] or 0
+
+    requests = BloodRequest.objects.aggregate(
+        n_total=Count('id'),
+        n_pending=Count('id', filter=Q(status='pending')),
+        n_approved=Count('id', filter=Q(status='approved')),
+        units=Sum('units'),
+    )
+    counters[GLOBAL, 'requests'] = requests['n_total']
+    counters[GLOBAL, 'requests_pending'] = requests['n_pending']
+    counters[GLOBAL, 'requests_approved'] = requests['n_approved']
+    counters[GLOBAL, 'units_requested'] = requests['units'] or 0
+
+    donors = (
+        DonorProfile.objects.order_by()
+        .values('city', 'blood_group')
+        .annotate(n_total=Count('id'), n_available=Count('id', filter=Q(available=True)))
+    )
+    for row in donors:
+        for scope in _scopes(row['city']):
+            counters[scope, 'donors'] += row['n_total']
+            counters[scope, f"donors:{row['blood_group']}"] += row['n_total']
+            counters[scope, 'donors_available'] += row['n_available']
+
+    stock = (
+        BloodInventory.objects.order_by()
+        .values('bank__city', 'blood_group')
+        .annotate(units=Sum('units'))
+    )
+    for row in stock:
+        for scope in _scopes(row['bank__city']):
+            counters[scope, f"stock:{row['blood_group']}"] += row['units'] or 0
+
+    return +counters
+
+
+def stored_counters():
+    return Counter({
+        (scope, metric): value
+        for scope, metric, value in StatsSnapshot.objects.values_list('scope', 'metric', 'value')
+    })
+
+
+def drift():
+    """Return ``{(scope, metric): (stored, actual)}`` for every counter that is out of date."""
+    actual = compute_counters()
+    stored = stored_counters()
+    return {
+        key: (stored[key], actual[key])
+        for key in set(actual) | set(stored)
+        if stored[key] != actual[key] and key != (GLOBAL, BUILT)
+    }
+
+
+def rebuild():
+    """Replace every snapshot row with freshly computed counters."""
+    counters = compute_counters()
+    with transaction.atomic():
+        StatsSnapshot.objects.all().delete()
+        StatsSnapshot.objects.bulk_create(
+            StatsSnapshot(scope=scope, metric=metric, value=value)
+            for (scope, metric), value in counters.items()
+        )
+    caching.invalidate('stats')
+    return counters
+
+
+def _snapshot_rows(scope):
+    return StatsSnapshot.objects.filter(scope__in={GLOBAL, scope}).values_list('scope', 'metric', 'value')
+
+
+def _scoped(counters, scope):
+    return Counter({metric: value for (s, metric), value in counters.items() if s == scope})
+
+
+def read_snapshot(scope=GLOBAL):
+    """Load the counters for ``scope`` in one query, building the snapshot on first use."""
+    counters = Counter({(s, metric): value for s, metric, value in _snapshot_rows(scope)})
+    if not counters[GLOBAL, BUILT]:
+        counters = rebuild()
+    return _scoped(counters, scope)
+
+
+async def aread_snapshot(scope=GLOBAL):
+    """``read_snapshot`` for async views."""
+    counters = Counter({(s, metric): value async for s, metric, value in _snapshot_rows(scope)})
+    if not counters[GLOBAL, BUILT]:
+        counters = await sync_to_async(rebuild)()
+    return _scoped(counters, scope)
+
+
+def _by_group(counters, prefix):
+    return {group: counters[f'{prefix}:{group}'] for group in BLOOD_GROUP_CODES}
+
+
+def analytics(city=None):
+    """Payload for ``AnalyticsView``; requests are only tracked globally."""
+    scope = city_scope(city) or GLOBAL
+    return _analytics(scope, read_snapshot(scope))
+
+
+async def aanalytics(city=None):
+    scope = city_scope(city) or GLOBAL
+    return _analytics(scope, await aread_snapshot(scope))
+
+
+def _analytics(scope, counters):
+    payload = {
+        'donations': {
+            'total': counters['donations'],
+            'approved': counters['donations_approved'],
+            'pending': counters['donations'] - counters['donations_approved'],
+            'total_units_donated': counters['units_donated'],
+        },
+        'donors': {
+            'total': counters['donors'],
+            'available': counters['donors_available'],
+            'by_blood_group': _by_group(counters, 'donors'),
+        },
+        'blood_availability': _by_group(counters, 'stock'),
+    }
+    if scope == GLOBAL:
+        total = counters['requests']
+        fulfilled = counters['requests_approved']
+        payload['requests'] = {
+            'total': total,
+            'pending': counters['requests_pending'],
+            'fulfilled': fulfilled,
+            'total_units_requested': counters['units_requested'],
+            'fulfillment_rate': round(fulfilled / total * 100, 2) if total > 0 else 0,
+        }
+    return payload
+
+
+def admin_dashboard():
+    """Payload for ``AdminDashboardView``."""
+    return _admin_dashboard(read_snapshot())
+
+
+async def aadmin_dashboard():
+    return _admin_dashboard(await aread_snapshot())
+
+
+def _admin_dashboard(counters):
+    return {
+        'total_donors': counters['donor_users'],
+        'pending_requests': counters['requests_pending'],
+        'available_units': _by_group(counters, 'stock'),
+    }
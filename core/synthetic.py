@@ -0,0 +1,171 @@
+"""Synthetic data for benchmarks and load tests.
+
+Everything is drawn from a ``random.Random(seed)``, so the same arguments
+always produce the same rows. Blood groups follow roughly their worldwide
+frequencies and donors are scattered around a handful of cities, so filters,
+``?near=`` and ``?q=`` see realistic selectivity. Rows are written with
+``bulk_create``; the dashboard counters are rebuilt once at the end.
+"""
+import datetime
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import caching, search, stats
+from .models import UNIT_FIELDS, BloodBank, BloodInventory, BloodRequest, Donation, DonorProfile
+
+User = get_user_model()
+
+# approximate share of the world population, in percent
+BLOOD_GROUP_WEIGHTS = {
+    'O+': 38.0, 'A+': 27.0, 'B+': 22.0, 'AB+': 5.0,
+    'O-': 3.0, 'A-': 2.5, 'B-': 1.5, 'AB-': 1.0,
+}
+# (name, latitude, longitude, relative population)
+CITIES = [
+    ('Dhaka', 23.8103, 90.4125, 40),
+    ('Chattogram', 22.3569, 91.7832, 15),
+    ('Khulna', 22.8456, 89.5403, 8),
+    ('Rajshahi', 24.3745, 88.6042, 7),
+    ('Sylhet', 24.8949, 91.8687, 7),
+    ('Barishal', 22.7010, 90.3535, 5),
+    ('Rangpur', 25.7439, 89.2752, 5),
+    ('Mymensingh', 24.7471, 90.4203, 5),
+    ('Cumilla', 23.4607, 91.1809, 4),
+    ('Gazipur', 23.9999, 90.4203, 4),
+]
+FIRST_NAMES = ['Rahim', 'Karim', 'Fatema', 'Ayesha', 'Hasan', 'Nusrat', 'Tanvir', 'Sadia', 'Imran', 'Farhana', 'Arif', 'Maliha']
+LAST_NAMES = ['Ahmed', 'Hossain', 'Islam', 'Rahman', 'Khan', 'Chowdhury', 'Akter', 'Sarkar', 'Uddin', 'Begum']
+PASSWORD = 'synthetic-password'
+
+
+class _Generator:
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.groups = list(BLOOD_GROUP_WEIGHTS)
+        self.group_weights = list(BLOOD_GROUP_WEIGHTS.values())
+        self.city_weights = [city[3] for city in CITIES]
+
+    def blood_group(self):
+        return self.random.choices(self.groups, self.group_weights)[0]
+
+    def city(self):
+        return self.random.choices(CITIES, self.city_weights)[0]
+
+    def point_near(self, city, spread=0.15):
+        _, latitude, longitude, _ = city
+        return (
+            round(latitude + self.random.gauss(0, spread), 6),
+            round(longitude + self.random.gauss(0, spread), 6),
+        )
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def seed(donors=0, banks=0, donations=0, requests=0, seed=1, batch_size=2000, prefix='synth'):
+    """Insert synthetic rows; returns how many of each were created.
+
+    Usernames are ``<prefix>-donor-<n>``; running again with the same prefix
+    skips users that already exist instead of failing.
+    """
+    gen = _Generator(seed)
+    created = {}
+    # every synthetic user shares one hash: PBKDF2 per row would dominate the run
+    password = make_password(PASSWORD)
+    now = timezone.now()
+
+    bank_ids = []
+    for chunk in _chunks(range(banks), batch_size):
+        rows = []
+        for n in chunk:
+            city = gen.city()
+            latitude, longitude = gen.point_near(city, spread=0.05)
+            bank = BloodBank(
+                name=f'{city[0]} Blood Bank {n + 1}', city=city[0], address=f'{n + 1} Hospital Road, {city[0]}',
+                latitude=latitude, longitude=longitude,
+            )
+            bank.update_geohash()
+            bank.update_search_text()
+            rows.append(bank)
+        with transaction.atomic():
+            BloodBank.objects.bulk_create(rows)
+            BloodInventory.objects.bulk_create(
+                BloodInventory(bank=bank, blood_group=group, units=gen.random.randint(0, 60))
+                for bank in rows for group in UNIT_FIELDS
+            )
+        bank_ids.extend(bank.pk for bank in rows)
+    created['banks'] = banks
+
+    donor_ids = []
+    for chunk in _chunks(range(donors), batch_size):
+        users, profiles = [], []
+        for n in chunk:
+            city = gen.city()
+            first, last = gen.random.choice(FIRST_NAMES), gen.random.choice(LAST_NAMES)
+            username = f'{prefix}-donor-{n + 1}'
+            user = User(
+                username=username, email=f'{username}@example.com', first_name=first, last_name=last,
+                role='donor', password=password,
+            )
+            latitude, longitude = gen.point_near(city)
+            last_donated = now.date() - datetime.timedelta(days=gen.random.randint(20, 720)) if gen.random.random() < 0.6 else None
+            profile = DonorProfile(
+                user=user, phone=f'01{gen.random.randint(300000000, 999999999)}', blood_group=gen.blood_group(),
+                city=city[0], last_donated=last_donated, available=gen.random.random() < 0.8,
+                latitude=latitude, longitude=longitude,
+            )
+            profile.update_geohash()
+            profile.search_text = search.normalize(username, first, last, city[0])
+            users.append(user)
+            profiles.append(profile)
+        with transaction.atomic():
+            User.objects.bulk_create(users, ignore_conflicts=True)
+            ids = dict(User.objects.filter(username__in=[u.username for u in users]).values_list('username', 'id'))
+            for user in users:
+                user.pk = ids[user.username]
+            DonorProfile.objects.bulk_create(profiles, ignore_conflicts=True)
+        donor_ids.extend(ids.values())
+    created['donors'] = donors
+
+    donor_ids = donor_ids or list(User.objects.filter(role='donor').values_list('pk', flat=True)[:10000])
+    bank_ids = bank_ids or list(BloodBank.objects.values_list('pk', flat=True)[:1000])
+    count = 0
+    if donor_ids:
+        for chunk in _chunks(range(donations), batch_size):
+            Donation.objects.bulk_create(
+                Donation(
+                    donor_id=gen.random.choice(donor_ids),
+                    blood_bank_id=gen.random.choice(bank_ids) if bank_ids else None,
+                    blood_group=gen.blood_group(), units=gen.random.randint(1, 2),
+                    approved=gen.random.random() < 0.7,
+                )
+                for _ in chunk
+            )
+            count += len(chunk)
+    created['donations'] = count
+
+    hospitals = list(User.objects.filter(role='hospital').values_list('pk', flat=True)[:100]) or donor_ids
+    count = 0
+    if hospitals:
+        for chunk in _chunks(range(requests), batch_size):
+            BloodRequest.objects.bulk_create(
+                BloodRequest(
+                    requester_id=gen.random.choice(hospitals), blood_group=gen.blood_group(),
+                    units=gen.random.randint(1, 4),
+                    status=gen.random.choices(['pending', 'approved', 'rejected'], [50, 40, 10])[0],
+                )
+                for _ in chunk
+            )
+            count += len(chunk)
+    created['requests'] = count
+
+    stats.rebuild()
+    for namespace in caching.DEPENDENCIES:
+        caching.invalidate(namespace)
+    return created
@@ -1,8 +1,42 @@
-from django.test import TestCase, override_settings
+import asyncio
+import datetime
+import gzip
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from importlib import import_module
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from unittest import mock, skipUnless
+
+from django.db import DatabaseError, OperationalError, connection, connections, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.urls import reverse
+from PIL import Image
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
-from .models import DonorProfile, BloodBank, Donation
+from .serializers import DonationSerializer, DonorProfileSerializer
+from .models import DonorProfile, BloodAllocation, BloodBank, BloodInventory, BloodRequest, Donation, InventoryLot, OutboxMessage
+from . import (
+    allocation, authentication, benchmark, caching, compatibility, eligibility, events, geo, importer, inventory, media, metrics,
+    notifications, photos, search, stats, synthetic,
+)
 
 User = get_user_model()
 
@@ -54,7 +88,7 @@ class CoreAPITestCase(TestCase):
         donation_id = resp.data.get('id')
 
         # record initial units
-        self.assertEqual(BloodBank.objects.get(pk=self.bank.pk).units_o_plus, 0)
+        self.assertFalse(BloodInventory.objects.filter(bank=self.bank, blood_group='O+').exists())
 
         # admin approves the donation
         login_admin = self.client.post('/api/auth/login/', {'username': 'admin', 'password': 'adminpass'}, format='json')
@@ -70,19 +104,19 @@ class CoreAPITestCase(TestCase):
         self.assertTrue(donation.approved)
 
         # bank units incremented
-        bank = BloodBank.objects.get(pk=self.bank.pk)
-        self.assertEqual(bank.units_o_plus, 2)
+        self.assertEqual(BloodInventory.objects.get(bank=self.bank, blood_group='O+').units, 2)
 
-        # check that an email was queued (locmem backend)
+        # the approval email is queued, then sent by the notifier (locmem backend)
         from django.core import mail
+        self.assertEqual(len(mail.outbox), 0)
+        call_command('run_notifier', '--once', stdout=io.StringIO())
         self.assertTrue(len(mail.outbox) >= 1)
         found = any('Your blood donation has been approved' in m.subject for m in mail.outbox)
         self.assertTrue(found)
 
     def test_blood_request_approval_decrements_bank_units(self):
         # set some units in the bank for O+
-        self.bank.units_o_plus = 5
-        self.bank.save()
+        BloodInventory.objects.create(bank=self.bank, blood_group='O+', units=5)
 
         # donor logs in and creates a blood request for 3 units
         login = self.client.post('/api/auth/login/', {'username': 'donor1', 'password': 'donorpass'}, format='json')
@@ -103,6 +137,1427 @@ class CoreAPITestCase(TestCase):
         self.assertEqual(resp2.status_code, 200)
 
         # check the bank units decreased by 3
-        bank = BloodBank.objects.get(pk=self.bank.pk)
-        self.assertEqual(bank.units_o_plus, 2)
+        self.assertEqual(BloodInventory.objects.get(bank=self.bank, blood_group='O+').units, 2)
+
+
+    def test_blood_bank_api_keeps_legacy_unit_fields(self):
+        login_admin = self.client.post('/api/auth/login/', {'username': 'admin', 'password': 'adminpass'}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {login_admin.data.get('access')}")
+
+        resp = self.client.post('/api/blood-banks/', {'name': 'North Bank', 'city': 'NorthCity', 'units_a_plus': 4, 'units_o_minus': 1}, format='json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data['units_a_plus'], 4)
+        self.assertEqual(resp.data['units_o_minus'], 1)
+        self.assertEqual(resp.data['units_b_plus'], 0)
+        bank_id = resp.data['id']
+        self.assertEqual(BloodInventory.objects.get(bank_id=bank_id, blood_group='A+').units, 4)
+
+        resp = self.client.patch(f'/api/blood-banks/{bank_id}/', {'units_a_plus': 7}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['units_a_plus'], 7)
+        self.assertEqual(resp.data['inventory']['O-'], 1)
+
+
+class AnalyticsQueryCountTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', password='adminpass', role='admin')
+        self.client.force_authenticate(self.admin)
+        cache.clear()
+        stats.rebuild()
+
+    def _seed(self, n):
+        offset = User.objects.count()
+        groups = ['A+', 'O+', 'O-', 'AB+']
+        for i in range(n):
+            user = User.objects.create_user(username=f'donor{offset + i}', password='x', role='donor')
+            group = groups[i % len(groups)]
+            DonorProfile.objects.create(user=user, blood_group=group, available=i % 2 == 0)
+            bank = BloodBank.objects.create(name=f'Bank {offset + i}', city='City')
+            BloodInventory.objects.create(bank=bank, blood_group=group, units=3)
+            Donation.objects.create(donor=user, blood_bank=bank, blood_group=group, units=2, approved=i % 2 == 0)
+            BloodRequest.objects.create(requester=user, blood_group=group, units=1, status='approved' if i % 2 else 'pending')
+
+    def test_analytics_payload(self):
+        self._seed(4)
+        resp = self.client.get('/api/analytics/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['donations'], {'total': 4, 'approved': 2, 'pending': 2, 'total_units_donated': 4})
+        self.assertEqual(resp.data['requests']['fulfilled'], 2)
+        self.assertEqual(resp.data['requests']['total_units_requested'], 4)
+        self.assertEqual(resp.data['requests']['fulfillment_rate'], 50.0)
+        self.assertEqual(resp.data['donors']['total'], 4)
+        self.assertEqual(resp.data['donors']['available'], 2)
+        self.assertEqual(resp.data['donors']['by_blood_group']['O-'], 1)
+        self.assertEqual(resp.data['donors']['by_blood_group']['B+'], 0)
+        self.assertEqual(resp.data['blood_availability']['A+'], 3)
+
+    def test_query_count_does_not_grow_with_data(self):
+        for n in (2, 20):
+            self._seed(n)
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get('/api/analytics/').status_code, 200)
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get('/api/admin/dashboard/').status_code, 200)
+
+    def test_snapshot_tracks_writes_without_drift(self):
+        self._seed(4)
+        bank = BloodBank.objects.first()
+        inventory.add_units(bank.pk, 'B-', 5)
+        allocation.allocate('B-', 2)
+        donation = Donation.objects.filter(approved=False).first()
+        donation.approved = True
+        donation.save()
+        profile = DonorProfile.objects.first()
+        profile.city = 'Elsewhere'
+        profile.save()
+        bank.city = 'Moved'
+        bank.save()
+        BloodBank.objects.last().delete()
+        BloodRequest.objects.first().delete()
+        self.assertEqual(stats.drift(), {})
+
+        resp = self.client.get('/api/analytics/', {'city': 'moved'})
+        self.assertEqual(resp.data['blood_availability']['B-'], 3)
+        self.assertNotIn('requests', resp.data)
+
+    def test_rebuild_stats_command_reports_drift(self):
+        self._seed(2)
+        DonorProfile.objects.update(available=False)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_stats', '--check', stdout=io.StringIO())
+        call_command('rebuild_stats', stdout=io.StringIO())
+        call_command('rebuild_stats', '--check', stdout=io.StringIO())
+        self.assertEqual(self.client.get('/api/analytics/').data['donors']['available'], 0)
+
+
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='donor1', password='x', role='donor')
+        self.client.force_authenticate(self.user)
+        self.bank = BloodBank.objects.create(name='Central Bank', city='TestCity')
+
+    def test_list_is_served_from_cache_until_a_write(self):
+        self.client.get('/api/blood-banks/')
+        with self.assertNumQueries(0):
+            resp = self.client.get('/api/blood-banks/', {'city': ''})
+        self.assertEqual(resp.data['results'][0]['units_o_plus'], 0)
+        self.assertEqual(caching.cache_stats()['blood-banks']['hits'], 1)
+        self.assertEqual(caching.cache_stats()['blood-banks']['misses'], 1)
+
+        inventory.add_units(self.bank.pk, 'O+', 3)
+        resp = self.client.get('/api/blood-banks/')
+        self.assertEqual(resp.data['results'][0]['units_o_plus'], 3)
+
+        BloodBank.objects.create(name='Second Bank', city='TestCity')
+        self.assertEqual(len(self.client.get('/api/blood-banks/').data['results']), 2)
+
+    def test_cache_key_depends_on_role_and_params(self):
+        admin_client = APIClient()
+        self.client.get('/api/blood-banks/', {'city': 'Test', 'name': 'Central'})
+        with self.assertNumQueries(0):
+            self.client.get('/api/blood-banks/', {'name': 'Central', 'city': 'Test'})
+        admin = User.objects.create_user(username='admin', password='x', role='admin')
+        admin_client.force_authenticate(admin)
+        with self.assertNumQueries(2):
+            admin_client.get('/api/blood-banks/', {'name': 'Central', 'city': 'Test'})
+
+
+    def test_conditional_get_is_answered_before_the_view_runs(self):
+        resp = self.client.get('/api/blood-banks/')
+        etag = resp['ETag']
+        self.assertIn('must-revalidate', resp['Cache-Control'])
+        self.assertIn('Authorization', resp['Vary'])
+        with self.assertNumQueries(0):
+            resp = self.client.get('/api/blood-banks/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['ETag'], etag)
+        self.assertEqual(self.client.get('/api/blood-banks/', HTTP_IF_MODIFIED_SINCE=resp['Last-Modified']).status_code, 304)
+        self.assertNotEqual(self.client.get('/api/blood-banks/', {'city': 'Test'})['ETag'], etag)
+
+        inventory.add_units(self.bank.pk, 'O+', 3)
+        resp = self.client.get('/api/blood-banks/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+
+        self.client.get('/api/analytics/')  # builds the stats snapshot, a write
+        etag = self.client.get('/api/analytics/')['ETag']
+        self.assertEqual(self.client.get('/api/analytics/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        cache.clear()
+        self.assertEqual(self.client.get('/api/analytics/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+class PaginationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='donor1', password='x', role='donor')
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_pages_cover_every_row_once(self):
+        # identical timestamps force the id tie-breaker to do the work
+        Donation.objects.bulk_create([Donation(donor=self.user, blood_group='A+', units=1) for _ in range(7)])
+        Donation.objects.update(created_at=Donation.objects.first().created_at)
+        seen = []
+        url = '/api/donations/?page_size=3'
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            seen.extend(row['id'] for row in resp.data['results'])
+            url = resp.data['next']
+        self.assertEqual(seen, sorted(Donation.objects.values_list('id', flat=True), reverse=True))
+
+    def test_invalid_cursor_is_404(self):
+        self.assertEqual(self.client.get('/api/donations/', {'cursor': 'garbage'}).status_code, 404)
+
+    def test_fields_param_limits_output(self):
+        DonorProfile.objects.create(user=self.user, blood_group='O-', city='X')
+        resp = self.client.get('/api/donor-profiles/', {'fields': 'id,blood_group'})
+        self.assertEqual(set(resp.data['results'][0]), {'id', 'blood_group'})
+        resp = self.client.get('/api/donor-profiles/')
+        self.assertIn('user', resp.data['results'][0])
+        self.assertIn('photo_url', resp.data['results'][0])
+
+
+class FlatSerializationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='donor1', password='x', role='donor')
+        self.client.force_authenticate(self.user)
+        self.bank = BloodBank.objects.create(name='Central Bank', city='TestCity')
+
+    def _instance_data(self, serializer_class, instances, **context):
+        request = mock.Mock(method='GET', query_params=context, build_absolute_uri=lambda url: 'http://testserver' + url)
+        return json.loads(json.dumps(serializer_class(instances, many=True, context={'request': request}).data))
+
+    def test_list_matches_serializer_with_one_query(self):
+        for n in range(5):
+            user = User.objects.create_user(username=f'd{n}', first_name='Rahim', password='x')
+            DonorProfile.objects.create(
+                user=user, blood_group='A+', city='Dhaka', latitude=23.8, longitude=90.4,
+                last_donated=datetime.date(2024, 1, n + 1), photo='profiles/p.jpg' if n % 2 else None,
+            )
+            Donation.objects.create(donor=user, blood_bank=self.bank if n % 2 else None, blood_group='O+', units=1)
+
+        # everyone's donations
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='x', role='admin'))
+        for url, model, serializer_class in (
+            ('/api/donor-profiles/', DonorProfile, DonorProfileSerializer),
+            ('/api/donations/', Donation, DonationSerializer),
+        ):
+            with self.assertNumQueries(1):
+                resp = self.client.get(url)
+            results = json.loads(resp.content)['results']
+            by_id = {row['id']: row for row in self._instance_data(serializer_class, model.objects.all())}
+            self.assertEqual(len(results), 5)
+            for row in results:
+                self.assertEqual(row, by_id[row['id']])
+
+        resp = self.client.get('/api/donor-profiles/', {'fields': 'id,user,photo_url'})
+        row = resp.data['results'][0]
+        self.assertEqual(set(row), {'id', 'user', 'photo_url'})
+        self.assertEqual(row['user']['first_name'], 'Rahim')
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        for n in range(30):
+            BloodRequest.objects.create(requester=self.user, blood_group='B+', units=1)
+        for size in (1, 30):
+            with self.assertNumQueries(1):
+                resp = self.client.get('/api/blood-requests/', {'page_size': size})
+            self.assertEqual(len(resp.data['results']), size)
+        self.assertEqual(resp.data['results'][0]['requester']['username'], 'donor1')
+
+    def test_duplicate_profile_is_rejected_by_the_unique_column(self):
+        DonorProfile.objects.create(user=self.user, blood_group='A+')
+        serializer = DonorProfileSerializer(data={'blood_group': 'B+'})
+        self.assertTrue(serializer.is_valid())
+        with self.assertRaises(ValidationError):
+            serializer.save(user=self.user)
+        self.assertEqual(DonorProfile.objects.get(user=self.user).blood_group, 'A+')
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        self.donor = User.objects.create_user(username='donor1', password='x', role='donor')
+        bank = BloodBank.objects.create(name='Central Bank', city='TestCity')
+        Donation.objects.create(donor=self.donor, blood_bank=bank, blood_group='O+', units=2, approved=True)
+        Donation.objects.create(donor=self.donor, blood_group='O+', units=1)
+        Donation.objects.create(donor=self.admin, blood_group='A+', units=1)
+        BloodRequest.objects.create(requester=self.donor, blood_group='B-', units=3)
+
+    def _body(self, resp):
+        return b''.join(resp.streaming_content).decode()
+
+    def test_user_csv_export_streams_own_rows(self):
+        self.client.force_authenticate(self.donor)
+        resp = self.client.get('/api/donations/export/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        lines = self._body(resp).splitlines()
+        self.assertEqual(lines[0], 'Date,Blood Group,Units,Blood Bank,Status')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].endswith('O+,2,Central Bank,Approved'))
+        self.assertTrue(lines[2].endswith('O+,1,N/A,Pending'))
+
+        resp = self.client.get('/api/requests/export/', {'output': 'ndjson'})
+        record = json.loads(self._body(resp))
+        self.assertEqual(record['units'], 3)
+        self.assertEqual(record['status'], 'pending')
+
+    def test_admin_export_gzip_and_date_range(self):
+        self.client.force_authenticate(self.donor)
+        self.assertEqual(self.client.get('/api/admin/export/donations/').status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        resp = self.client.get('/api/admin/export/donations/', {'output': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        records = [json.loads(line) for line in gzip.decompress(b''.join(resp.streaming_content)).splitlines()]
+        self.assertEqual(len(records), 3)
+        self.assertEqual({r['donor__username'] for r in records}, {'admin', 'donor1'})
+
+        resp = self.client.get('/api/admin/export/requests/', {'from': '2000-01-01', 'to': '2000-12-31'})
+        self.assertEqual(self._body(resp).splitlines(), ['Requester,Date,Blood Group,Units,Status'])
+        self.assertEqual(self.client.get('/api/admin/export/requests/', {'from': 'soon'}).status_code, 400)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', NOTIFY_BCC_BATCH_SIZE=2)
+class NotificationQueueTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.hospital = User.objects.create_user(username='hospital', password='x', role='hospital')
+        for i in range(5):
+            donor = User.objects.create_user(username=f'donor{i}', email=f'donor{i}@example.com', password='x')
+            DonorProfile.objects.create(user=donor, blood_group='O-' if i < 3 else 'A+')
+
+    def test_request_creation_only_enqueues(self):
+        from django.core import mail
+        self.client.force_authenticate(self.hospital)
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.post('/api/blood-requests/', {'blood_group': 'O-', 'units': 1}, format='json')
+        self.assertEqual(resp.status_code, 201)
+        # donors are not looked up in the request thread
+        self.assertFalse([q for q in queries.captured_queries if 'core_donorprofile' in q['sql']])
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(notifications.process_batch(), 1)
+        # three matching donors in BCC batches of two, nobody in To: but the sender
+        self.assertEqual([sorted(m.bcc) for m in mail.outbox], [['donor0@example.com', 'donor1@example.com'], ['donor2@example.com']])
+        self.assertTrue(all(m.to == ['no-reply@example.com'] for m in mail.outbox))
+        self.assertEqual(OutboxMessage.objects.get().status, 'sent')
+
+    def test_failed_sends_are_retried_with_backoff(self):
+        outbox = notifications.enqueue('Hi', 'Body', recipients=['x@example.com'])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('down')):
+            self.assertEqual(notifications.process_batch(), 0)
+        outbox.refresh_from_db()
+        self.assertEqual((outbox.status, outbox.attempts, outbox.last_error), ('pending', 1, 'down'))
+        self.assertGreater(outbox.next_attempt_at, timezone.now())
+        # not due yet
+        self.assertEqual(notifications.process_batch(), 0)
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(notifications.process_batch(), 1)
+
+
+class AllocationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        self.client.force_authenticate(self.admin)
+        self.banks = [BloodBank.objects.create(name=f'Bank {i}', city='City') for i in range(3)]
+
+    def _stock(self):
+        return list(BloodInventory.objects.filter(blood_group='O+').order_by('bank_id').values_list('units', flat=True))
+
+    def test_request_is_split_across_banks_in_order(self):
+        for bank, units in zip(self.banks, (2, 1, 4)):
+            BloodInventory.objects.create(bank=bank, blood_group='O+', units=units)
+        req = BloodRequest.objects.create(requester=self.admin, blood_group='O+', units=5)
+        resp = self.client.post(f'/api/blood-requests/{req.pk}/approve/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            [(a['bank'], a['units']) for a in resp.data['allocations']],
+            [(self.banks[0].pk, 2), (self.banks[1].pk, 1), (self.banks[2].pk, 2)],
+        )
+        self.assertEqual(self._stock(), [0, 0, 2])
+
+    def test_single_bank_preferred_and_approval_is_idempotent(self):
+        for bank, units in zip(self.banks, (2, 6, 4)):
+            BloodInventory.objects.create(bank=bank, blood_group='O+', units=units)
+        req = BloodRequest.objects.create(requester=self.admin, blood_group='O+', units=3)
+        self.assertEqual(self.client.post(f'/api/blood-requests/{req.pk}/approve/').status_code, 200)
+        resp = self.client.post(f'/api/blood-requests/{req.pk}/approve/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn('allocations', resp.data)
+        self.assertEqual(self._stock(), [2, 3, 4])
+        self.assertEqual(self.client.post(f'/api/blood-requests/{req.pk}/reject/').status_code, 409)
+
+    def test_insufficient_stock_rolls_back(self):
+        BloodInventory.objects.create(bank=self.banks[0], blood_group='O+', units=2)
+        req = BloodRequest.objects.create(requester=self.admin, blood_group='O+', units=3)
+        self.assertEqual(self.client.post(f'/api/blood-requests/{req.pk}/approve/').status_code, 400)
+        req.refresh_from_db()
+        self.assertEqual(req.status, 'pending')
+        self.assertEqual(self._stock(), [2])
+        self.assertEqual(stats.drift(), {})
+
+
+    def test_stock_rows_are_locked_up_front_in_key_order(self):
+        def lock_before_update(queries):
+            sql = [q['sql'] for q in queries]
+            lock = next(i for i, q in enumerate(sql) if q.startswith('SELECT') and 'FROM "core_bloodinventory"' in q)
+            update = next(i for i, q in enumerate(sql) if q.startswith('UPDATE "core_bloodinventory"'))
+            self.assertIn('ORDER BY "core_bloodinventory"."id" ASC', sql[lock])
+            self.assertLess(lock, update)
+
+        for bank, group, units in [(self.banks[2], 'O+', 1), (self.banks[0], 'O-', 5), (self.banks[1], 'O+', 1)]:
+            BloodInventory.objects.create(bank=bank, blood_group=group, units=units)
+        req = BloodRequest.objects.create(requester=self.admin, blood_group='O+', units=4)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.post(f'/api/blood-requests/{req.pk}/approve/').status_code, 200)
+        lock_before_update(queries)
+
+        donations = [
+            Donation.objects.create(donor=self.admin, blood_bank=bank, blood_group=group, units=1)
+            for bank, group in [(self.banks[2], 'O+'), (self.banks[0], 'O-')]
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/api/donations/approve-batch/', {'ids': [d.pk for d in donations]}, format='json')
+        lock_before_update(queries)
+        self.assertEqual(
+            list(BloodInventory.objects.order_by('pk').values_list('units', flat=True)), [1, 4, 0],
+        )
+
+
+class InventoryLotTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        self.client.force_authenticate(self.admin)
+        self.banks = [BloodBank.objects.create(name=f'Bank {i}', city='City') for i in range(2)]
+
+    def _donate(self, bank, units, days_ago):
+        donation = Donation.objects.create(donor=self.admin, blood_bank=bank, blood_group='O+', units=units)
+        Donation.objects.filter(pk=donation.pk).update(created_at=timezone.now() - datetime.timedelta(days=days_ago))
+        return donation
+
+    def _lots(self):
+        return list(InventoryLot.objects.order_by('pk').values_list('bank_id', 'units', 'expired'))
+
+    def test_requests_use_stock_that_expires_first(self):
+        fresh = self._donate(self.banks[0], 3, days_ago=1)
+        old = self._donate(self.banks[1], 1, days_ago=30)
+        older = self._donate(self.banks[1], 1, days_ago=35)
+        resp = self.client.post('/api/donations/approve-batch/', {'ids': [fresh.pk, old.pk, older.pk]}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.client.post(f'/api/donations/{self._donate(self.banks[0], 1, 0).pk}/approve/').status_code, 200)
+        lot = InventoryLot.objects.get(donation=older)
+        self.assertEqual(lot.expires_on - lot.collected_on, datetime.timedelta(days=inventory.SHELF_LIFE_DAYS))
+
+        # bank 1 holds only two units, but they expire first
+        req = BloodRequest.objects.create(requester=self.admin, blood_group='O+', units=2)
+        resp = self.client.post(f'/api/blood-requests/{req.pk}/approve/')
+        self.assertEqual([(a['bank'], a['units']) for a in resp.data['allocations']], [(self.banks[1].pk, 2)])
+        req = BloodRequest.objects.create(requester=self.admin, blood_group='O+', units=1)
+        self.client.post(f'/api/blood-requests/{req.pk}/approve/')
+        self.assertEqual(self._lots(), [
+            (self.banks[0].pk, 2, False), (self.banks[1].pk, 0, False), (self.banks[1].pk, 0, False),
+            (self.banks[0].pk, 1, False),
+        ])
+
+    def test_expire_units_retires_lots_in_batches(self):
+        for days_ago in (50, 45, 43, 10):
+            donation = self._donate(self.banks[0], 2, days_ago)
+            self.client.post(f'/api/donations/{donation.pk}/approve/')
+        # one unit taken by hand, without lot bookkeeping
+        BloodInventory.objects.filter(bank=self.banks[0]).update(units=7)
+        stats.rebuild()
+        out = io.StringIO()
+        call_command('expire_units', '--batch-size', '2', stdout=out)
+        self.assertIn('Expired 3 lot(s), 6 unit(s)', out.getvalue())
+        self.assertEqual([expired for _, _, expired in self._lots()], [True, True, True, False])
+        self.assertEqual(BloodInventory.objects.get(bank=self.banks[0]).units, 1)
+        self.assertEqual(stats.drift(), {})
+        self.assertEqual(inventory.expire_lots(), (0, 0))
+
+    def test_expiry_locks_stock_before_lots_like_approvals(self):
+        for days_ago in (50, 45):
+            self.client.post(f'/api/donations/{self._donate(self.banks[days_ago % 2], 2, days_ago).pk}/approve/')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(inventory.expire_lots(), (2, 4))
+        sql = [q['sql'] for q in queries]
+        stock = next(i for i, q in enumerate(sql) if q.startswith('SELECT') and 'FROM "core_bloodinventory"' in q)
+        lots = next(i for i, q in enumerate(sql) if q.startswith('UPDATE "core_inventorylot"'))
+        self.assertIn('ORDER BY "core_bloodinventory"."id" ASC', sql[stock])
+        self.assertLess(stock, lots)
+        self.assertEqual(list(BloodInventory.objects.values_list('units', flat=True)), [0, 0])
+
+
+class ConcurrentAllocationTestCase(TransactionTestCase):
+    """Many threads approving against limited stock must never oversell it."""
+
+    def test_parallel_approvals_do_not_oversell(self):
+        admin = User.objects.create_user(username='admin', password='x', role='admin')
+        banks = [BloodBank.objects.create(name=f'Bank {i}', city='City') for i in range(3)]
+        for bank in banks:
+            BloodInventory.objects.create(bank=bank, blood_group='A-', units=5)
+        # 20 requests for 2 units each against 15 units in stock; each approved twice
+        requests = [BloodRequest.objects.create(requester=admin, blood_group='A-', units=2) for _ in range(20)]
+        results = []
+
+        def approve(req):
+            try:
+                for attempt in range(50):
+                    try:
+                        with transaction.atomic():
+                            results.append(allocation.approve_request(BloodRequest.objects.get(pk=req.pk)))
+                        return
+                    except allocation.InsufficientStock:
+                        results.append('insufficient')
+                        return
+                    except OperationalError:
+                        # SQLite reports lock contention instead of blocking
+                        time.sleep(0.01 * (attempt + 1))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=approve, args=(req,)) for req in requests * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 40)
+        approved = BloodRequest.objects.filter(status='approved').count()
+        allocated = sum(BloodAllocation.objects.values_list('units', flat=True))
+        remaining = sum(BloodInventory.objects.values_list('units', flat=True))
+        self.assertEqual(approved, 7)
+        self.assertEqual(allocated, approved * 2)
+        self.assertEqual(remaining, 15 - allocated)
+        self.assertEqual(BloodAllocation.objects.values('request').distinct().count(), approved)
+
+
+class EligibilityTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.bank = BloodBank.objects.create(name='Central', city='Dhaka')
+        self.profiles = {}
+        for name in ('donor1', 'donor2', 'donor3'):
+            user = User.objects.create_user(username=name, password='x', role='donor', email=f'{name}@example.com')
+            self.profiles[name] = DonorProfile.objects.create(user=user, blood_group='O-', city='Dhaka')
+
+    def _donate(self, name, component='whole_blood', days_ago=0):
+        donation = Donation.objects.create(
+            donor=self.profiles[name].user, blood_bank=self.bank, blood_group='O-', component=component, units=1,
+        )
+        Donation.objects.filter(pk=donation.pk).update(created_at=timezone.now() - datetime.timedelta(days=days_ago))
+        return donation
+
+    def test_approval_defers_the_donor_and_matching_skips_them(self):
+        donation = self._donate('donor1')
+        self.client.post(f'/api/donations/{donation.id}/approve/')
+        batch_donation = self._donate('donor2', component='platelets')
+        self.client.post('/api/donations/approve-batch/', {'ids': [batch_donation.id]}, format='json')
+
+        today = timezone.localdate()
+        self.assertEqual(
+            list(DonorProfile.objects.order_by('user__username').values_list('last_donated', 'next_eligible_on', 'available')),
+            [(today, today + datetime.timedelta(days=90), False), (today, today + datetime.timedelta(days=14), False),
+             (None, None, True)],
+        )
+        self.assertEqual(stats.drift(), {})
+        resp = self.client.get('/api/donor-profiles/compatible/', {'recipient': 'O-'})
+        self.assertEqual([row['user']['username'] for row in resp.data['results']], ['donor3'])
+        self.assertEqual(list(notifications.resolve_audience('donors:O-')), ['donor3@example.com'])
+
+    def test_nightly_refresh_restores_only_deferred_donors(self):
+        self._donate('donor1', component='plasma', days_ago=30)
+        self._donate('donor2', days_ago=10)
+        Donation.objects.update(approved=True)
+        DonorProfile.objects.filter(pk=self.profiles['donor3'].pk).update(last_donated=timezone.localdate())
+        stats.rebuild()
+
+        self.assertEqual(eligibility.refresh(), (3, 2, 0))
+        self.assertEqual(
+            list(DonorProfile.objects.order_by('user__username').values_list('available', 'deferred')),
+            [(True, False), (False, True), (False, True)],
+        )
+        # donor2 opts out while deferred; their choice outlasts the deferral
+        self.client.force_authenticate(self.profiles['donor2'].user)
+        self.client.patch(f"/api/donor-profiles/{self.profiles['donor2'].pk}/", {'available': False})
+
+        later = timezone.localdate() + datetime.timedelta(days=91)
+        self.assertEqual(eligibility.refresh(today=later), (0, 0, 1))
+        self.assertEqual(
+            list(DonorProfile.objects.order_by('user__username').values_list('available', flat=True)), [True, False, True],
+        )
+        self.assertEqual(stats.drift(), {})
+        self.assertEqual(eligibility.refresh(today=later), (0, 0, 0))
+
+    def test_migration_fills_dates_from_approved_donations(self):
+        # the migration adds ``component``, so everything before it is whole blood
+        self._donate('donor1', days_ago=5)
+        self._donate('donor2', days_ago=200)
+        Donation.objects.update(approved=True)
+        stats.rebuild()
+
+        migration = import_module('core.migrations.0012_donor_eligibility')
+        state = MigrationLoader(connection).project_state(('core', '0012_donor_eligibility'))
+        migration.fill_eligibility(state.apps, None)
+
+        today = timezone.localdate()
+        self.assertEqual(
+            list(DonorProfile.objects.order_by('user__username').values_list('next_eligible_on', 'available', 'deferred')),
+            [(today + datetime.timedelta(days=85), False, True),
+             (today - datetime.timedelta(days=110), True, False), (None, True, False)],
+        )
+        self.assertEqual(stats.drift(), {})
+        # the same answer the app itself would give today
+        self.assertEqual(eligibility.refresh(), (0, 0, 0))
+
+
+class CompatibilityTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='hospital', password='x', role='hospital')
+        self.client.force_authenticate(self.user)
+
+    def test_matrix(self):
+        self.assertEqual(compatibility.compatible_donor_groups('AB+'), compatibility.GROUP_ORDER)
+        self.assertEqual(compatibility.compatible_donor_groups('O-'), ('O-',))
+        self.assertEqual(compatibility.compatible_donor_groups('A+'), ('A+', 'A-', 'O+', 'O-'))
+        self.assertEqual(compatibility.compatible_donor_groups('B-'), ('B-', 'O-'))
+        self.assertTrue(compatibility.can_receive('AB-', 'A-'))
+        self.assertFalse(compatibility.can_receive('AB-', 'A+'))
+        self.assertEqual(compatibility.normalize_group('ab '), 'AB+')
+
+    def test_compatible_endpoint_ranks_exact_group_first(self):
+        for i, (group, city, available) in enumerate([
+            ('O-', 'Dhaka', True), ('A+', 'Dhaka', True), ('B+', 'Dhaka', True),
+            ('A+', 'Sylhet', True), ('A-', 'dhaka', False), ('O+', 'DHAKA', True),
+        ]):
+            donor = User.objects.create_user(username=f'donor{i}', password='x')
+            DonorProfile.objects.create(user=donor, blood_group=group, city=city, available=available)
+        resp = self.client.get('/api/donor-profiles/compatible/', {'recipient': 'A+', 'city': 'dhaka'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([d['blood_group'] for d in resp.data['results']], ['A+', 'O+', 'O-'])
+
+        resp = self.client.get('/api/donor-profiles/compatible/', {'recipient': 'A+', 'city': 'dhaka', 'page_size': 2})
+        resp = self.client.get(resp.data['next'])
+        self.assertEqual([d['blood_group'] for d in resp.data['results']], ['O-'])
+        self.assertEqual(self.client.get('/api/donor-profiles/compatible/', {'recipient': 'C+'}).status_code, 400)
+
+    def test_approval_falls_back_to_compatible_groups(self):
+        bank = BloodBank.objects.create(name='Bank', city='City')
+        BloodInventory.objects.create(bank=bank, blood_group='O-', units=5)
+        BloodInventory.objects.create(bank=bank, blood_group='A-', units=1)
+        BloodInventory.objects.create(bank=bank, blood_group='A+', units=1)
+        self.assertEqual(allocation.allocate('A+', 4), [(bank.pk, 'A+', 1), (bank.pk, 'A-', 1), (bank.pk, 'O-', 2)])
+        with self.assertRaises(allocation.InsufficientStock):
+            allocation.allocate('B+', 4)
+
+
+class NearbySearchTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='hospital', password='x', role='hospital')
+        self.client.force_authenticate(self.user)
+
+    def test_covering_cells_contain_every_point_in_radius(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            lat, lng = rng.uniform(-70, 70), rng.uniform(-179, 179)
+            radius = rng.choice([0.5, 3, 10, 40, 150])
+            cells = geo.covering_cells(lat, lng, radius)
+            for _ in range(10):
+                # a point roughly ``radius`` away in a random direction
+                dlat = rng.uniform(-1, 1) * radius / geo.KM_PER_DEGREE
+                dlng = rng.uniform(-1, 1) * radius / (geo.KM_PER_DEGREE * geo.math.cos(geo.math.radians(lat)))
+                plat, plng = lat + dlat, (lng + dlng + 180) % 360 - 180
+                if geo.haversine_km(lat, lng, plat, plng) <= radius:
+                    self.assertTrue(any(geo.encode(plat, plng).startswith(c) for c in cells))
+
+    def test_banks_near_point_nearest_first(self):
+        for name, lat, lng in [
+            ('Gulshan', 23.7925, 90.4078), ('Dhanmondi', 23.7461, 90.3742),
+            ('Savar', 23.8583, 90.2667), ('Chattogram', 22.3569, 91.7832), ('Unknown', None, None),
+        ]:
+            BloodBank.objects.create(name=name, city='X', latitude=lat, longitude=lng)
+        resp = self.client.get('/api/blood-banks/', {'near': '23.7500,90.3800', 'radius_km': 25})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([b['name'] for b in resp.data['results']], ['Dhanmondi', 'Gulshan', 'Savar'])
+        self.assertLess(resp.data['results'][0]['distance_km'], 1)
+
+        resp = self.client.get('/api/blood-banks/', {'near': '23.7500,90.3800', 'radius_km': 25, 'page_size': 2})
+        self.assertEqual(len(resp.data['results']), 2)
+        resp = self.client.get(resp.data['next'])
+        self.assertEqual([b['name'] for b in resp.data['results']], ['Savar'])
+        self.assertIsNone(resp.data['next'])
+
+        self.assertEqual(self.client.get('/api/blood-banks/', {'near': 'dhaka'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/blood-banks/', {'near': '23.75,90.38', 'radius_km': 5000}).status_code, 400)
+
+    def test_donors_near_point_keep_other_filters(self):
+        for i, (group, lat, lng) in enumerate([('A+', 23.75, 90.38), ('B+', 23.76, 90.39), ('A+', 22.35, 91.78)]):
+            donor = User.objects.create_user(username=f'donor{i}', password='x')
+            DonorProfile.objects.create(user=donor, blood_group=group, latitude=lat, longitude=lng)
+        profile = DonorProfile.objects.get(user__username='donor0')
+        self.assertEqual(profile.geohash, geo.encode(23.75, 90.38))
+        resp = self.client.get('/api/donor-profiles/', {'near': '23.75,90.38', 'blood_group': 'A+'})
+        self.assertEqual([d['user']['username'] for d in resp.data['results']], ['donor0'])
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='hospital', password='x', role='hospital')
+        self.client.force_authenticate(self.user)
+
+    def test_normalize_and_score(self):
+        self.assertEqual(search.normalize('  Dhākā ', 'MIRPUR'), 'dhaka mirpur')
+        self.assertEqual(search.score('mir', 'dhaka mirpur'), 1.0)
+        self.assertGreaterEqual(search.score('dhkaa', 'dhaka mirpur'), search.MIN_SCORE)
+        self.assertLess(search.score('sylhet', 'dhaka mirpur'), search.MIN_SCORE)
+
+    def test_banks_ranked_with_typos_and_prefixes(self):
+        for name, city in [('Dhaka Medical', 'Dhaka'), ('Square Hospital', 'Dhākā'), ('Osmani Medical', 'Sylhet')]:
+            BloodBank.objects.create(name=name, city=city)
+        resp = self.client.get('/api/blood-banks/', {'q': 'dhkaa'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual({b['name'] for b in resp.data['results']}, {'Dhaka Medical', 'Square Hospital'})
+
+        resp = self.client.get('/api/blood-banks/', {'q': 'medical sy'})
+        self.assertEqual(resp.data['results'][0]['name'], 'Osmani Medical')
+        self.assertEqual(resp.data['results'][0]['score'], 1.0)
+
+        resp = self.client.get('/api/blood-banks/', {'q': 'sq', 'page_size': 1})
+        self.assertEqual([b['name'] for b in resp.data['results']], ['Square Hospital'])
+        self.assertIsNone(resp.data['next'])
+        self.assertEqual(self.client.get('/api/blood-banks/', {'q': '  '}).status_code, 400)
+
+    def test_query_and_near_together(self):
+        BloodBank.objects.create(name='Dhaka Medical', city='Dhaka', latitude=23.7257, longitude=90.3976)
+        BloodBank.objects.create(name='Mirpur Medical', city='Dhaka', latitude=23.8069, longitude=90.3687)
+        BloodBank.objects.create(name='Comilla Medical', city='Comilla', latitude=23.4607, longitude=91.1809)
+        BloodBank.objects.create(name='Unmapped Medical', city='Dhaka')
+        resp = self.client.get('/api/blood-banks/', {'q': 'medical', 'near': '23.7260,90.3980', 'radius_km': 5})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([b['name'] for b in resp.data['results']], ['Dhaka Medical'])
+        self.assertLess(resp.data['results'][0]['distance_km'], 1)
+        self.assertEqual(resp.data['results'][0]['score'], 1.0)
+
+        resp = self.client.get('/api/blood-banks/', {'q': 'medical', 'near': '23.7260,90.3980', 'radius_km': 20})
+        self.assertEqual([b['name'] for b in resp.data['results']], ['Dhaka Medical', 'Mirpur Medical'])
+        self.assertEqual(self.client.get('/api/blood-banks/', {'q': 'medical', 'near': 'x'}).status_code, 400)
+
+    def test_filters_apply_before_the_candidate_limit(self):
+        BloodBank.objects.bulk_create(
+            BloodBank(name=f'Medical {n}', city='Dhaka', search_text=search.normalize(f'Medical {n}', 'Dhaka'))
+            for n in range(search.CANDIDATE_LIMIT + 50)
+        )
+        bank = BloodBank.objects.create(name='Medical College', city='Sylhet')
+        candidates = search.candidates(BloodBank.objects.filter(city='Sylhet'), 'medical')
+        self.assertEqual([pk for pk, _ in candidates], [bank.pk])
+
+    def test_index_follows_updates_and_user_renames(self):
+        bank = BloodBank.objects.create(name='Central', city='Khulna')
+        bank.city = 'Rajshahi'
+        bank.save(update_fields=['city'])
+        self.assertEqual(search.rank(BloodBank.objects.all(), 'khulna'), [])
+        self.assertEqual([pk for pk, _ in search.rank(BloodBank.objects.all(), 'rajshahi')], [bank.pk])
+
+        donor = User.objects.create_user(username='donor', password='x')
+        DonorProfile.objects.create(user=donor, blood_group='A+', city='Barishal')
+        donor.first_name = 'Rahim'
+        donor.save()
+        resp = self.client.get('/api/donor-profiles/', {'q': 'rahmi barishal'})
+        self.assertEqual([d['user']['username'] for d in resp.data['results']], ['donor'])
+
+
+class BulkImportTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        self.client.force_authenticate(self.admin)
+
+    def test_donor_csv_import_reports_bad_rows(self):
+        User.objects.create_user(username='existing', password='x', first_name='Old')
+        body = (
+            'username,email,password,first_name,blood_group,city,available\n'
+            'rahim,rahim@example.com,secret123,Rahim,A+,Dhaka,yes\n'
+            'karim,,,Karim,Q+,Dhaka,yes\n'
+            'existing,,,New,B-,Sylhet,no\n'
+            'rahim,,,Dup,O+,Dhaka,yes\n'
+        )
+        resp = self.client.post('/api/bulk/donors/', body, content_type='text/csv')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual((resp.data['created'], resp.data['skipped'], resp.data['failed']), (1, 1, 2))
+        self.assertEqual([e['line'] for e in resp.data['errors']], [3, 5])
+        rahim = User.objects.get(username='rahim')
+        self.assertTrue(rahim.check_password('secret123'))
+        self.assertEqual(rahim.donor_profile.search_text, 'rahim rahim dhaka')
+        self.assertFalse(DonorProfile.objects.filter(user__username='existing').exists())
+        self.assertEqual(stats.read_snapshot()['donors'], 1)
+
+        resp = self.client.post('/api/bulk/donors/?on_conflict=update', body, content_type='text/csv')
+        self.assertEqual((resp.data['created'], resp.data['updated']), (0, 2))
+        existing = DonorProfile.objects.select_related('user').get(user__username='existing')
+        self.assertEqual((existing.user.first_name, existing.blood_group, existing.available), ('New', 'B-', False))
+        self.assertTrue(User.objects.get(username='rahim').check_password('secret123'))
+
+    @override_settings(
+        PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], IMPORT_HASH_WORKERS=4,
+    )
+    def test_api_import_hashes_in_the_request_thread(self):
+        body = 'username,password,blood_group,city\n' + ''.join(
+            f'donor{n},secret{n},A+,Dhaka\n' for n in range(importer.POOL_THRESHOLD)
+        )
+        with mock.patch.object(importer, 'ProcessPoolExecutor') as pool:
+            resp = self.client.post('/api/bulk/donors/', body, content_type='text/csv')
+        self.assertEqual(resp.data['created'], importer.POOL_THRESHOLD)
+        pool.assert_not_called()
+        self.assertTrue(User.objects.get(username='donor3').check_password('secret3'))
+
+    def test_donor_import_leaves_other_roles_alone_and_sets_eligibility(self):
+        User.objects.create_user(username='clinic', password='x', role='hospital', email='clinic@example.com')
+        recent = timezone.localdate() - datetime.timedelta(days=10)
+        body = (
+            'username,email,blood_group,last_donated\n'
+            'clinic,evil@example.com,A+,\n'
+            f'rahim,,O+,{recent.isoformat()}\n'
+        )
+        for policy in ('skip', 'update'):
+            resp = self.client.post(f'/api/bulk/donors/?on_conflict={policy}', body, content_type='text/csv')
+            self.assertEqual(resp.data['failed'], 1)
+            self.assertIn('hospital', resp.data['errors'][0]['error'])
+        clinic = User.objects.get(username='clinic')
+        self.assertEqual((clinic.role, clinic.email), ('hospital', 'clinic@example.com'))
+        self.assertFalse(DonorProfile.objects.filter(user=clinic).exists())
+
+        rahim = DonorProfile.objects.get(user__username='rahim')
+        self.assertEqual(rahim.next_eligible_on, eligibility.deferral_end(recent))
+        self.assertFalse(rahim.available)
+
+    def test_bank_and_donation_ndjson_import(self):
+        banks = '\n'.join(json.dumps(row) for row in [
+            {'name': 'Central', 'city': 'Dhaka', 'units_a_plus': 4, 'latitude': 23.75, 'longitude': 90.38},
+            {'name': 'North', 'city': 'Sylhet', 'units_o_minus': -1},
+        ]) + '\nnot json\n'
+        resp = self.client.post('/api/bulk/banks/?input=ndjson', banks, content_type='application/octet-stream')
+        self.assertEqual((resp.data['created'], resp.data['failed']), (1, 2))
+        bank = BloodBank.objects.get(name='Central')
+        self.assertEqual(bank.units_by_group()['A+'], 4)
+        self.assertEqual(bank.geohash, geo.encode(23.75, 90.38))
+
+        User.objects.create_user(username='donor', password='x')
+        donations = f'{{"donor": "donor", "blood_bank": {bank.pk}, "blood_group": "A+", "units": 2}}\n{{"donor": "ghost", "blood_group": "A+"}}\n'
+        upload = SimpleUploadedFile('donations.ndjson', donations.encode(), content_type='application/x-ndjson')
+        resp = self.client.post('/api/bulk/donations/', {'file': upload}, format='multipart')
+        self.assertEqual((resp.data['created'], resp.data['failed']), (1, 1))
+        self.assertIn('ghost', resp.data['errors'][0]['error'])
+
+        hospital = User.objects.create_user(username='hospital', password='x', role='hospital')
+        self.client.force_authenticate(hospital)
+        self.assertEqual(self.client.post('/api/bulk/banks/', banks, content_type='text/csv').status_code, 403)
+
+    def test_command_hashes_passwords_in_a_pool(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('username,password,blood_group\n')
+            for i in range(4):
+                f.write(f'donor{i},pass{i},O+\n')
+        self.addCleanup(os.unlink, f.name)
+        out = io.StringIO()
+        with mock.patch.object(importer, 'POOL_THRESHOLD', 2):
+            call_command('import_data', 'donors', f.name, '--workers', '2', '--batch-size', '2', stdout=out)
+        self.assertIn('Created 4', out.getvalue())
+        self.assertTrue(User.objects.get(username='donor3').check_password('pass3'))
+
+
+class BatchApprovalTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        self.client.force_authenticate(self.admin)
+        self.bank = BloodBank.objects.create(name='Bank', city='Dhaka')
+        self.donor = User.objects.create_user(username='donor', password='x', email='donor@example.com')
+
+    def test_approve_donations_in_one_batch(self):
+        donations = [
+            Donation.objects.create(donor=self.donor, blood_bank=self.bank, blood_group=group, units=units)
+            for group, units in [('A+', 2), ('A+', 3), ('O-', 1)]
+        ]
+        done = Donation.objects.create(donor=self.donor, blood_bank=self.bank, blood_group='B+', approved=True)
+        ids = [d.pk for d in donations] + [done.pk, 999999]
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post('/api/donations/approve-batch/', {'ids': ids}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            [r['result'] for r in resp.data['results']],
+            ['approved', 'approved', 'approved', 'already_approved', 'not_found'],
+        )
+        self.assertEqual(self.bank.units_by_group()['A+'], 5)
+        self.assertEqual(OutboxMessage.objects.count(), 3)
+        outbox_inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "core_outboxmessage"')]
+        self.assertEqual(len(outbox_inserts), 1)
+        self.assertEqual(stats.drift(), {})
+
+        resp = self.client.post('/api/donations/approve-batch/', {'ids': [donations[0].pk]}, format='json')
+        self.assertEqual(resp.data['results'], [{'id': donations[0].pk, 'result': 'already_approved'}])
+        self.assertEqual(self.bank.units_by_group()['A+'], 5)
+
+    def test_approving_one_donation_twice_applies_it_once(self):
+        donation = Donation.objects.create(donor=self.donor, blood_bank=self.bank, blood_group='A+', units=2)
+        for _ in range(2):
+            resp = self.client.post(f'/api/donations/{donation.pk}/approve/')
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(resp.data['approved'])
+        self.assertEqual(self.bank.units_by_group()['A+'], 2)
+        self.assertEqual(InventoryLot.objects.filter(donation=donation).count(), 1)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        self.assertEqual(stats.drift(), {})
+
+    def test_failed_approval_changes_nothing(self):
+        donation = Donation.objects.create(donor=self.donor, blood_bank=self.bank, blood_group='A+', units=2)
+        client = APIClient(raise_request_exception=False)
+        client.force_authenticate(self.admin)
+        with mock.patch.object(inventory, 'add_lots', side_effect=DatabaseError('disk full')):
+            self.assertEqual(client.post(f'/api/donations/{donation.pk}/approve/').status_code, 500)
+        donation.refresh_from_db()
+        self.assertFalse(donation.approved)
+        self.assertEqual(self.bank.units_by_group()['A+'], 0)
+
+    def test_approve_and_reject_requests_in_batches(self):
+        BloodInventory.objects.create(bank=self.bank, blood_group='A+', units=3)
+        first, second, third = [
+            BloodRequest.objects.create(requester=self.donor, blood_group='A+', units=units) for units in (2, 2, 1)
+        ]
+        resp = self.client.post('/api/blood-requests/approve-batch/', {'ids': [first.pk, second.pk, third.pk]}, format='json')
+        self.assertEqual([r['result'] for r in resp.data['results']], ['approved', 'insufficient_stock', 'approved'])
+        self.assertEqual(self.bank.units_by_group()['A+'], 0)
+
+        resp = self.client.post('/api/blood-requests/reject-batch/', {'ids': [first.pk, second.pk]}, format='json')
+        self.assertEqual([r['result'] for r in resp.data['results']], ['already_approved', 'rejected'])
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'rejected')
+        self.assertEqual(stats.drift(), {})
+
+    def test_batch_input_is_validated(self):
+        self.assertEqual(self.client.post('/api/blood-requests/reject-batch/', {'ids': 'x'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/donations/approve-batch/', {'ids': []}, format='json').status_code, 400)
+        self.client.force_authenticate(self.donor)
+        self.assertEqual(self.client.post('/api/donations/approve-batch/', {'ids': [1]}, format='json').status_code, 403)
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        self.client.force_authenticate(self.admin)
+
+    def test_recorder_counts_repeated_statements(self):
+        with metrics.recording() as recorder:
+            for username in ('a', 'b', 'c'):
+                User.objects.filter(username=username).exists()
+            BloodBank.objects.count()
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(recorder.duplicates, 2)
+
+    def test_metrics_endpoint_reports_views(self):
+        self.client.get('/api/blood-banks/')
+        self.client.get('/api/blood-banks/')
+        resp = self.client.get('/api/metrics/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp['Content-Type'].startswith('text/plain'))
+        body = resp.content.decode()
+        self.assertIn('http_request_duration_seconds_count{view="bloodbank-list",method="GET"} 2', body)
+        self.assertIn('http_requests_total{view="bloodbank-list",method="GET",status="200"} 2', body)
+        self.assertIn('db_queries_per_request_bucket{view="bloodbank-list",method="GET",le="+Inf"} 2', body)
+        self.assertIn('http_response_bytes_total{view="bloodbank-list",method="GET"}', body)
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        with override_settings(METRICS_TOKEN='scrape'):
+            self.assertEqual(self.client.get('/api/metrics/', {'token': 'scrape'}).status_code, 200)
+            self.assertEqual(self.client.get('/api/metrics/', {'token': 'nope'}).status_code, 403)
+
+    def test_slow_requests_are_logged_with_sql(self):
+        with override_settings(METRICS_SLOW_REQUEST_MS=0), self.assertLogs('core.metrics', 'WARNING') as logs:
+            self.client.get('/api/donor-profiles/')
+        self.assertIn('donorprofile-list', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+
+class EventStreamTestCase(TestCase):
+    def setUp(self):
+        self.hospital = User.objects.create_user(username='hospital', password='x', role='hospital')
+        self.donor = User.objects.create_user(username='donor1', password='x', role='donor')
+        DonorProfile.objects.create(user=self.donor, blood_group='O-', city='Dhaka')
+
+    def test_one_fan_out_per_loop_and_per_viewer_filtering(self):
+        async def scenario():
+            broker = events.LocalBroker()
+            viewers = [
+                events.Viewer(1, 'admin'), events.Viewer(2, 'donor', 'O-'), events.Viewer(3, 'donor', 'AB+'),
+                events.Viewer(4, 'hospital'),
+            ]
+            subscriptions = [broker.subscribe(viewer) for viewer in viewers]
+            loop = asyncio.get_running_loop()
+            with mock.patch.object(loop, 'call_soon_threadsafe', wraps=loop.call_soon_threadsafe) as fan_out:
+                broker.publish(events.Event('request.created', {'id': 9}, blood_group='A+', owner_id=4))
+                broker.publish(events.Event('inventory.changed', {'bank': 1}))
+            await asyncio.sleep(0)
+            self.assertEqual(fan_out.call_count, 2)
+            received = []
+            for subscription in subscriptions:
+                received.append([subscription.queue.get_nowait().type for _ in range(subscription.queue.qsize())])
+                broker.unsubscribe(subscription)
+            self.assertEqual(broker.subscriber_count, 0)
+            return received
+
+        self.assertEqual(asyncio.run(scenario()), [
+            ['request.created', 'inventory.changed'], ['request.created'], [], ['request.created', 'inventory.changed'],
+        ])
+
+    def _approve_request(self, blood_request):
+        with self.captureOnCommitCallbacks(execute=True):
+            BloodInventory.objects.create(bank=BloodBank.objects.create(name='B', city='C'), blood_group='O-', units=5)
+            allocation.approve_request(blood_request)
+
+    def test_tickets_are_single_use_and_replace_query_tokens(self):
+        client = APIClient()
+        self.assertEqual(client.post('/api/events/ticket/').status_code, 401)
+        client.force_authenticate(self.donor)
+        resp = client.post('/api/events/ticket/')
+        self.assertEqual(resp.data['expires_in'], events.TICKET_SECONDS)
+        request = RequestFactory().get('/api/events/', {'ticket': resp.data['ticket']})
+        self.assertEqual(events._user(request), self.donor)
+        self.assertIsNone(events._user(request))
+        # two streams read the same ticket at once; the one that loses the delete is refused
+        request = RequestFactory().get('/api/events/', {'ticket': client.post('/api/events/ticket/').data['ticket']})
+        with mock.patch('core.events.cache') as shared:
+            shared.get.return_value = self.donor.pk
+            shared.delete.return_value = False
+            self.assertIsNone(events._user(request))
+
+        token = str(RefreshToken.for_user(self.donor).access_token)
+        self.assertIsNone(events._user(RequestFactory().get('/api/events/', {'token': token})))
+        self.assertEqual(events._user(RequestFactory().get('/api/events/', HTTP_AUTHORIZATION=f'Bearer {token}')), self.donor)
+
+    async def test_stream_sends_committed_events(self):
+        self.assertEqual((await self.async_client.get('/api/events/')).status_code, 401)
+        ticket = await sync_to_async(events.issue_ticket)(self.donor)
+        response = await self.async_client.get('/api/events/', {'ticket': ticket})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = response.streaming_content
+        self.assertEqual(await anext(chunks), b'retry: 3000\n\n')
+
+        blood_request = await sync_to_async(BloodRequest.objects.create)(requester=self.hospital, blood_group='O-', units=2)
+        await sync_to_async(self._approve_request)(blood_request)
+        chunk = (await asyncio.wait_for(anext(chunks), 5)).decode()
+        self.assertIn('event: request.approved\n', chunk)
+        self.assertIn('"status": "approved"', chunk)
+        await chunks.aclose()
+
+
+
+class OwnedHistoryTestCase(TestCase):
+    def setUp(self):
+        self.donor = User.objects.create_user(username='donor1', password='x', role='donor')
+        self.hospital = User.objects.create_user(username='hospital', password='x', role='hospital')
+        self.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        other = User.objects.create_user(username='donor2', password='x', role='donor')
+        for user in (self.donor, other):
+            Donation.objects.create(donor=user, blood_group='O+', units=1, approved=True)
+            Donation.objects.create(donor=user, blood_group='O+', units=1)
+        BloodRequest.objects.create(requester=self.hospital, blood_group='A+', units=2)
+        BloodRequest.objects.create(requester=other, blood_group='A+', units=2, status='approved')
+        self.client = APIClient()
+
+    def _ids(self, user, url, **params):
+        self.client.force_authenticate(user)
+        resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, 200)
+        return {row['id'] for row in resp.data['results']}
+
+    def test_rows_are_scoped_to_their_owner(self):
+        self.assertEqual(self._ids(self.donor, '/api/donations/'), set(self.donor.donations.values_list('id', flat=True)))
+        self.assertEqual(self._ids(self.hospital, '/api/blood-requests/'), set(self.hospital.requests.values_list('id', flat=True)))
+        self.assertEqual(self._ids(self.hospital, '/api/donations/'), set())
+        self.assertEqual(len(self._ids(self.admin, '/api/donations/')), 4)
+        self.assertEqual(len(self._ids(self.admin, '/api/blood-requests/')), 2)
+        other_donation = Donation.objects.exclude(donor=self.donor).first()
+        self.client.force_authenticate(self.donor)
+        self.assertEqual(self.client.get(f'/api/donations/{other_donation.id}/').status_code, 404)
+
+    def test_since_and_status_filters(self):
+        old = self.donor.donations.get(approved=True)
+        Donation.objects.filter(pk=old.pk).update(created_at=timezone.now() - datetime.timedelta(days=30))
+        since = (timezone.localdate() - datetime.timedelta(days=1)).isoformat()
+        self.assertEqual(self._ids(self.donor, '/api/donations/', since=since), {self.donor.donations.get(approved=False).id})
+        self.assertEqual(self._ids(self.donor, '/api/donations/', status='Approved'), {old.id})
+        self.assertEqual(len(self._ids(self.admin, '/api/blood-requests/', status='approved')), 1)
+        self.assertEqual(self.client.get('/api/blood-requests/', {'status': 'lost'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/donations/', {'since': 'yesterday'}).status_code, 400)
+
+    @skipUnless(connection.vendor == 'sqlite', 'reads the SQLite query plan')
+    def test_owner_history_uses_its_index(self):
+        self.client.force_authenticate(self.donor)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/donations/')
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + queries[-1]['sql'])
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('donation_owner_created_idx', plan)
+
+
+class MeSummaryTestCase(TestCase):
+    def setUp(self):
+        self.donor = User.objects.create_user(username='donor1', password='x', role='donor')
+        self.profile = DonorProfile.objects.create(user=self.donor, blood_group='O+', city='Dhaka')
+        other = User.objects.create_user(username='donor2', password='x', role='donor')
+        for user, count in [(self.donor, 12), (other, 3)]:
+            for _ in range(count):
+                Donation.objects.create(donor=user, blood_group='O+', units=1)
+                BloodRequest.objects.create(requester=user, blood_group='O+', units=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.donor)
+
+    def test_one_response_in_fixed_queries(self):
+        with self.assertNumQueries(3):
+            data = self.client.get('/api/me/summary/').json()
+        self.assertEqual(data['user']['username'], 'donor1')
+        self.assertEqual(data['profile']['id'], self.profile.id)
+        self.assertTrue(data['eligibility']['eligible'])
+        own_donations = set(Donation.objects.filter(donor=self.donor).values_list('id', flat=True))
+        own_requests = set(BloodRequest.objects.filter(requester=self.donor).values_list('id', flat=True))
+        for section, own in [('donations', own_donations), ('requests', own_requests)]:
+            ids = [row['id'] for row in data[section]['results']]
+            self.assertEqual(len(ids), 10)
+            self.assertLessEqual(set(ids), own)
+
+        following = self.client.get(data['donations']['next']).json()
+        self.assertEqual(len(following['donations']['results']), 2)
+        self.assertIsNone(following['donations']['next'])
+        self.assertEqual(len(following['requests']['results']), 10)
+
+    def test_eligibility_follows_the_latest_approved_donation(self):
+        Donation.objects.filter(donor=self.donor).update(approved=True)
+        eligibility.refresh()
+        status = self.client.get('/api/me/summary/').json()['eligibility']
+        self.assertFalse(status['eligible'])
+        self.assertEqual(
+            status['next_eligible_on'],
+            (timezone.localdate() + datetime.timedelta(days=90)).isoformat(),
+        )
+
+    def test_without_a_profile(self):
+        self.client.force_authenticate(User.objects.create_user(username='hospital', password='x', role='hospital'))
+        data = self.client.get('/api/me/summary/').json()
+        self.assertIsNone(data['profile'])
+        self.assertIsNone(data['eligibility'])
+        self.assertEqual(data['requests']['results'], [])
+
+
+class StatelessAuthenticationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='hospital', password='secret', role='hospital')
+        self.client = APIClient()
+
+    def _login(self):
+        tokens = self.client.post('/api/auth/login/', {'username': 'hospital', 'password': 'secret'}, format='json').data
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        return tokens
+
+    def test_claims_answer_requests_without_a_user_query(self):
+        self._login()
+        self.client.get('/api/blood-banks/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/blood-banks/').status_code, 200)
+        self.assertEqual(self.client.get('/api/admin/dashboard/').status_code, 403)
+        # the full user loads once for views that need it, then comes from the process cache
+        self.assertEqual(self.client.get('/api/users/me/').data['username'], 'hospital')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/users/me/').data['role'], 'hospital')
+
+    def test_user_changes_and_logout_apply_to_issued_tokens(self):
+        tokens = self._login()
+        self.user.role = 'admin'
+        self.user.save()
+        self.assertEqual(self.client.get('/api/admin/dashboard/').status_code, 200)
+
+        self.assertEqual(self.client.post('/api/auth/logout/', {'refresh': tokens['refresh']}, format='json').status_code, 205)
+        self.assertEqual(self.client.get('/api/blood-banks/').status_code, 401)
+
+        self._login()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/blood-banks/').status_code, 401)
+
+    def _forget(self):
+        # what another process, or one whose cache entries were evicted, has to go on
+        cache.clear()
+        authentication._users.clear()
+        authentication._revoked.clear()
+
+    def test_logout_and_changes_hold_without_the_cache_marks(self):
+        tokens = self._login()
+        self.assertEqual(self.client.get('/api/blood-banks/').status_code, 200)
+        self.client.post('/api/auth/logout/', {'refresh': tokens['refresh']}, format='json')
+        self._forget()
+        self.assertEqual(self.client.get('/api/blood-banks/').status_code, 401)
+
+        self.user.role = 'admin'
+        self.user.save()
+        User.objects.filter(pk=self.user.pk).update(auth_changed_at=timezone.now() - datetime.timedelta(minutes=1))
+        self._login()
+        self._forget()
+        self.client.get('/api/blood-banks/')
+        with self.assertNumQueries(0):
+            # the token's own claims, checked against a warm process cache
+            self.assertEqual(self.client.get('/api/blood-banks/').status_code, 200)
+        self.assertEqual(self.client.get('/api/admin/dashboard/').status_code, 200)
+
+        self.user.role = 'hospital'
+        self.user.save()
+        self._forget()
+        self.assertEqual(self.client.get('/api/admin/dashboard/').status_code, 403)
+        self.user.is_active = False
+        self.user.save()
+        self._forget()
+        self.assertEqual(self.client.get('/api/blood-banks/').status_code, 401)
+
+
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        self.donor = User.objects.create_user(username='donor1', password='x', role='donor')
+        for n, group in enumerate(['O+', 'A-', 'O+']):
+            user = User.objects.create_user(username=f'd{n}', password='x', role='donor', first_name='Rahim')
+            DonorProfile.objects.create(user=user, blood_group=group, city='Dhaka' if n else 'Khulna')
+        BloodBank.objects.create(name='Central', city='Dhaka')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin).access_token}')
+
+    async def _get(self, path, user=None, headers=None):
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(user or self.admin).access_token))()
+        return await self.async_client.get(path, headers={'Authorization': f'Bearer {token}', **(headers or {})})
+
+    async def test_same_results_as_the_sync_endpoints(self):
+        for path in [
+            'donor-profiles/', 'donor-profiles/?blood_group=O%2B&page_size=1', 'donor-profiles/?q=rahim',
+            'blood-banks/', 'analytics/', 'analytics/?city=Dhaka', 'admin/dashboard/',
+        ]:
+            with self.subTest(path=path):
+                expected = (await sync_to_async(self.client.get)(f'/api/{path}')).json()
+                response = await self._get(f'/api/async/{path}')
+                self.assertEqual(response.status_code, 200)
+                data = response.json()
+                if 'results' in expected:
+                    self.assertEqual(data['results'], expected['results'])
+                    self.assertEqual(data['next'] is None, expected['next'] is None)
+                else:
+                    self.assertEqual(data, expected)
+
+    async def test_requires_token_and_admin_for_dashboard(self):
+        self.assertEqual((await self.async_client.get('/api/async/blood-banks/')).status_code, 401)
+        self.assertEqual((await self._get('/api/async/admin/dashboard/', self.donor)).status_code, 403)
+        self.assertEqual((await self._get('/api/async/analytics/', self.donor)).status_code, 200)
+
+    async def test_cached_page_and_next_link(self):
+        first = await self._get('/api/async/donor-profiles/?page_size=2')
+        self.assertIn('/api/async/donor-profiles/', first.json()['next'])
+        again = await self._get('/api/async/donor-profiles/?page_size=2', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(again.status_code, 304)
+        second = await self._get(first.json()['next'].replace('http://testserver', ''))
+        self.assertEqual(len(second.json()['results']), 1)
+
+    async def test_metrics_middleware_stays_async(self):
+        async def view(request):
+            await asyncio.sleep(0.2)
+            return HttpResponse('ok')
+
+        middleware = metrics.MetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        start = time.perf_counter()
+        await asyncio.gather(*(middleware(RequestFactory().get('/')) for _ in range(5)))
+        # run side by side, not one after another on a thread
+        self.assertLess(time.perf_counter() - start, 0.6)
+
+    async def test_async_requests_count_their_queries(self):
+        await sync_to_async(metrics.registry.reset)()
+        await sync_to_async(cache.clear)()
+        self.assertEqual((await self._get('/api/async/blood-banks/')).status_code, 200)
+        body = (await sync_to_async(self.client.get)('/api/metrics/')).content.decode()
+        self.assertIn('db_queries_per_request_count{view="async-blood-banks",method="GET"} 1', body)
+        self.assertNotIn('db_queries_per_request_sum{view="async-blood-banks",method="GET"} 0', body)
+
+
+class DonorPhotoTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='d', password='x', role='donor')
+        self.client.force_authenticate(self.user)
+
+    def _jpeg(self, name='me.jpg', size=(900, 600)):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # orientation: rotate 90 degrees
+        exif[0x8825] = {2: (23.0, 48.0, 0.0)}  # GPS latitude
+        out = io.BytesIO()
+        Image.new('RGB', size, 'red').save(out, 'JPEG', exif=exif)
+        return SimpleUploadedFile(name, out.getvalue(), content_type='image/jpeg')
+
+    def _upload_for(self, username, upload):
+        self.client.force_authenticate(User.objects.create_user(username=username, password='x', role='donor'))
+        return self._upload(upload)
+
+    def _upload(self, upload):
+        with mock.patch.object(photos, '_pool') as pool, self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post('/api/donor-profiles/', {'blood_group': 'A+', 'city': 'Dhaka', 'photo': upload})
+        self.assertEqual(resp.status_code, 201, resp.data)
+        profile = DonorProfile.objects.get(pk=resp.data['id'])
+        # decoded on a worker thread once committed; the tests call ``process`` themselves
+        pool.return_value.submit.assert_called_once_with(photos._run, profile.pk, profile.photo.name)
+        return profile
+
+    def test_upload_is_stripped_content_addressed_and_thumbnailed_after_the_request(self):
+        profile = self._upload(self._jpeg())
+        upload = profile.photo.name
+        self.assertRegex(upload, r'^uploads/[0-9a-f]{32}\.jpg$')
+        self.assertEqual(profile.photo_thumb, '')
+        # the upload still has its GPS tag, so it is not listed until stripped
+        data = self.client.get(f'/api/donor-profiles/{profile.pk}/').data
+        self.assertEqual((data['photo'], data['photo_url'], data['photo_thumb_url']), (None, None, None))
+        self.assertIsNone(self.client.get('/api/donor-profiles/').data['results'][0]['photo_url'])
+
+        self.assertTrue(photos.process(profile.pk, upload))
+        profile.refresh_from_db()
+        self.assertRegex(profile.photo.name, r'^profiles/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(profile.photo_thumb, photos.digest_of(profile.photo.name))
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, upload)))
+        digest = profile.photo_thumb
+        for name in [profile.photo.name] + [photos.thumb_name(digest, size) for size in photos.THUMB_SIZES]:
+            with Image.open(os.path.join(settings.MEDIA_ROOT, name)) as image:
+                # upright, and nothing but pixels
+                self.assertGreater(image.height, image.width)
+                self.assertNotIn('exif', image.info)
+                self.assertFalse(image.getexif())
+        for size in photos.THUMB_SIZES:
+            with Image.open(os.path.join(settings.MEDIA_ROOT, photos.thumb_name(digest, size))) as thumb:
+                self.assertEqual(thumb.format, 'WEBP')
+                self.assertEqual(thumb.height, size)
+        row = self.client.get('/api/donor-profiles/').data['results'][0]
+        self.assertEqual(row['photo_url'], f'/media/{profile.photo.name}')
+        self.assertEqual(row['photo_thumb_url'], f'/media/thumbs/{digest}-{photos.DEFAULT_THUMB_SIZE}.webp')
+
+        # the same photo again is stored once
+        other = User.objects.create_user(username='e', password='x', role='donor')
+        self.client.force_authenticate(other)
+        copy = self._upload(self._jpeg('copy.jpg'))
+        self.assertTrue(photos.process(copy.pk, copy.photo.name))
+        copy.refresh_from_db()
+        self.assertEqual(copy.photo.name, profile.photo.name)
+        self.assertEqual(len(os.listdir(os.path.join(settings.MEDIA_ROOT, 'profiles'))), 1)
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, 'uploads')), [])
+
+    def test_invalid_images_are_rejected(self):
+        resp = self.client.post('/api/donor-profiles/', {
+            'blood_group': 'A+', 'city': 'Dhaka', 'photo': SimpleUploadedFile('me.exe', b'MZ'),
+        })
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('photo', resp.data)
+
+        profile = self._upload(SimpleUploadedFile('me.png', b'not an image', content_type='image/png'))
+        upload = profile.photo.name
+        with self.assertLogs('core.photos', 'WARNING'):
+            self.assertTrue(photos.process(profile.pk, upload))
+        profile.refresh_from_db()
+        self.assertFalse(profile.photo)
+        self.assertEqual(profile.photo_thumb, '')
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, upload)))
+
+    def test_lost_jobs_are_picked_up_by_process_photos(self):
+        # ``_upload`` never runs the queued job, as if the process had restarted
+        profile = self._upload(self._jpeg())
+        upload = profile.photo.name
+        out = io.StringIO()
+        call_command('process_photos', stdout=out)
+        self.assertIn('Processed 0 waiting photo(s)', out.getvalue())
+
+        gone = self._upload_for('gone', self._jpeg('gone.jpg'))
+        os.remove(os.path.join(settings.MEDIA_ROOT, gone.photo.name))
+        with self.assertLogs('core.photos', 'WARNING'):
+            call_command('process_photos', '--min-age', '0', stdout=out)
+        self.assertIn('Processed 2 waiting photo(s)', out.getvalue())
+        profile.refresh_from_db()
+        self.assertRegex(profile.photo.name, r'^profiles/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(profile.photo_thumb, photos.digest_of(profile.photo.name))
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, upload)))
+        gone.refresh_from_db()
+        self.assertFalse(gone.photo)
+        self.assertEqual(photos.waiting(datetime.timedelta(0)), [])
+
+    def test_content_addressed_media_is_immutable(self):
+        profile = self._upload(self._jpeg())
+        factory = RequestFactory()
+        upload = profile.photo.name
+        self.assertNotIn('Cache-Control', media.serve(factory.get('/media/' + upload), upload))
+        photos.process(profile.pk, upload)
+        profile.refresh_from_db()
+        for path in (profile.photo.name, photos.thumb_name(profile.photo_thumb)):
+            resp = media.serve(factory.get('/media/' + path), path)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'other'))
+        with open(os.path.join(settings.MEDIA_ROOT, 'other', 'a.txt'), 'w') as f:
+            f.write('a')
+        self.assertNotIn('Cache-Control', media.serve(factory.get('/media/other/a.txt'), 'other/a.txt'))
+
+
+class BenchmarkTestCase(TestCase):
+    def test_seed_is_reproducible_and_realistic(self):
+        created = synthetic.seed(donors=300, banks=5, donations=100, requests=20, seed=3)
+        self.assertEqual(created, {'banks': 5, 'donors': 300, 'donations': 100, 'requests': 20})
+        groups = Counter(DonorProfile.objects.values_list('blood_group', flat=True))
+        self.assertGreater(groups['O+'], groups['AB-'])
+        self.assertEqual(stats.drift(), {})
+        first = list(DonorProfile.objects.order_by('user__username').values_list('blood_group', 'city')[:20])
+
+        for model in (Donation, BloodRequest, BloodBank, DonorProfile):
+            model.objects.all().delete()
+        User.objects.filter(username__startswith='synth-').delete()
+        synthetic.seed(donors=300, banks=5, donations=100, requests=20, seed=3)
+        self.assertEqual(list(DonorProfile.objects.order_by('user__username').values_list('blood_group', 'city')[:20]), first)
 
+    def test_run_reports_percentiles_and_queries(self):
+        self.assertEqual(benchmark.percentile([5, 1, 3, 2, 4], 0.5), 3)
+        self.assertEqual(benchmark.percentile([5, 1, 3, 2, 4], 0.99), 5)
+        synthetic.seed(donors=50, banks=3, donations=30, requests=10)
+        results = benchmark.run(iterations=3, only={'donor_list', 'approve_donation'}, cold=True)
+        self.assertEqual(set(results['scenarios']), {'donor_list', 'approve_donation'})
+        donor_list = results['scenarios']['donor_list']
+        self.assertEqual(donor_list['requests'], 3)
+        self.assertEqual(donor_list['status_codes'], {'200': 3})
+        self.assertGreaterEqual(donor_list['queries_per_request'], 1)
+        self.assertLessEqual(donor_list['p50_ms'], donor_list['p99_ms'])
+        self.assertGreater(results['peak_rss_mb'], 0)
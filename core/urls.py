@@ -1,11 +1,13 @@
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    RegisterView, UserViewSet, DonorProfileViewSet,
+    RegisterView, LogoutView, UserViewSet, DonorProfileViewSet,
     BloodBankViewSet, BloodRequestViewSet, DonationViewSet,
-    AdminDashboardView, AnalyticsView, DonationExportView, RequestExportView,
+    AdminDashboardView, AnalyticsView, CacheStatsView, DonationExportView, RequestExportView,
+    AdminExportView, BulkImportView, EventTicketView, MeSummaryView, MetricsView,
 )
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from . import async_views, events
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet, basename='user')
@@ -18,10 +20,22 @@ urlpatterns = [
     path('auth/register/', RegisterView.as_view(), name='auth-register'),
     path('auth/login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('auth/logout/', LogoutView.as_view(), name='auth-logout'),
+    path('me/summary/', MeSummaryView.as_view(), name='me-summary'),
     path('admin/dashboard/', AdminDashboardView.as_view(), name='admin-dashboard'),
     path('analytics/', AnalyticsView.as_view(), name='analytics'),
+    path('cache/stats/', CacheStatsView.as_view(), name='cache-stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('events/', events.stream, name='events'),
+    path('events/ticket/', EventTicketView.as_view(), name='events-ticket'),
+    path('async/donor-profiles/', async_views.donor_profiles, name='async-donor-profiles'),
+    path('async/blood-banks/', async_views.blood_banks, name='async-blood-banks'),
+    path('async/admin/dashboard/', async_views.admin_dashboard, name='async-admin-dashboard'),
+    path('async/analytics/', async_views.analytics, name='async-analytics'),
     path('donations/export/', DonationExportView.as_view(), name='donation-export'),
     path('requests/export/', RequestExportView.as_view(), name='request-export'),
+    re_path(r'^admin/export/(?P<kind>donations|requests)/$', AdminExportView.as_view(), name='admin-export'),
+    re_path(r'^bulk/(?P<kind>donors|banks|donations)/$', BulkImportView.as_view(), name='bulk-import'),
     # Simple template dashboards
     path('dashboard/donor/', lambda request: __import__('django.shortcuts').shortcuts.render(request, 'donor_dashboard.html'), name='donor-dashboard'),
     path('dashboard/admin/', lambda request: __import__('django.shortcuts').shortcuts.render(request, 'admin_dashboard.html'), name='admin-dashboard-page'),
@@ -1,27 +1,29 @@
-from django.core.mail import send_mail
-from django.conf import settings
+from .notifications import enqueue
 
 
-def send_donation_approved_email(donation):
-    """Send an email to donor when their donation is approved."""
+def donation_approved_email(donation):
+    """``(subject, body, recipients)`` telling the donor their donation was approved, or ``None``."""
     donor = donation.donor
     if not donor or not donor.email:
-        return
+        return None
     subject = 'Your blood donation has been approved'
     message = f"Hello {donor.get_full_name() or donor.username},\n\nYour donation (blood group: {donation.blood_group}, units: {donation.units}) has been approved. Thank you for your contribution!\n\nRegards,\nBlood Management Team"
-    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [donor.email], fail_silently=True)
+    return subject, message, [donor.email]
+
+
+def send_donation_approved_email(donation):
+    """Queue an email to the donor when their donation is approved."""
+    email = donation_approved_email(donation)
+    if email is not None:
+        enqueue(*email)
 
 
 def notify_donors_blood_needed(blood_request):
-    """Notify available donors who match the requested blood group."""
-    from .models import DonorProfile
+    """Queue a notice to available donors whose blood group is compatible with the request.
 
+    Recipients are looked up by the notifier when it sends, in BCC batches.
+    """
     group = blood_request.blood_group
-    donors = DonorProfile.objects.filter(blood_group__iexact=group, available=True).select_related('user')
-    emails = [d.user.email for d in donors if d.user and d.user.email]
-    if not emails:
-        return
     subject = f'Blood needed: {group}'
     message = f"A new blood request has been made requesting {blood_request.units} unit(s) of {group}.\n\nIf you are available, please consider donating or contact the blood bank/administrator.\n\nRegards,\nBlood Management Team"
-    # Send to all matching donors (BCC is not handled here; using send_mail for simplicity)
-    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, list(set(emails)), fail_silently=True)
+    enqueue(subject, message, audience=f'donors:{group}')
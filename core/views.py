@@ -4,16 +4,25 @@ from rest_framework.decorators import action
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import DonorProfile, BloodBank, BloodRequest, Donation
+from .models import DonorProfile, BloodBank, BloodRequest, Donation, BLOOD_GROUP_CODES
 from .serializers import (
     UserSerializer, RegisterSerializer, DonorProfileSerializer,
     BloodBankSerializer, BloodRequestSerializer, DonationSerializer
 )
 from django.conf import settings
-from .utils import send_donation_approved_email, notify_donors_blood_needed
+from .utils import notify_donors_blood_needed
+from . import allocation, batch, caching, compatibility, eligibility, events, exports, importer, metrics, photos, stats
+from .caching import CachedResponseMixin
+from .flat import FlatListMixin
+from .geo import NearbySearchMixin
+from .history import OwnedHistoryMixin
+from .pagination import KeysetPagination
+from .search import SearchMixin
 from django.db import transaction
-from django.db.models import F
-from rest_framework.parsers import MultiPartParser, FormParser
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.db.models import Case, IntegerField, Value, When
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 
 User = get_user_model()
 
@@ -37,10 +46,11 @@ class LogoutView(generics.GenericAPIView):
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
+class UserViewSet(FlatListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    keyset_ordering = ('id',)
 
     @action(detail=False, methods=['get'])
     def me(self, request):
@@ -48,18 +58,29 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
 
 
-class DonorProfileViewSet(viewsets.ModelViewSet):
+class DonorProfileViewSet(CachedResponseMixin, SearchMixin, NearbySearchMixin, FlatListMixin, viewsets.ModelViewSet):
+    cache_namespace = 'donor-profiles'
     queryset = DonorProfile.objects.select_related('user').all()
     serializer_class = DonorProfileSerializer
-    parser_classes = (MultiPartParser, FormParser)
+    parser_classes = (MultiPartParser, FormParser, JSONParser)
 
     def get_permissions(self):
         if self.action in ['create']:
             return [permissions.IsAuthenticated()]
         return [permissions.IsAuthenticated()]
 
+    def _process_photo(self, profile):
+        if profile.photo and not profile.photo_thumb:
+            photos.process_later(profile.pk, profile.photo.name)
+
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        self._process_photo(serializer.save(user=self.request.user))
+
+    def perform_update(self, serializer):
+        # the donor's own choice replaces any deferral's
+        profile = serializer.save(**({'deferred': False} if 'available' in serializer.validated_data else {}))
+        if 'photo' in serializer.validated_data:
+            self._process_photo(profile)
     
     def get_queryset(self):
         """Allow filtering donors by blood_group, city, and availability via query params."""
@@ -78,11 +99,34 @@ class DonorProfileViewSet(viewsets.ModelViewSet):
                 qs = qs.filter(available=False)
         return qs
 
-
-class BloodBankViewSet(viewsets.ModelViewSet):
-    queryset = BloodBank.objects.all()
+    @action(detail=False, methods=['get'])
+    def compatible(self, request):
+        """Available donors who can give to ``?recipient=`` (optionally in ``?city=``), best match first."""
+        recipient = compatibility.normalize_group(request.query_params.get('recipient'))
+        if recipient is None:
+            return Response({'detail': 'recipient must be a valid blood group.'}, status=status.HTTP_400_BAD_REQUEST)
+        return caching.cached_response(self.cache_namespace, request, 'compatible', lambda: self._compatible(recipient))
+
+    def _compatible(self, recipient):
+        groups = compatibility.compatible_donor_groups(recipient)
+        qs = DonorProfile.objects.select_related('user').filter(eligibility.eligible_q(), blood_group__in=groups)
+        city = self.request.query_params.get('city')
+        if city:
+            qs = qs.filter(city__iexact=city)
+        qs = qs.annotate(match_rank=Case(
+            *[When(blood_group=group, then=Value(rank)) for rank, group in enumerate(groups)],
+            output_field=IntegerField(),
+        ))
+        self.keyset_ordering = ('match_rank', 'id')
+        return self.flat_list(qs)
+
+
+class BloodBankViewSet(CachedResponseMixin, SearchMixin, NearbySearchMixin, viewsets.ModelViewSet):
+    cache_namespace = 'blood-banks'
+    queryset = BloodBank.objects.prefetch_related('inventory')
     serializer_class = BloodBankSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    keyset_ordering = ('id',)
 
     def get_queryset(self):
         """Allow filtering blood banks by name and city via query params."""
@@ -96,20 +140,33 @@ class BloodBankViewSet(viewsets.ModelViewSet):
         return qs
 
 
-class BloodRequestViewSet(viewsets.ModelViewSet):
+def _batch_ids(request):
+    """Read ``{"ids": [...]}``; returns ``(ids, None)`` or ``(None, error response)``."""
+    ids = request.data.get('ids') if hasattr(request.data, 'get') else None
+    if not isinstance(ids, list) or not ids or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+        return None, Response({'ids': 'Expected a non-empty list of ids.'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > batch.MAX_IDS:
+        return None, Response({'ids': f'At most {batch.MAX_IDS} ids per call.'}, status=status.HTTP_400_BAD_REQUEST)
+    return list(dict.fromkeys(ids)), None
+
+
+def _batch_response(ids, results):
+    return Response({'results': [{'id': pk, 'result': results[pk]} for pk in ids]})
+
+
+class BloodRequestViewSet(OwnedHistoryMixin, FlatListMixin, viewsets.ModelViewSet):
     queryset = BloodRequest.objects.select_related('requester').all()
     serializer_class = BloodRequestSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    owner_field = 'requester'
+    status_filters = {value: {'status': value} for value, _ in BloodRequest.STATUS_CHOICES}
 
     def get_queryset(self):
-        """Allow filtering blood requests by blood_group and status via query params."""
+        """The caller's blood requests (all for admins), filtered by ?blood_group=, ?status= and ?since=."""
         qs = super().get_queryset()
         blood_group = self.request.query_params.get('blood_group')
-        status_filter = self.request.query_params.get('status')
         if blood_group:
-            qs = qs.filter(blood_group__iexact=blood_group)
-        if status_filter:
-            qs = qs.filter(status__iexact=status_filter)
+            qs = qs.filter(blood_group=blood_group.upper())
         return qs
 
     def perform_create(self, serializer):
@@ -127,43 +184,67 @@ class BloodRequestViewSet(viewsets.ModelViewSet):
         if request.user.role != 'admin':
             return Response({'detail': 'Only admin can approve.'}, status=status.HTTP_403_FORBIDDEN)
         req = self.get_object()
-        # find a blood bank with sufficient units for the requested group
-        field_map = {
-            'A+': 'units_a_plus', 'A-': 'units_a_minus',
-            'B+': 'units_b_plus', 'B-': 'units_b_minus',
-            'O+': 'units_o_plus', 'O-': 'units_o_minus',
-            'AB+': 'units_ab_plus', 'AB-': 'units_ab_minus',
-        }
-        field = field_map.get(req.blood_group)
-        if not field:
+        if req.blood_group not in BLOOD_GROUP_CODES:
             return Response({'detail': 'Invalid blood group on request.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        with transaction.atomic():
-            # try to find any bank with enough units
-            bank = BloodBank.objects.filter(**{f"{field}__gte": req.units}).first()
-            if not bank:
-                return Response({'detail': 'Insufficient units in all blood banks.'}, status=status.HTTP_400_BAD_REQUEST)
-            # decrement using F() to avoid races
-            BloodBank.objects.filter(pk=bank.pk).update(**{field: F(field) - req.units})
-            req.status = 'approved'
-            req.save()
-
-        return Response(self.get_serializer(req).data)
+        try:
+            with transaction.atomic():
+                allocations = allocation.approve_request(req)
+        except allocation.InsufficientStock:
+            return Response({'detail': 'Insufficient units in all blood banks.'}, status=status.HTTP_400_BAD_REQUEST)
+        if allocations is None:
+            # approving twice is a no-op; a rejected request cannot be approved
+            req.refresh_from_db()
+            if req.status != 'approved':
+                return Response({'detail': f'Request is already {req.status}.'}, status=status.HTTP_409_CONFLICT)
+            return Response(self.get_serializer(req).data)
+
+        data = self.get_serializer(req).data
+        data['allocations'] = [{'bank': a.bank_id, 'blood_group': a.blood_group, 'units': a.units} for a in allocations]
+        return Response(data)
 
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
         if request.user.role != 'admin':
             return Response({'detail': 'Only admin can reject.'}, status=status.HTTP_403_FORBIDDEN)
         req = self.get_object()
-        req.status = 'rejected'
-        req.save()
+        if not allocation.transition(req, 'pending', 'rejected'):
+            req.refresh_from_db()
+            if req.status != 'rejected':
+                return Response({'detail': f'Request is already {req.status}.'}, status=status.HTTP_409_CONFLICT)
         return Response(self.get_serializer(req).data)
 
+    @action(detail=False, methods=['post'], url_path='approve-batch')
+    def approve_batch(self, request):
+        """Approve ``{"ids": [...]}``; each id reports its own result."""
+        if request.user.role != 'admin':
+            return Response({'detail': 'Only admin can approve.'}, status=status.HTTP_403_FORBIDDEN)
+        ids, error = _batch_ids(request)
+        if error:
+            return error
+        with transaction.atomic():
+            results = batch.approve_requests(ids)
+        return _batch_response(ids, results)
+
+    @action(detail=False, methods=['post'], url_path='reject-batch')
+    def reject_batch(self, request):
+        if request.user.role != 'admin':
+            return Response({'detail': 'Only admin can reject.'}, status=status.HTTP_403_FORBIDDEN)
+        ids, error = _batch_ids(request)
+        if error:
+            return error
+        with transaction.atomic():
+            results = batch.reject_requests(ids)
+        return _batch_response(ids, results)
+
 
-class DonationViewSet(viewsets.ModelViewSet):
+class DonationViewSet(OwnedHistoryMixin, FlatListMixin, viewsets.ModelViewSet):
+    """The caller's donations (all for admins), filtered by ?status=pending|approved and ?since=."""
     queryset = Donation.objects.select_related('donor').all()
     serializer_class = DonationSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    owner_field = 'donor'
+    status_filters = {'pending': {'approved': False}, 'approved': {'approved': True}}
 
     def perform_create(self, serializer):
         serializer.save(donor=self.request.user)
@@ -173,36 +254,25 @@ class DonationViewSet(viewsets.ModelViewSet):
         if request.user.role != 'admin':
             return Response({'detail': 'Only admin can approve.'}, status=status.HTTP_403_FORBIDDEN)
         donation = self.get_object()
-        donation.approved = True
-        # Save and atomically update blood bank units if bank present
         with transaction.atomic():
-            donation.save()
-            try:
-                bank = donation.blood_bank
-                if bank and donation.units > 0:
-                    field_map = {
-                        'A+': 'units_a_plus', 'A-': 'units_a_minus',
-                        'B+': 'units_b_plus', 'B-': 'units_b_minus',
-                        'O+': 'units_o_plus', 'O-': 'units_o_minus',
-                        'AB+': 'units_ab_plus', 'AB-': 'units_ab_minus',
-                    }
-                    field = field_map.get(donation.blood_group)
-                    if field:
-                        # Use F() to avoid race conditions
-                        setattr(BloodBank.objects.filter(pk=bank.pk).first(), field, F(field) + donation.units)
-                        # Persist increment on the bank
-                        BloodBank.objects.filter(pk=bank.pk).update(**{field: F(field) + donation.units})
-            except Exception:
-                # don't block approval if bank update fails
-                pass
-        # send email notification to donor
-        try:
-            send_donation_approved_email(donation)
-        except Exception:
-            pass
-        # Optionally update blood bank units (left as exercise)
+            # only the call that flips the flag adds the stock; approving twice is a no-op
+            if Donation.objects.filter(pk=donation.pk, approved=False).update(approved=True):
+                batch.record_approvals([donation])
+        donation.approved = True
         return Response(self.get_serializer(donation).data)
 
+    @action(detail=False, methods=['post'], url_path='approve-batch')
+    def approve_batch(self, request):
+        """Approve ``{"ids": [...]}``, adding stock and queueing emails once for the whole batch."""
+        if request.user.role != 'admin':
+            return Response({'detail': 'Only admin can approve.'}, status=status.HTTP_403_FORBIDDEN)
+        ids, error = _batch_ids(request)
+        if error:
+            return error
+        with transaction.atomic():
+            results = batch.approve_donations(ids)
+        return _batch_response(ids, results)
+
 
 from rest_framework.views import APIView
 
@@ -215,158 +285,149 @@ class AdminDashboardView(APIView):
         if request.user.role != 'admin':
             return Response({'detail': 'Only admin can access dashboard.'}, status=status.HTTP_403_FORBIDDEN)
 
-        total_donors = User.objects.filter(role='donor').count()
-        pending_requests = BloodRequest.objects.filter(status='pending').count()
-        # aggregate available units from blood banks
-        banks = BloodBank.objects.all()
-        units = {
-            'A+': sum(b.units_a_plus for b in banks),
-            'A-': sum(b.units_a_minus for b in banks),
-            'B+': sum(b.units_b_plus for b in banks),
-            'B-': sum(b.units_b_minus for b in banks),
-            'O+': sum(b.units_o_plus for b in banks),
-            'O-': sum(b.units_o_minus for b in banks),
-            'AB+': sum(b.units_ab_plus for b in banks),
-            'AB-': sum(b.units_ab_minus for b in banks),
-        }
-
-        return Response({
-            'total_donors': total_donors,
-            'pending_requests': pending_requests,
-            'available_units': units,
-        })
+        return caching.cached_response('stats', request, 'admin-dashboard', lambda: Response(stats.admin_dashboard()))
 
 
 class AnalyticsView(generics.GenericAPIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request):
-        """Get analytics and statistics about the blood donation system"""
-        # Donation stats
-        total_donations = Donation.objects.count()
-        approved_donations = Donation.objects.filter(status='approved').count()
-        pending_donations = Donation.objects.filter(status='pending').count()
-        total_units_donated = Donation.objects.filter(
-            status__in=['approved', 'completed']
-        ).values_list('units_donated', flat=True)
-        total_units_donated = sum(total_units_donated) if total_units_donated else 0
-
-        # Request stats
-        total_requests = BloodRequest.objects.count()
-        pending_requests = BloodRequest.objects.filter(status='pending').count()
-        fulfilled_requests = BloodRequest.objects.filter(status__in=['fulfilled', 'approved']).count()
-        total_units_requested = BloodRequest.objects.values_list('units_required', flat=True)
-        total_units_requested = sum(total_units_requested) if total_units_requested else 0
-
-        # Donor stats
-        total_donors = DonorProfile.objects.count()
-        available_donors = DonorProfile.objects.filter(available=True).count()
-        donors_by_blood_group = {}
-        for bg in ['A+', 'A-', 'B+', 'B-', 'O+', 'O-', 'AB+', 'AB-']:
-            donors_by_blood_group[bg] = DonorProfile.objects.filter(blood_group=bg).count()
-
-        # Blood availability
-        banks = BloodBank.objects.all()
-        blood_availability = {
-            'A+': sum(b.units_a_plus for b in banks),
-            'A-': sum(b.units_a_minus for b in banks),
-            'B+': sum(b.units_b_plus for b in banks),
-            'B-': sum(b.units_b_minus for b in banks),
-            'O+': sum(b.units_o_plus for b in banks),
-            'O-': sum(b.units_o_minus for b in banks),
-            'AB+': sum(b.units_ab_plus for b in banks),
-            'AB-': sum(b.units_ab_minus for b in banks),
-        }
-
-        # Calculate fulfillment rate
-        fulfillment_rate = (fulfilled_requests / total_requests * 100) if total_requests > 0 else 0
+        """Get analytics and statistics about the blood donation system, optionally for one ?city="""
+        return caching.cached_response(
+            'stats', request, 'analytics',
+            lambda: Response(stats.analytics(city=request.query_params.get('city'))),
+        )
+
 
+class MeSummaryView(APIView):
+    """Everything the donor screens load on start, in three queries.
+
+    The user, their donor profile with eligibility, and the first page of
+    their donations and blood requests, newest first. Each section's ``next``
+    link repeats this request with ``?donations_cursor=`` or
+    ``?requests_cursor=`` for the following page of that section.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    page_size = 10
+
+    def _section(self, queryset, cursor_param, serializer_class, owner_field):
+        paginator = KeysetPagination()
+        paginator.cursor_query_param = cursor_param
+        paginator.page_size = self.page_size
+        page = paginator.paginate_queryset(queryset, self.request, self)
+        for row in page:
+            # the nested user is the caller; no join needed
+            setattr(row, owner_field, self.request.user)
+        data = serializer_class(page, many=True, context={'request': self.request}).data
+        return {'next': paginator.get_next_link(), 'results': data}
+
+    def get(self, request):
+        user = request.user
+        profile = DonorProfile.objects.filter(user=user).first()
+        profile_data = eligibility_data = None
+        if profile is not None:
+            profile.user = user
+            profile_data = DonorProfileSerializer(profile, context={'request': request}).data
+            eligibility_data = eligibility.status(profile)
         return Response({
-            'donations': {
-                'total': total_donations,
-                'approved': approved_donations,
-                'pending': pending_donations,
-                'total_units_donated': total_units_donated,
-            },
-            'requests': {
-                'total': total_requests,
-                'pending': pending_requests,
-                'fulfilled': fulfilled_requests,
-                'total_units_requested': total_units_requested,
-                'fulfillment_rate': round(fulfillment_rate, 2),
-            },
-            'donors': {
-                'total': total_donors,
-                'available': available_donors,
-                'by_blood_group': donors_by_blood_group,
-            },
-            'blood_availability': blood_availability,
+            'user': UserSerializer(user).data,
+            'profile': profile_data,
+            'eligibility': eligibility_data,
+            'donations': self._section(Donation.objects.filter(donor=user), 'donations_cursor', DonationSerializer, 'donor'),
+            'requests': self._section(
+                BloodRequest.objects.filter(requester=user), 'requests_cursor', BloodRequestSerializer, 'requester',
+            ),
         })
 
+class CacheStatsView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request):
+        if request.user.role != 'admin':
+            return Response({'detail': 'Only admin can view cache statistics.'}, status=status.HTTP_403_FORBIDDEN)
+        return Response(caching.cache_stats())
+
+
+class EventTicketView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request):
+        """A single-use ticket for opening ``/api/events/?ticket=`` (see ``core.events``)"""
+        return Response({'ticket': events.issue_ticket(request.user), 'expires_in': events.TICKET_SECONDS})
+
+
+class MetricsView(APIView):
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request):
+        """Per-view latency and SQL metrics in Prometheus text format (admins, or ?token=METRICS_TOKEN)"""
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        allowed = (token and constant_time_compare(request.query_params.get('token', ''), token)) or (
+            request.user.is_authenticated and request.user.role == 'admin'
+        )
+        if not allowed:
+            return Response({'detail': 'Only admin can read metrics.'}, status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 
 class DonationExportView(generics.GenericAPIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request):
-        """Export user's donations as CSV"""
-        import csv
-        import io
-        from django.http import HttpResponse
-
-        # Get user's donations
-        donations = Donation.objects.filter(donor=request.user)
-
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Date', 'Blood Group', 'Units', 'Blood Bank', 'Status', 'Notes'])
-
-        for donation in donations:
-            writer.writerow([
-                donation.created_at.strftime('%Y-%m-%d %H:%M'),
-                donation.blood_group,
-                donation.units_donated,
-                donation.blood_bank.name if donation.blood_bank else 'N/A',
-                donation.status,
-                donation.notes or '',
-            ])
-
-        # Create HTTP response
-        response = HttpResponse(output.getvalue(), content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="donations.csv"'
-        return response
+        """Stream the user's donations as CSV or NDJSON (?output=, ?from=, ?to=)"""
+        return exports.export_response(request, 'donations', Donation.objects.filter(donor=request.user))
 
 
 class RequestExportView(generics.GenericAPIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request):
-        """Export user's blood requests as CSV"""
-        import csv
-        import io
-        from django.http import HttpResponse
-
-        # Get user's requests
-        blood_requests = BloodRequest.objects.filter(user=request.user)
-
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Date', 'Blood Group', 'Units', 'Reason', 'Hospital', 'Status', 'Urgent', 'Notes'])
-
-        for req in blood_requests:
-            writer.writerow([
-                req.created_at.strftime('%Y-%m-%d %H:%M'),
-                req.blood_group,
-                req.units_required,
-                req.reason or '',
-                req.hospital_name or 'N/A',
-                req.status,
-                'Yes' if req.is_urgent else 'No',
-                req.notes or '',
-            ])
-
-        # Create HTTP response
-        response = HttpResponse(output.getvalue(), content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="blood_requests.csv"'
-        return response
+        """Stream the user's blood requests as CSV or NDJSON (?output=, ?from=, ?to=)"""
+        return exports.export_response(request, 'requests', BloodRequest.objects.filter(requester=request.user))
+
+
+class AdminExportView(generics.GenericAPIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request, kind):
+        """Stream every donation or blood request, with the owner's username, for a date range"""
+        if request.user.role != 'admin':
+            return Response({'detail': 'Only admin can export all records.'}, status=status.HTTP_403_FORBIDDEN)
+        return exports.export_response(request, kind, include_owner=True)
+
+
+class BulkImportView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+    parser_classes = (MultiPartParser,)
+
+    def post(self, request, kind):
+        """Import donors, banks or donations from an uploaded ``file`` or the raw CSV/NDJSON body.
+
+        ``?input=csv|ndjson`` overrides the format guessed from the upload;
+        ``?on_conflict=skip|update`` decides what happens to existing donors
+        and banks. Responds with counts and per-line errors.
+        """
+        if request.user.role != 'admin':
+            return Response({'detail': 'Only admin can import data.'}, status=status.HTTP_403_FORBIDDEN)
+        if request.content_type.startswith('multipart/'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({'file': 'No file was uploaded.'}, status=status.HTTP_400_BAD_REQUEST)
+            stream, name, content_type = upload, upload.name, upload.content_type or ''
+        else:
+            stream, name, content_type = request.stream, '', request.content_type
+        fmt = request.query_params.get('input') or importer.guess_format(name, content_type)
+        if fmt not in importer.FORMATS:
+            return Response({'input': f"Choose one of: {', '.join(importer.FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        on_conflict = request.query_params.get('on_conflict', 'skip')
+        if on_conflict not in importer.CONFLICT_POLICIES:
+            return Response(
+                {'on_conflict': f"Choose one of: {', '.join(importer.CONFLICT_POLICIES)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if stream is None:
+            return Response({'detail': 'Empty request body.'}, status=status.HTTP_400_BAD_REQUEST)
+        # no process pool here: forking a threaded server process is unsafe, and every request
+        # would start one process per CPU; large imports go through ``manage.py import_data``
+        report = importer.import_rows(kind, stream, fmt, on_conflict=on_conflict, workers=1)
+        return Response(report.as_dict())
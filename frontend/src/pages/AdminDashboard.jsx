@@ -5,15 +5,29 @@ export default function AdminDashboard(){
   const [stats, setStats] = useState(null)
 
   useEffect(()=>{
-    api.loadToken()
-    ;(async ()=>{
+    const load = async () => {
       try{
         const resp = await api.get('admin/dashboard/')
         setStats(resp.data)
       }catch(err){
         // ignore
       }
-    })()
+    }
+    api.loadToken()
+    load()
+    // refresh once per burst of live events (e.g. a batch approval)
+    let timer = null
+    const refresh = () => {
+      clearTimeout(timer)
+      timer = setTimeout(load, 500)
+    }
+    const close = api.subscribe?.({
+      'request.created': refresh,
+      'request.approved': refresh,
+      'request.rejected': refresh,
+      'inventory.changed': refresh,
+    })
+    return () => { clearTimeout(timer); close?.() }
   },[])
 
   if(!stats) return <div>Loading...</div>
@@ -3,9 +3,14 @@ import api from '../services/api'
 import { useToast } from '../components/ToastContext'
 import Modal from '../components/Modal'
 
+// most ids the batch endpoints take per call
+const BATCH_SIZE = 1000
+
 export default function AdminDonations(){
   const [donations, setDonations] = useState([])
+  const [next, setNext] = useState(null)
   const [loading, setLoading] = useState(true)
+  const [moreLoading, setMoreLoading] = useState(false)
   const [actionLoading, setActionLoading] = useState({})
   const [errors, setErrors] = useState({})
 
@@ -20,14 +25,26 @@ export default function AdminDonations(){
     api.loadToken()
     ;(async ()=>{
       try{
-        const resp = await api.get('donations/')
-        setDonations(resp.data)
+        const page = await api.listPage('donations/')
+        setDonations(page.results)
+        setNext(page.next)
       }catch(err){
         // ignore
       }finally{ setLoading(false) }
     })()
   },[])
 
+  const loadMore = async () => {
+    setMoreLoading(true)
+    try{
+      const page = await api.listPage(next)
+      setDonations(prev => [...prev, ...page.results])
+      setNext(page.next)
+    }catch(err){
+      toast.error('Could not load more donations')
+    }finally{ setMoreLoading(false) }
+  }
+
   const openApproveModal = (d) => {
     setModalDonation(d)
     setBankInput(d.blood_bank ? String(d.blood_bank) : '')
@@ -67,11 +84,39 @@ export default function AdminDonations(){
     }
   }
 
+  // donations without a bank still go through the modal to pick one
+  const hasBatch = next !== null || donations.some(d => !d.approved && d.blood_bank)
+  const [batchLoading, setBatchLoading] = useState(false)
+
+  const approveAll = async () => {
+    setBatchLoading(true)
+    try{
+      // every pending donation, not just the pages loaded so far
+      const pending = await api.listAll('donations/', { status: 'pending', fields: 'id,blood_bank', page_size: 200 })
+      const ids = pending.filter(d => d.blood_bank).map(d => d.id)
+      const approved = new Set()
+      for(let i = 0; i < ids.length; i += BATCH_SIZE){
+        const resp = await api.post('donations/approve-batch/', { ids: ids.slice(i, i + BATCH_SIZE) })
+        resp.data.results.filter(r => r.result !== 'not_found').forEach(r => approved.add(r.id))
+      }
+      setDonations(prev => prev.map(x => approved.has(x.id) ? {...x, approved: true} : x))
+      toast.success(`Approved ${approved.size} donation(s)`)
+    }catch(err){
+      const msg = err.response?.data?.detail || JSON.stringify(err.response?.data || err.message)
+      toast.error(`Approve failed: ${String(msg)}`)
+    }finally{
+      setBatchLoading(false)
+    }
+  }
+
   if(loading) return <div>Loading donations...</div>
 
   return (
     <div>
-      <h3>Donations</h3>
+      <div className="d-flex justify-content-between align-items-center">
+        <h3>Donations</h3>
+        {hasBatch && <button className="btn btn-sm btn-success" onClick={approveAll} disabled={batchLoading}>{batchLoading ? 'Processing...' : 'Approve all with a bank'}</button>}
+      </div>
       {donations.length===0 && <div className="alert alert-info">No donations</div>}
       <ul className="list-group">
         {donations.map(d=> (
@@ -88,6 +133,7 @@ export default function AdminDonations(){
           </li>
         ))}
       </ul>
+      {next && <button className="btn btn-outline-secondary mt-3" onClick={loadMore} disabled={moreLoading}>{moreLoading ? 'Loading...' : 'Load more'}</button>}
 
       {/* Modal (Bootstrap markup) */}
       <Modal isOpen={modalOpen} title="Approve Donation" onClose={closeModal} onConfirm={confirmApprove} confirmDisabled={actionLoading[modalDonation?.id]} confirmText="Confirm Approve">
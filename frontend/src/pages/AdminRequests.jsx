@@ -3,9 +3,14 @@ import api from '../services/api'
 import { useToast } from '../components/ToastContext'
 import Modal from '../components/Modal'
 
+// most ids the batch endpoint takes per call
+const BATCH_SIZE = 1000
+
 export default function AdminRequests(){
   const [requests, setRequests] = useState([])
+  const [next, setNext] = useState(null)
   const [loading, setLoading] = useState(true)
+  const [moreLoading, setMoreLoading] = useState(false)
   const [actionLoading, setActionLoading] = useState({})
   const [errors, setErrors] = useState({})
 
@@ -16,16 +21,37 @@ export default function AdminRequests(){
 
   const toast = useToast()
 
+  const load = async () => {
+    try{
+      const page = await api.listPage('blood-requests/')
+      setRequests(page.results)
+      setNext(page.next)
+    }catch(err){
+      // ignore
+    }finally{ setLoading(false) }
+  }
+
+  const loadMore = async () => {
+    setMoreLoading(true)
+    try{
+      const page = await api.listPage(next)
+      setRequests(prev => [...prev, ...page.results])
+      setNext(page.next)
+    }catch(err){
+      toast.error('Could not load more requests')
+    }finally{ setMoreLoading(false) }
+  }
+
   useEffect(()=>{
     api.loadToken()
-    ;(async ()=>{
-      try{
-        const resp = await api.get('blood-requests/')
-        setRequests(resp.data)
-      }catch(err){
-        // ignore
-      }finally{ setLoading(false) }
-    })()
+    load()
+    // pick up requests created or decided elsewhere without polling
+    const setStatus = e => setRequests(prev => prev.map(r => r.id === e.id ? {...r, status: e.status} : r))
+    return api.subscribe?.({
+      'request.created': load,
+      'request.approved': setStatus,
+      'request.rejected': setStatus,
+    })
   },[])
   const openModal = (req, verb) => {
     setModalRequest(req)
@@ -59,11 +85,41 @@ export default function AdminRequests(){
     }
   }
 
+  const hasPending = next !== null || requests.some(r => r.status === 'pending')
+  const [batchLoading, setBatchLoading] = useState(false)
+
+  const approveAll = async () => {
+    setBatchLoading(true)
+    try{
+      // every pending request, not just the pages loaded so far
+      const pending = await api.listAll('blood-requests/', { status: 'pending', fields: 'id', page_size: 200 })
+      const ids = pending.map(r => r.id)
+      const results = {}
+      for(let i = 0; i < ids.length; i += BATCH_SIZE){
+        const resp = await api.post('blood-requests/approve-batch/', { ids: ids.slice(i, i + BATCH_SIZE) })
+        resp.data.results.forEach(r => { results[r.id] = r.result })
+      }
+      setRequests(prev => prev.map(r => results[r.id] === 'approved' ? {...r, status: 'approved'} : r))
+      setErrors(prev => ({...prev, ...Object.fromEntries(
+        Object.entries(results).filter(([, result]) => result !== 'approved').map(([id, result]) => [id, result.replace(/_/g, ' ')])
+      )}))
+      toast.success(`Approved ${Object.values(results).filter(result => result === 'approved').length} request(s)`)
+    }catch(err){
+      const msg = err.response?.data?.detail || JSON.stringify(err.response?.data || err.message)
+      toast.error(`Action failed: ${String(msg)}`)
+    }finally{
+      setBatchLoading(false)
+    }
+  }
+
   if(loading) return <div>Loading requests...</div>
 
   return (
     <div>
-      <h3>Blood Requests</h3>
+      <div className="d-flex justify-content-between align-items-center">
+        <h3>Blood Requests</h3>
+        {hasPending && <button className="btn btn-sm btn-success" onClick={approveAll} disabled={batchLoading}>{batchLoading ? 'Approving...' : 'Approve all pending'}</button>}
+      </div>
       {requests.length===0 && <div className="alert alert-info">No requests</div>}
       <ul className="list-group">
         {requests.map(r=> (
@@ -85,6 +141,7 @@ export default function AdminRequests(){
           </li>
         ))}
       </ul>
+      {next && <button className="btn btn-outline-secondary mt-3" onClick={loadMore} disabled={moreLoading}>{moreLoading ? 'Loading...' : 'Load more'}</button>}
 
     <Modal isOpen={modalOpen} title={modalVerb === 'approve' ? 'Approve Request' : 'Reject Request'} onClose={closeModal} onConfirm={action} confirmText={modalVerb === 'approve' ? 'Approve' : 'Reject'} confirmDisabled={actionLoading[modalRequest?.id]}>
       <p>Request: <strong>{modalRequest?.blood_group}</strong> x{modalRequest?.units} — {modalRequest?.requester?.username || 'Unknown'}</p>
@@ -10,14 +10,16 @@ export default function BloodBanks() {
   const { addToast } = useToast()
 
   useEffect(() => {
-    fetchBanks()
-  }, [])
+    // searched on the server (?q= is typo-tolerant); wait for typing to pause
+    const timer = setTimeout(() => fetchBanks(searchCity.trim()), 250)
+    return () => clearTimeout(timer)
+  }, [searchCity])
 
-  const fetchBanks = async () => {
+  const fetchBanks = async (query) => {
     try {
       setLoading(true)
-      const response = await api.get('blood-banks/')
-      setBanks(response.data)
+      // sorted and filtered below, so every page is needed
+      setBanks(await api.listAll('blood-banks/', { page_size: 200, ...(query ? { q: query } : {}) }))
     } catch (err) {
       addToast('Failed to fetch blood banks', 'error')
       console.error(err)
@@ -28,13 +30,10 @@ export default function BloodBanks() {
 
   // Filter and sort banks
   let filteredBanks = banks
-  if (searchCity) {
-    filteredBanks = filteredBanks.filter(b => 
-      b.city.toLowerCase().includes(searchCity.toLowerCase())
-    )
-  }
 
-  if (sortBy === 'name') {
+  if (searchCity) {
+    // keep the server's relevance order while searching
+  } else if (sortBy === 'name') {
     filteredBanks.sort((a, b) => a.name.localeCompare(b.name))
   } else if (sortBy === 'city') {
     filteredBanks.sort((a, b) => a.city.localeCompare(b.city))
@@ -53,7 +52,7 @@ export default function BloodBanks() {
     return 'badge bg-success'
   }
 
-  if (loading) {
+  if (loading && banks.length === 0 && !searchCity) {
     return (
       <div className="alert alert-info mt-4" role="alert">
         Loading blood banks...
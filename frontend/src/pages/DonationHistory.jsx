@@ -15,8 +15,8 @@ export default function DonationHistory() {
   const fetchDonations = async () => {
     try {
       setLoading(true)
-      const response = await api.get('donations/')
-      setDonations(response.data)
+      // the totals above the table count every row, so load all pages
+      setDonations(await api.listAll('donations/', { page_size: 200 }))
     } catch (err) {
       addToast('Failed to fetch donation history', 'error')
       console.error(err)
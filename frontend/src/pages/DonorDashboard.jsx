@@ -4,17 +4,17 @@ import api from '../services/api'
 export default function DonorDashboard(){
   const [profile, setProfile] = useState(null)
   const [donations, setDonations] = useState([])
+  const [eligibility, setEligibility] = useState(null)
 
   useEffect(()=>{
     api.loadToken()
     ;(async ()=>{
       try{
-        const me = await api.get('users/me/')
-        // try load donor profile
-        const resp = await api.get('donor-profiles/')
-        setProfile(resp.data[0] || null)
-        const d = await api.get('donations/')
-        setDonations(d.data)
+        // user, own profile and recent donations in one request
+        const resp = await api.get('me/summary/')
+        setProfile(resp.data.profile)
+        setEligibility(resp.data.eligibility)
+        setDonations(resp.data.donations.results)
       }catch(err){
         // ignore
       }
@@ -29,7 +29,7 @@ export default function DonorDashboard(){
       if(filterGroup) q.push(`blood_group=${encodeURIComponent(filterGroup)}`)
       const url = '/api/donor-profiles/' + (q.length? `?${q.join('&')}` : '')
       const resp = await api.get(url)
-      setProfile(resp.data[0] || null)
+      setProfile((resp.data.results ?? resp.data)[0] || null)
     }catch(err){
       // ignore
     }
@@ -60,6 +60,9 @@ export default function DonorDashboard(){
           <h4>Profile</h4>
           <p>Blood group: {profile.blood_group}</p>
           <p>City: {profile.city}</p>
+          {eligibility && (
+            <p>{eligibility.eligible ? 'Eligible to donate' : `Next eligible on ${eligibility.next_eligible_on || '-'}`}</p>
+          )}
         </div>
       ) : <div className="alert alert-warning">No profile found</div>}
 
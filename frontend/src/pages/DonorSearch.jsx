@@ -4,6 +4,7 @@ import { useToast } from '../components/ToastContext'
 
 export default function DonorSearch() {
   const [donors, setDonors] = useState([])
+  const [next, setNext] = useState(null)
   const [loading, setLoading] = useState(true)
   const [filterBloodGroup, setFilterBloodGroup] = useState('')
   const [filterCity, setFilterCity] = useState('')
@@ -13,14 +14,27 @@ export default function DonorSearch() {
   const bloodGroups = ['A+', 'A-', 'B+', 'B-', 'O+', 'O-', 'AB+', 'AB-']
 
   useEffect(() => {
-    fetchDonors()
-  }, [])
+    // filtered and searched on the server (?q= is typo-tolerant); wait for typing to pause
+    const timer = setTimeout(() => fetchDonors(), 250)
+    return () => clearTimeout(timer)
+  }, [filterCity, filterBloodGroup, filterAvailable])
 
-  const fetchDonors = async () => {
+  const filterParams = () => {
+    const params = {}
+    const query = filterCity.trim()
+    if (query) params.q = query
+    if (filterBloodGroup) params.blood_group = filterBloodGroup
+    if (filterAvailable !== 'all') params.available = filterAvailable === 'available' ? 'true' : 'false'
+    return params
+  }
+
+  // with a `next` link, appends the following page to the list
+  const fetchDonors = async (url) => {
     try {
       setLoading(true)
-      const response = await api.get('donor-profiles/')
-      setDonors(response.data)
+      const page = url ? await api.listPage(url) : await api.listPage('donor-profiles/', filterParams())
+      setDonors(prev => url ? [...prev, ...page.results] : page.results)
+      setNext(page.next)
     } catch (err) {
       addToast('Failed to fetch donors', 'error')
       console.error(err)
@@ -29,26 +43,7 @@ export default function DonorSearch() {
     }
   }
 
-  // Apply filters
-  let filteredDonors = donors
-
-  if (filterBloodGroup) {
-    filteredDonors = filteredDonors.filter(d => d.blood_group === filterBloodGroup)
-  }
-
-  if (filterCity) {
-    filteredDonors = filteredDonors.filter(d =>
-      d.city.toLowerCase().includes(filterCity.toLowerCase())
-    )
-  }
-
-  if (filterAvailable === 'available') {
-    filteredDonors = filteredDonors.filter(d => d.available === true)
-  } else if (filterAvailable === 'unavailable') {
-    filteredDonors = filteredDonors.filter(d => d.available === false)
-  }
-
-  if (loading) {
+  if (loading && donors.length === 0 && !filterCity) {
     return (
       <div className="alert alert-info mt-4" role="alert">
         Loading donors...
@@ -118,11 +113,11 @@ export default function DonorSearch() {
 
       {/* Results Summary */}
       <div className="alert alert-info mb-3">
-        Found <strong>{filteredDonors.length}</strong> donor(s)
+        Found <strong>{donors.length}{next ? '+' : ''}</strong> donor(s)
       </div>
 
       {/* Donors List */}
-      {filteredDonors.length === 0 ? (
+      {donors.length === 0 ? (
         <div className="alert alert-warning" role="alert">
           No donors found matching your criteria.
         </div>
@@ -140,7 +135,7 @@ export default function DonorSearch() {
               </tr>
             </thead>
             <tbody>
-              {filteredDonors.map((donor) => (
+              {donors.map((donor) => (
                 <tr key={donor.id}>
                   <td>
                     <strong>{donor.user_username}</strong>
@@ -164,6 +159,11 @@ export default function DonorSearch() {
               ))}
             </tbody>
           </table>
+          {next && (
+            <button className="btn btn-outline-secondary" onClick={() => fetchDonors(next)} disabled={loading}>
+              {loading ? 'Loading...' : 'Load more'}
+            </button>
+          )}
         </div>
       )}
     </div>
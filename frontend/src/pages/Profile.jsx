@@ -16,8 +16,8 @@ export default function Profile(){
     api.loadToken()
     ;(async ()=>{
       try{
-        const resp = await api.get('donor-profiles/')
-        const p = resp.data[0]
+        const resp = await api.get('me/summary/')
+        const p = resp.data.profile
         if(p){
           setProfile(p)
           setForm({phone: p.phone || '', blood_group: p.blood_group || 'O+', city: p.city || '', available: p.available})
@@ -94,7 +94,7 @@ export default function Profile(){
       )}
       {(!preview && profile && profile.photo_url) && (
         <div className="mb-3">
-          <img src={profile.photo_url} alt="profile" style={{maxWidth:150, borderRadius:8}} />
+          <img src={profile.photo_thumb_url || profile.photo_url} alt="profile" style={{maxWidth:150, borderRadius:8}} />
         </div>
       )}
 
@@ -15,8 +15,8 @@ export default function RequestHistory() {
   const fetchRequests = async () => {
     try {
       setLoading(true)
-      const response = await api.get('blood-requests/')
-      setRequests(response.data)
+      // the totals above the table count every row, so load all pages
+      setRequests(await api.listAll('blood-requests/', { page_size: 200 }))
     } catch (err) {
       addToast('Failed to fetch request history', 'error')
       console.error(err)
@@ -27,6 +27,70 @@ api.loadToken = () => {
   if (token) api.defaults.headers.common['Authorization'] = `Bearer ${token}`
 }
 
+// List endpoints are keyset-paginated ({next, results}). listPage fetches one
+// page (pass the previous page's `next` as url to continue); listAll follows
+// `next` to the end, for screens that need every row.
+api.listPage = async (url, params) => {
+  const resp = await api.get(url, { params })
+  return { results: resp.data.results ?? resp.data, next: resp.data.next ?? null }
+}
+
+api.listAll = async (url, params) => {
+  let page = await api.listPage(url, params)
+  const rows = [...page.results]
+  while (page.next) {
+    // `next` already carries the query string
+    page = await api.listPage(page.next)
+    rows.push(...page.results)
+  }
+  return rows
+}
+
+// Live events from /api/events/ (server-sent events). EventSource cannot send
+// headers, so each connection opens with a single-use ticket fetched with the
+// access token (refreshed by the interceptor below when it has expired). A
+// spent ticket cannot reconnect, so on any error the stream is reopened with
+// a new one. Returns a function that closes the stream.
+const EVENTS_RETRY_MS = 3000
+
+api.subscribe = (handlers) => {
+  if (typeof EventSource === 'undefined' || !localStorage.getItem('bm_access_token')) return () => {}
+  let source = null
+  let timer = null
+  let closed = false
+
+  const reopen = () => {
+    // stop once logged out
+    if (!closed && localStorage.getItem('bm_access_token')) timer = setTimeout(open, EVENTS_RETRY_MS)
+  }
+
+  const open = async () => {
+    let ticket
+    try {
+      ticket = (await api.post('events/ticket/')).data.ticket
+    } catch (err) {
+      reopen()
+      return
+    }
+    if (closed) return
+    source = new EventSource(`/api/events/?ticket=${encodeURIComponent(ticket)}`)
+    Object.entries(handlers).forEach(([type, handler]) => {
+      source.addEventListener(type, e => handler(JSON.parse(e.data)))
+    })
+    source.onerror = () => {
+      source.close()
+      reopen()
+    }
+  }
+
+  open()
+  return () => {
+    closed = true
+    clearTimeout(timer)
+    if (source) source.close()
+  }
+}
+
 // Axios response interceptor to refresh token when access expires
 api.interceptors.response.use(
   resp => resp,